@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# bench_extract.py
+# Usage: python3 bench_extract.py [-n 1000000]
+#
+# Blocks/sec of textproto field extraction: the per-field regex searches the
+# proto tools used to run on every block, against the single-pass
+# textproto.extract_fields, and the same for splitting plus extraction
+# (regex split of the whole text vs. textproto.iter_records).
+import argparse
+import os
+import re
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "proto"))
+
+from textproto import extract_fields, iter_blocks, iter_records  # noqa: E402
+from synth import write_textproto  # noqa: E402
+
+BLOCK_RE = re.compile(r'(?=^\s*(entity|relationship)\s*:\s*\{)', re.MULTILINE)
+ID_RE = re.compile(r'^\s*id\s*:\s*"([^"]+)"\s*$', re.MULTILINE)
+NAME_RE = re.compile(r'^\s*name\s*:\s*"([^"]+)"\s*$', re.MULTILINE)
+EK_RE = re.compile(r'^\s*ek_([a-z0-9_]+)\s*:\s*\{', re.MULTILINE)
+KIND_RE = re.compile(r'^\s*kind\s*:\s*(RK_\w+)\s*$', re.MULTILINE)
+A_RE = re.compile(r'^\s*a\s*:\s*"([^"]+)"\s*$', re.MULTILINE)
+Z_RE = re.compile(r'^\s*z\s*:\s*"([^"]+)"\s*$', re.MULTILINE)
+
+
+def group(m):
+    return m.group(1) if m else None
+
+
+def legacy_extract(block):
+    """The searches proto2tree.py ran on every block, one per field, and
+    their values, as extract_fields gives them."""
+    if block.startswith("entity"):
+        return group(ID_RE.search(block)), group(NAME_RE.search(block)), group(EK_RE.search(block))
+    return group(KIND_RE.search(block)), group(A_RE.search(block)), group(Z_RE.search(block))
+
+
+def legacy_split_extract(path):
+    with open(path, encoding="utf-8") as f:
+        text = f.read()
+    starts = [m.start() for m in BLOCK_RE.finditer(text)]
+    starts.append(len(text))
+    for i in range(len(starts) - 1):
+        legacy_extract(text[starts[i]:starts[i + 1]].strip())
+    return len(starts) - 1
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    count = func(*args)
+    return count, time.perf_counter() - start
+
+
+def extract_all(blocks, extract):
+    for b in blocks:
+        extract(b)
+    return len(blocks)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark textproto field extraction.")
+    p.add_argument("-n", "--blocks", type=int, default=1000000, help="Number of synthetic blocks")
+    args = p.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_textproto(os.path.join(tmp, "bench.txtpb"), args.blocks)
+        blocks = [b.text for b in iter_blocks(path)]
+
+        runs = [
+            ("extract: regex per field", extract_all, blocks, legacy_extract),
+            ("extract: single pass", extract_all, blocks, extract_fields),
+            ("split+extract: regex", legacy_split_extract, path),
+            ("split+extract: records", lambda p: sum(1 for _ in iter_records(p)), path),
+        ]
+        for label, func, *func_args in runs:
+            count, elapsed = timed(func, *func_args)
+            print(f"{label:26s} {count / elapsed:12,.0f} blocks/sec ({elapsed:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+# bench_hops.py
+# Usage: python3 bench_hops.py [-e 5000000] [--hops 2,4,8,16] [-n 1000000]
+#
+# k-hop neighborhood extraction as proto_filter.py --seed/--hops does it:
+# building the CSR adjacency and walking it over a synthetic graph of
+# -e edges, against a dict-of-sets graph built from the same edges. With
+# -n, also times the end-to-end selection from a synthetic textproto of
+# that many blocks, by scan and by index.
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from array import array
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "proto"))
+
+from proto_filter import adjacency, neighborhood_from_index, neighborhood_from_scan, within_hops  # noqa: E402
+from proto_index import build_index, load_index  # noqa: E402
+from synth import write_textproto  # noqa: E402
+
+
+def synthetic_edges(n_edges, fanout=8, seed=0):
+    """
+    The shape synth.py writes: a tree with the given fanout, and every
+    fourth edge between random nodes instead.
+    """
+    rnd = random.Random(seed)
+    a = array("i")
+    z = array("i")
+    for i in range(1, n_edges + 1):
+        child = i % n_edges
+        parent = (child - 1) // fanout if child else 0
+        if i % 4 == 0:
+            parent = rnd.randrange(n_edges)
+        a.append(parent)
+        z.append(child)
+    return a, z
+
+
+def dict_hops(graph, seeds, hops):
+    seen = set(seeds)
+    frontier = set(seeds)
+    for _ in range(hops):
+        frontier = {w for v in frontier for w in graph.get(v, ())} - seen
+        seen |= frontier
+    return seen
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark k-hop neighborhood extraction.")
+    p.add_argument("-e", "--edges", type=int, default=5000000, help="Number of synthetic edges")
+    p.add_argument("--hops", default="2,4,8,16", help="Comma-separated hop counts")
+    p.add_argument("-n", "--blocks", type=int, default=0, help="Also run end to end on a textproto of N blocks")
+    args = p.parse_args()
+    hop_counts = [int(h) for h in args.hops.split(",")]
+
+    a, z = synthetic_edges(args.edges)
+    seeds = [args.edges // 3]
+    print(f"{args.edges:,} edges")
+
+    (off, nbr), elapsed = timed(adjacency, args.edges, a, z)
+    size = off.itemsize * len(off) + nbr.itemsize * len(nbr)
+    print(f"{'build: CSR':24s} {elapsed:8.3f}s ({size / 1e6:,.0f} MB)")
+
+    def build_dict():
+        graph = {}
+        for u, v in zip(a, z):
+            graph.setdefault(u, set()).add(v)
+            graph.setdefault(v, set()).add(u)
+        return graph
+
+    graph, elapsed = timed(build_dict)
+    print(f"{'build: dict of sets':24s} {elapsed:8.3f}s")
+
+    for hops in hop_counts:
+        seen, csr_elapsed = timed(within_hops, off, nbr, seeds, hops)
+        reached, dict_elapsed = timed(dict_hops, graph, seeds, hops)
+        if sum(seen) != len(reached):
+            sys.exit(f"Error: CSR and dict walks differ at {hops} hops")
+        print(f"hops={hops:<2d} {len(reached):10,d} nodes   CSR {csr_elapsed:8.3f}s   dict {dict_elapsed:8.3f}s")
+    del graph
+
+    if not args.blocks:
+        return
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_textproto(os.path.join(tmp, "bench.txtpb"), args.blocks)
+        seed_ids = {f"e{args.blocks // 6}"}
+        kinds = {"RK_CONTAINS", "RK_CONTROLS", "RK_SUPPORTS", "RK_AGGREGATES"}
+        print(f"{args.blocks:,} blocks, {os.path.getsize(path) / 1e6:,.1f} MB")
+        for hops in hop_counts:
+            scanned, elapsed = timed(neighborhood_from_scan, path, kinds, seed_ids, hops)
+            print(f"hops={hops:<2d} scan  {elapsed:8.3f}s ({len(scanned[0]):,} entities)")
+        build_index(path)
+        idx = load_index(path)
+        for hops in hop_counts:
+            indexed, elapsed = timed(neighborhood_from_index, idx, kinds, seed_ids, hops)
+            print(f"hops={hops:<2d} index {elapsed:8.3f}s ({len(indexed[0]):,} entities)")
+        if indexed != scanned:
+            sys.exit("Error: indexed selection differs from the scan")
+
+
+if __name__ == "__main__":
+    main()
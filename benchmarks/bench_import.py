@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+# bench_import.py
+# Usage: python3 bench_import.py [-r 5] [--top 8] [--only genie,lazy,top]
+#
+# Startup cost of getting a parser ready, as a short job pays it: each
+# case runs in a fresh interpreter under -X importtime, -r times, and the
+# run with the least import time is kept. Prints the import time and wall
+# time of each case, then its breakdown by top-level package (the self
+# time of all their modules) and its slowest imports (cumulative).
+#
+#   genie  the former way: import genie.abstract (extraparsers/__init__.py
+#          did), genie's add_parser and Top, and register Top, as every
+#          common_setup did
+#   lazy   import extraparsers.registry, as scripts do now
+#   top    the same, then look 'top -n 1 -b' up, which imports top.py
+#          and the genie.abstract it declares the package to
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+CASES = {
+    "genie": "from genie import abstract\n"
+             "from genie.libs.parser.utils.entry_points import add_parser\n"
+             "from extraparsers.top import Top\n"
+             "add_parser(Top, 'linux')",
+    "lazy": "from extraparsers.registry import parse",
+    "top": "from extraparsers.registry import find_parser\n"
+           "find_parser('top -n 1 -b')",
+}
+
+# import time:  self [us] | cumulative | imported package
+IMPORT_RE = re.compile(r"^import time:\s+(?P<self>\d+) \|\s+(?P<cumulative>\d+) \| (?P<indent>\s*)(?P<module>\S+)$")
+
+
+def run_case(code):
+    """(imports, wall seconds) of one run of code, imports as (module,
+    depth, self us, cumulative us), in the order -X importtime prints them"""
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT, os.environ.get("PYTHONPATH")])))
+    start = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], env=env, cwd=ROOT,
+                          capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    imports = []
+    errors = []
+    for line in proc.stderr.splitlines():
+        m = IMPORT_RE.match(line)
+        if m:
+            imports.append((m.group("module"), len(m.group("indent")) // 2,
+                            int(m.group("self")), int(m.group("cumulative"))))
+        elif not line.startswith("import time:"):
+            errors.append(line)
+    if proc.returncode:
+        raise RuntimeError(errors[-1] if errors else f"exit status {proc.returncode}")
+    return imports, elapsed
+
+
+def report(name, imports, elapsed, top):
+    total = sum(cumulative for _, depth, _, cumulative in imports if depth == 0)
+    print(f"{name:6s} {total / 1e3:9.1f} ms import {elapsed * 1e3:9.1f} ms wall  {len(imports)} modules")
+    packages = {}
+    for module, _, own, _ in imports:
+        package = module.partition(".")[0]
+        packages[package] = packages.get(package, 0) + own
+    for package, own in sorted(packages.items(), key=lambda p: -p[1])[:top]:
+        print(f"         {own / 1e3:9.1f} ms  {package}")
+    print("       slowest imports, cumulative:")
+    for module, _, _, cumulative in sorted(imports, key=lambda i: -i[3])[:top]:
+        print(f"         {cumulative / 1e3:9.1f} ms  {module}")
+
+
+def main():
+    p = argparse.ArgumentParser(description="Measure the import time of getting a parser ready.")
+    p.add_argument("-r", "--repeat", type=int, default=5, help="Runs per case; the fastest is kept")
+    p.add_argument("--top", type=int, default=8, help="Packages and imports listed per case")
+    p.add_argument("--only", help="Comma-separated cases to run (default: all)")
+    args = p.parse_args()
+
+    totals = {}
+    for name in args.only.split(",") if args.only else CASES:
+        if name not in CASES:
+            sys.exit(f"Error: unknown case {name}, not one of {', '.join(CASES)}")
+        best = None
+        try:
+            for _ in range(args.repeat):
+                imports, elapsed = run_case(CASES[name])
+                total = sum(cumulative for _, depth, _, cumulative in imports if depth == 0)
+                if best is None or total < best[0]:
+                    best = (total, imports, elapsed)
+        except RuntimeError as e:
+            print(f"{name:6s} failed: {e}")
+            continue
+        totals[name] = best[0]
+        report(name, best[1], best[2], args.top)
+    if "genie" in totals:
+        for name, total in totals.items():
+            if name != "genie":
+                print(f"{name} imports in {total / totals['genie']:.0%} of the time of genie")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+# bench_index.py
+# Usage: python3 bench_index.py [-n 1000000]
+#
+# Repeat-query cost of proto_filter.py selection with and without the
+# sidecar index: a full scan per query, the one-off index build, and a
+# query answered from the index.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "proto"))
+
+from proto_filter import select_from_index, select_from_scan  # noqa: E402
+from proto_index import build_index, load_index  # noqa: E402
+from synth import write_textproto  # noqa: E402
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def query_index(path, kinds):
+    return select_from_index(load_index(path), kinds)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark indexed relationship queries.")
+    p.add_argument("-n", "--blocks", type=int, default=1000000, help="Number of synthetic blocks")
+    p.add_argument("-r", "--relationships", default="RK_CONTAINS", help="Comma-separated kinds to query")
+    args = p.parse_args()
+    kinds = {r.strip() for r in args.relationships.split(",")}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_textproto(os.path.join(tmp, "bench.txtpb"), args.blocks)
+        print(f"{args.blocks:,} blocks, {os.path.getsize(path) / 1e6:,.1f} MB")
+
+        scanned, elapsed = timed(select_from_scan, path, kinds)
+        print(f"{'query: full scan':20s} {elapsed:8.3f}s")
+        _, elapsed = timed(build_index, path)
+        print(f"{'index build':20s} {elapsed:8.3f}s ({os.path.getsize(path + '.idx') / 1e6:,.1f} MB)")
+        indexed, elapsed = timed(query_index, path, kinds)
+        print(f"{'query: index':20s} {elapsed:8.3f}s")
+        if indexed != scanned:
+            sys.exit("Error: indexed selection differs from the full scan")
+
+
+if __name__ == "__main__":
+    main()
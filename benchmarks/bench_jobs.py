@@ -0,0 +1,42 @@
+#!/usr/bin/env python3
+# bench_jobs.py
+# Usage: python3 bench_jobs.py [-n 1000000] [--jobs 1,2,4,8]
+#
+# Scaling of sharded textproto parsing: proto2tree.py's scan with 1, 2, 4
+# and 8 worker processes, checked against the serial result.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "proto"))
+
+from proto2tree import load_from_scan  # noqa: E402
+from synth import write_textproto  # noqa: E402
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark sharded textproto parsing.")
+    p.add_argument("-n", "--blocks", type=int, default=1000000, help="Number of synthetic blocks")
+    p.add_argument("--jobs", default="1,2,4,8", help="Comma-separated worker counts")
+    args = p.parse_args()
+
+    print(f"{os.cpu_count()} CPUs")
+    with tempfile.TemporaryDirectory() as tmp:
+        path = write_textproto(os.path.join(tmp, "bench.txtpb"), args.blocks)
+        serial = None
+        base = None
+        for jobs in (int(j) for j in args.jobs.split(",")):
+            start = time.perf_counter()
+            result = load_from_scan(path, jobs)
+            elapsed = time.perf_counter() - start
+            if serial is None:
+                serial, base = result, elapsed
+            elif result != serial:
+                sys.exit(f"Error: result with {jobs} jobs differs from the first run")
+            print(f"jobs={jobs:<3d} {args.blocks / elapsed:12,.0f} blocks/sec ({elapsed:.2f}s, x{base / elapsed:.2f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+# bench_proc_stat.py
+# Usage: python3 bench_proc_stat.py [-r 10] [-i 1]
+#
+# Cost of a process table from 'top -n 1 -b' against the bulk /proc read
+# of ProcStat, on this machine: the wall and CPU time of running each
+# command, the bytes it outputs, and the time to parse that output. The
+# wall time of ProcStat includes its sleep of -i seconds between samples.
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from extraparsers.proc_stat import ProcStat  # noqa: E402
+from extraparsers.top import Top  # noqa: E402
+
+
+def run(command):
+    """Output, wall time and CPU time (user + system) of a shell command"""
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    out = subprocess.run(command, shell=True, capture_output=True, text=True).stdout
+    elapsed = time.perf_counter() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return out, elapsed, (after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime)
+
+
+def main():
+    p = argparse.ArgumentParser(description="Compare top -b with a bulk /proc read.")
+    p.add_argument("-r", "--repeat", type=int, default=10, help="Runs per command; the best is reported")
+    p.add_argument("-i", "--interval", type=float, default=1, help="Seconds between the samples of ProcStat")
+    args = p.parse_args()
+
+    for name, parser in (("top", Top()), ("/proc", ProcStat())):
+        command = parser.cli_command[0].format(interval=args.interval)
+        runs = [run(command) for _ in range(args.repeat)]
+        out = runs[-1][0]
+        wall = min(r[1] for r in runs)
+        cpu = min(r[2] for r in runs)
+
+        best = float("inf")
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            procs = parser.cli(output=out).get("pid", {})
+            best = min(best, time.perf_counter() - start)
+        print(f"{name:6s} device: {wall * 1e3:7.1f} ms wall {cpu * 1e3:7.1f} ms CPU {len(out):9,d} bytes"
+              f"   parser: {best * 1e3:7.2f} ms for {len(procs)} processes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# bench_top.py
+# Usage: python3 bench_top.py [-n 20000] [-r 20]
+#
+# Rows/sec of the 'top -n 1 -b' parser on synthetic output: the dict the
+# row regex gives against the columnar result (TopColumns), with the
+# memory each result holds on to, and the time to total resident memory
+# by user from either result. Both are checked to give the same result.
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from extraparsers.top import TopColumns, parse_rows, table_columns  # noqa: E402
+from synth import synthetic_top  # noqa: E402
+
+
+def best_time(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def retained(func):
+    """Bytes still allocated by the result of func()"""
+    tracemalloc.start()
+    result = func()  # noqa: F841
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size
+
+
+def res_by_user(procs):
+    totals = {}
+    for proc in procs.values():
+        totals[proc["user"]] = totals.get(proc["user"], 0) + proc["res"]
+    return totals
+
+
+def res_by_user_columns(cols):
+    totals = [0] * len(cols.users)
+    for user, res in zip(cols.user, cols.res):
+        totals[user] += res
+    return dict(zip(cols.users, totals))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark the top -b parser.")
+    p.add_argument("-n", "--procs", type=int, default=20000, help="Number of process rows")
+    p.add_argument("-r", "--repeat", type=int, default=20, help="Runs per variant; the best is reported")
+    args = p.parse_args()
+
+    out = synthetic_top(args.procs)
+    procs = parse_rows(out)
+    if TopColumns(table_columns(out)).to_dict() != {"pid": procs}:
+        sys.exit("Error: columnar result differs from the dict")
+    del procs
+
+    variants = (
+        ("regex", lambda: parse_rows(out)),
+        ("columnar", lambda: TopColumns(table_columns(out))),
+    )
+    base = None
+    for name, func in variants:
+        elapsed = best_time(func, args.repeat)
+        base = base or elapsed
+        size = retained(func)
+        print(f"{name:10s} {args.procs / elapsed:12,.0f} rows/sec ({elapsed * 1e3:.1f} ms, x{base / elapsed:.2f})"
+              f" {size / 1e6:8.2f} MB")
+
+    procs = parse_rows(out)
+    cols = TopColumns(table_columns(out))
+    if res_by_user_columns(cols) != res_by_user(procs):
+        sys.exit("Error: totals by user differ")
+    dict_elapsed = best_time(lambda: res_by_user(procs), args.repeat)
+    cols_elapsed = best_time(lambda: res_by_user_columns(cols), args.repeat)
+    print(f"RES by user: dict {dict_elapsed * 1e3:.1f} ms, columnar {cols_elapsed * 1e3:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+# bench_top_checks.py
+# Usage: python3 bench_top_checks.py [--hosts 500] [-n 5000] [-r 3]
+#
+# Time to evaluate 50 top_checks rules over --hosts process tables of -n
+# processes each, columnar (as Top.cli(columnar=True) returns them), and
+# the time the same checks take written as a loop over every pid dict of
+# every host, as checks usually are. Both must agree on what fails.
+# evaluate() checks all hosts at once when numpy is importable, and host by
+# host with builtins otherwise.
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from extraparsers.top import TopColumns, table_columns  # noqa: E402
+from extraparsers.top_checks import compile_rules, evaluate  # noqa: E402
+from synth import COMMANDS, USERS, synthetic_top  # noqa: E402
+
+# Distinct tables; hosts share them round-robin
+TABLES = 10
+
+
+def bench_rules():
+    rules = [
+        "cpu <= 90", "cpu < 99.9", "mem < 50", "res < 16GiB", "virt < 64GiB", "shr <= 1GiB",
+        "count() == 0 where s == Z", "count() == 0 where s == D", "count() < 10000", "sum(cpu) < 400",
+        "sum(mem) < 95", "max(res) < 32GiB", "mean(cpu) < 20", "ni >= -20", "pr <= 40",
+    ]
+    for command in COMMANDS:
+        rules += [f"res < 8GiB where command == {command}", f"cpu < 95 where command == {command}",
+                  f"count() <= 2000 where command == {command}"]
+    for user in USERS:
+        rules += [f"sum(mem) < 60 where user == {user}", f"max(cpu) <= 99 where user == {user}"]
+    rules += [f"count() < 3000 where user == {user} and command == {command}"
+              for user, command in zip(USERS, COMMANDS)][:50 - len(rules)]
+    return compile_rules(rules[:50])
+
+
+def loop_checks(rules, tables):
+    """The same checks, pid dict by pid dict: the failing (rule, device)"""
+    failed = set()
+    for device, procs in tables.items():
+        for rule in rules:
+            selected = [p for p in procs.values()
+                        if all(p[field] == value for field, value in rule.where)]
+            if rule.stat is None:
+                ok = all(rule.compare(p[rule.metric], rule.value) for p in selected)
+            elif rule.stat == "count":
+                ok = rule.compare(len(selected), rule.value)
+            else:
+                values = [p[rule.metric] for p in selected]
+                if not values and rule.stat != "sum":
+                    continue
+                value = {"sum": sum, "max": max, "min": min,
+                         "mean": lambda v: sum(v) / len(v)}[rule.stat](values)
+                ok = rule.compare(value, rule.value)
+            if not ok:
+                failed.add((rule.name, device))
+    return failed
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark top_checks rule evaluation.")
+    p.add_argument("--hosts", type=int, default=500, help="Hosts to check")
+    p.add_argument("-n", "--procs", type=int, default=5000, help="Processes per host")
+    p.add_argument("-r", "--repeat", type=int, default=3, help="Runs; the best is kept")
+    p.add_argument("--loop-hosts", type=int, default=20, help="Hosts the per-pid loop is timed on")
+    args = p.parse_args()
+
+    rules = bench_rules()
+    columns = [TopColumns(table_columns(synthetic_top(args.procs, seed=k))) for k in range(TABLES)]
+    tables = {f"host{k}": columns[k % TABLES] for k in range(args.hosts)}
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        results = evaluate(rules, tables)
+        best = min(best, time.perf_counter() - start)
+    failed = sum(not r["passed"] for r in results)
+    print(f"{len(rules)} rules x {args.hosts} hosts x {args.procs} processes: {best:.3f}s"
+          f" ({len(results)} results, {failed} failed)")
+
+    # The per-pid loop, on fewer hosts, scaled up
+    dicts = {f"host{k}": columns[k % TABLES].to_dict()["pid"] for k in range(args.loop_hosts)}
+    start = time.perf_counter()
+    loop_failed = loop_checks(rules, dicts)
+    elapsed = (time.perf_counter() - start) * args.hosts / args.loop_hosts
+    print(f"per-pid loop, scaled to {args.hosts} hosts: {elapsed:.3f}s ({elapsed / best:.0f}x)")
+
+    subset = {(r["rule"], r["device"]) for r in evaluate(rules, {d: tables[d] for d in dicts}) if not r["passed"]}
+    if subset != loop_failed:
+        sys.exit(f"Mismatch: {sorted(subset ^ loop_failed)[:5]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+# bench_top_store.py
+# Usage: python3 bench_top_store.py [-n 2000] [-s 300]
+#
+# Memory and speed of TopStore against keeping every Top result: -s
+# samples of an -n process host, 5 seconds apart, go into both. Prints
+# the bytes each holds per process, the time to add a sample, and the
+# time of the top_cpu, percentile and growing queries over the last hour.
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from extraparsers.top import parse_rows  # noqa: E402
+from extraparsers.top_store import TopStore  # noqa: E402
+from synth import synthetic_top  # noqa: E402
+
+
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark TopStore against a list of Top results.")
+    p.add_argument("-n", "--procs", type=int, default=2000, help="Processes per sample")
+    p.add_argument("-s", "--samples", type=int, default=300, help="Samples, 5 seconds apart")
+    args = p.parse_args()
+
+    procs = parse_rows(synthetic_top(args.procs))
+    # Each sample is a new dict, as device.parse() returns it
+    samples = [{"pid": {pid: dict(proc) for pid, proc in procs.items()}} for _ in range(args.samples)]
+
+    tracemalloc.start()
+    kept = []
+    for sample in samples:
+        kept.append({"pid": {pid: dict(proc) for pid, proc in sample["pid"].items()}})
+    list_bytes = tracemalloc.get_traced_memory()[0]
+    del kept
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    store = TopStore()
+    for k, sample in enumerate(samples):
+        store.add("host", sample, 5.0 * k)
+    store_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    store = TopStore()
+    start = time.perf_counter()
+    for k, sample in enumerate(samples):
+        store.add("host", sample, 5.0 * k)
+    add_time = (time.perf_counter() - start) / args.samples
+
+    n = len(procs)
+    print(f"{n} processes, {args.samples} samples")
+    print(f"list of results {list_bytes / n:10,.0f} bytes/process")
+    print(f"TopStore        {store_bytes / n:10,.0f} bytes/process, {add_time * 1e3:.1f} ms/sample added")
+
+    pid = int(next(iter(procs)))
+    for name, func, kwargs in (
+        ("top_cpu", store.top_cpu, {"n": 10, "window": 3600}),
+        ("percentile", store.percentile, {"pid": pid, "q": 95, "window": 3600}),
+        ("growing", store.growing, {"min_rate": 1.0, "window": 3600}),
+    ):
+        _, elapsed = timed(func, "host", **kwargs)
+        print(f"{name:15s} {elapsed * 1e3:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
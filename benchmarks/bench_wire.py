@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+# bench_wire.py
+# Usage: python3 bench_wire.py [-n 1000000] [-r 3]
+#
+# Textproto against binary protobuf input for the same synthetic model:
+# the size of each file, and the best of -r runs of a full record scan,
+# proto_filter.py's two-pass selection and proto2tree.py's load, in
+# blocks per second. Both inputs must give the same tree.
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "proto"))
+
+from proto2tree import load_from_scan  # noqa: E402
+from proto_filter import select_from_scan  # noqa: E402
+from synth import write_textproto, write_wireproto  # noqa: E402
+from textproto import iter_records  # noqa: E402
+from wireproto import SYNTH_WIRE_MAP, WireMap  # noqa: E402
+
+
+def best_of(repeat, func, *args, **kwargs):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return result, best
+
+
+def scan(path, wire=None):
+    return sum(1 for _ in iter_records(path, wire=wire))
+
+
+def main():
+    p = argparse.ArgumentParser(description="Benchmark binary protobuf input against textproto.")
+    p.add_argument("-n", "--blocks", type=int, default=1000000, help="Number of synthetic blocks")
+    p.add_argument("-r", "--repeat", type=int, default=3, help="Runs per case; the best is kept")
+    p.add_argument("--relationships", default="RK_CONTROLS", help="Comma-separated kinds proto_filter keeps")
+    args = p.parse_args()
+    kinds = {r.strip() for r in args.relationships.split(",")}
+    wire = WireMap(SYNTH_WIRE_MAP)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        text = write_textproto(os.path.join(tmp, "bench.txtpb"), args.blocks)
+        binary = write_wireproto(os.path.join(tmp, "bench.pb"), args.blocks)
+        text_size, binary_size = os.path.getsize(text), os.path.getsize(binary)
+        print(f"{args.blocks:,} blocks: textproto {text_size / 1e6:,.1f} MB,"
+              f" binary {binary_size / 1e6:,.1f} MB (x{text_size / binary_size:.1f} smaller)")
+
+        for name, func, extra in (
+            ("scan", scan, {}),
+            ("proto_filter", select_from_scan, {"keep_relationships": kinds}),
+            ("proto2tree", load_from_scan, {}),
+        ):
+            text_result, text_time = best_of(args.repeat, func, text, **extra)
+            binary_result, binary_time = best_of(args.repeat, func, binary, wire=wire, **extra)
+            if name == "proto2tree" and text_result != binary_result:
+                sys.exit("Error: binary input gives a different tree")
+            print(f"{name:14s} textproto {args.blocks / text_time:12,.0f} blocks/sec ({text_time:.2f}s)"
+                  f"  binary {args.blocks / binary_time:12,.0f} blocks/sec ({binary_time:.2f}s,"
+                  f" x{text_time / binary_time:.2f})")
+
+
+if __name__ == "__main__":
+    main()
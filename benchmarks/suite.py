@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+# suite.py
+# Usage: python3 suite.py [--profile quick|full] [--only top,filter,tree] [-r 3]
+#                         [--fanout 8] [--depth D]
+#                         [--save baseline.json] [--compare baseline.json] [--threshold 0.25]
+#
+# Benchmark suite for the top parser and the proto tools, on the
+# deterministic synthetic data of synth.py: top output of 100 to 50k rows
+# and textprotos of 1k to 5M blocks (the full profile; quick stops at 5k
+# rows and 100k blocks). Every case runs in its own interpreter, so the
+# peak RSS reported is its own, and each of its phases is timed as the
+# best of -r runs; throughput is rows or blocks over the sum of phases.
+#
+# --save writes the results as a baseline. --compare checks them against
+# one and exits 1 if a phase got slower, or the peak RSS larger, by more
+# than --threshold (and by more than 10 ms or 5 MB, below which this is
+# noise), or if a case of the baseline failed.
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(BENCH_DIR, ".."))
+sys.path.insert(0, os.path.join(BENCH_DIR, "..", "proto"))
+
+from synth import synthetic_top, write_textproto  # noqa: E402
+
+PROFILES = {
+    "quick": {"top": (100, 5000), "filter": (1000, 100000), "tree": (1000, 100000)},
+    "full": {
+        "top": (100, 1000, 10000, 50000),
+        "filter": (1000, 100000, 1000000, 5000000),
+        "tree": (1000, 100000, 1000000, 5000000),
+    },
+}
+MIN_SECONDS = 0.01
+MIN_RSS_MB = 5
+
+
+class Phases(object):
+    """Best time of each named phase over the runs of a case"""
+
+    def __init__(self):
+        self.best = {}
+
+    @contextmanager
+    def __call__(self, name):
+        start = time.perf_counter()
+        yield
+        elapsed = time.perf_counter() - start
+        self.best[name] = min(elapsed, self.best.get(name, elapsed))
+
+
+def case_top(n, args, tmp):
+    from extraparsers.top import TopColumns, parse_rows, table_columns
+
+    out = synthetic_top(n)
+    phase = Phases()
+    for _ in range(args.repeat):
+        with phase("dict"):
+            parse_rows(out)
+        with phase("columnar"):
+            TopColumns(table_columns(out))
+    return phase.best
+
+
+def case_filter(n, args, tmp):
+    from proto_filter import select_from_index, select_from_scan
+    from proto_index import build_index, load_index
+
+    path = write_textproto(os.path.join(tmp, "bench.txtpb"), n, fanout=args.fanout, depth=args.depth)
+    kinds = {"RK_CONTAINS"}
+    phase = Phases()
+    for _ in range(args.repeat):
+        with phase("scan"):
+            select_from_scan(path, kinds)
+        with phase("index_build"):
+            build_index(path)
+        with phase("index_query"):
+            select_from_index(load_index(path), kinds)
+    return phase.best
+
+
+def case_tree(n, args, tmp):
+    from proto2tree import forest_views, html_template, load_from_scan, search_index, write_page
+
+    path = write_textproto(os.path.join(tmp, "bench.txtpb"), n, fanout=args.fanout, depth=args.depth)
+    phase = Phases()
+    for _ in range(args.repeat):
+        with phase("scan"):
+            entities, edges = load_from_scan(path)
+        with phase("views"):
+            payload, _ = forest_views(entities, edges)
+        with phase("search"):
+            search = search_index(payload)
+        with phase("html"):
+            with open(os.path.join(tmp, "tree.html"), "w", encoding="utf-8") as f:
+                write_page(f, html_template(payload), payload, search)
+    return phase.best
+
+
+CASES = {"top": case_top, "filter": case_filter, "tree": case_tree}
+
+
+def run_case(case_id, args):
+    """Run one case in this process and print its result as JSON"""
+    name, n = case_id.split(":")
+    n = int(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        phases = CASES[name](n, args, tmp)
+    total = sum(phases.values())
+    print(json.dumps({
+        "items": n,
+        "phases": phases,
+        "total": total,
+        "throughput": n / total if total else 0.0,
+        # ru_maxrss is in kB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }))
+
+
+def run_suite(args):
+    results = {}
+    only = args.only.split(",") if args.only else list(CASES)
+    for name in only:
+        for n in PROFILES[args.profile][name]:
+            case_id = f"{name}:{n}"
+            command = [sys.executable, os.path.abspath(__file__), "--run-case", case_id,
+                       "-r", str(args.repeat), "--fanout", str(args.fanout)]
+            if args.depth is not None:
+                command += ["--depth", str(args.depth)]
+            proc = subprocess.run(command, capture_output=True, text=True)
+            if proc.returncode:
+                lines = proc.stderr.strip().splitlines() or [f"exit status {proc.returncode}"]
+                results[case_id] = {"error": lines[-1]}
+                print(f"{case_id:16s} FAILED {lines[-1]}")
+                continue
+            result = results[case_id] = json.loads(proc.stdout)
+            phases = "  ".join(f"{phase} {t * 1e3:.1f}ms" for phase, t in result["phases"].items())
+            print(f"{case_id:16s} {result['throughput']:12,.0f}/s {result['peak_rss_mb']:8.1f} MB  {phases}")
+    return results
+
+
+def compare(baseline, results, threshold):
+    """Regressions of results against baseline, as printable lines"""
+    regressions = []
+    for case_id, old in baseline["results"].items():
+        new = results.get(case_id)
+        if new is None or "error" in old:
+            continue
+        if "error" in new:
+            regressions.append(f"{case_id}: failed: {new['error']}")
+            continue
+        checks = [(phase, old["phases"][phase], t, MIN_SECONDS, "s") for phase, t in new["phases"].items()
+                  if phase in old["phases"]]
+        checks.append(("peak RSS", old["peak_rss_mb"], new["peak_rss_mb"], MIN_RSS_MB, " MB"))
+        for what, before, after, floor, unit in checks:
+            if after > before * (1 + threshold) and after - before > floor:
+                regressions.append(f"{case_id}: {what} {before:.3f}{unit} -> {after:.3f}{unit}"
+                                   f" (+{(after / before - 1) * 100:.0f}%)")
+    return regressions
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Benchmark suite for extraparsers and the proto tools.")
+    p.add_argument("--profile", choices=sorted(PROFILES), default="quick", help="Input sizes to run")
+    p.add_argument("--only", help="Comma-separated cases: " + ",".join(CASES))
+    p.add_argument("-r", "--repeat", type=int, default=3, help="Runs per case; the best time of each phase is kept")
+    p.add_argument("--fanout", type=int, default=8, help="Fan-out of the synthetic containment tree")
+    p.add_argument("--depth", type=int, help="Depth of the synthetic containment trees (default: one tree)")
+    p.add_argument("--save", help="Write the results to this baseline file")
+    p.add_argument("--compare", help="Compare the results with this baseline file")
+    p.add_argument("--threshold", type=float, default=0.25, help="Relative growth counted as a regression")
+    p.add_argument("--run-case", help=argparse.SUPPRESS)
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.run_case:
+        run_case(args.run_case, args)
+        return
+    if args.only and not set(args.only.split(",")) <= set(CASES):
+        sys.exit(f"Error: --only takes {','.join(CASES)}")
+
+    baseline = None
+    if args.compare:
+        try:
+            with open(args.compare, encoding="utf-8") as f:
+                baseline = json.load(f)
+        except Exception as e:
+            sys.exit(f"Error reading baseline: {e}")
+
+    results = run_suite(args)
+
+    if args.save:
+        meta = {"python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count(),
+                "profile": args.profile, "fanout": args.fanout, "depth": args.depth}
+        try:
+            with open(args.save, "w", encoding="utf-8") as f:
+                json.dump({"meta": meta, "results": results}, f, indent=1)
+        except Exception as e:
+            sys.exit(f"Error writing baseline: {e}")
+
+    if baseline is not None:
+        regressions = compare(baseline, results, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        print(f"{len(regressions)} regressions against {args.compare}")
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Deterministic synthetic inputs for the benchmarks.
+"""
+import random
+
+ENTITY_TYPES = ("site", "rack", "chassis", "card", "port", "interface")
+RELATIONSHIP_KINDS = ("RK_CONTAINS", "RK_CONTROLS", "RK_SUPPORTS", "RK_AGGREGATES")
+
+
+def iter_model(n_blocks, fanout=8, seed=0, depth=None):
+    """
+    Yield ("entity", id, type, name) and ("relationship", a, kind, z, data)
+    for roughly n_blocks blocks: half entities, half relationships.
+    Entities form an RK_CONTAINS tree with the given fanout, or with depth
+    set, a forest of trees no deeper than that; every fourth relationship
+    uses one of the other kinds, and every eighth carries a nested data
+    message.
+    """
+    rnd = random.Random(seed)
+    n_entities = max(1, n_blocks // 2)
+    tree_size = n_entities
+    if depth is not None:
+        tree_size = sum(fanout ** level for level in range(min(depth, 64) + 1))
+    for i in range(n_entities):
+        etype = ENTITY_TYPES[i % len(ENTITY_TYPES)]
+        yield "entity", f"e{i}", etype, f"{etype}-{i}"
+    for i in range(1, n_blocks - n_entities + 1):
+        child = i % n_entities
+        local = child % tree_size
+        # Roots point at the missing entity e-1
+        parent = child - local + (local - 1) // fanout if local else -1
+        kind = "RK_CONTAINS"
+        if i % 4 == 0:
+            kind = rnd.choice(RELATIONSHIP_KINDS[1:])
+            parent = rnd.randrange(n_entities)
+        yield "relationship", f"e{parent}", kind, f"e{child}", i % 8 == 0
+
+
+def iter_textproto(n_blocks, fanout=8, seed=0, depth=None):
+    """
+    Yield the textproto blocks of iter_model.
+    """
+    for item in iter_model(n_blocks, fanout=fanout, seed=seed, depth=depth):
+        if item[0] == "entity":
+            _, eid, etype, name = item
+            yield (
+                "entity: {\n"
+                f'  id: "{eid}"\n'
+                f"  ek_{etype}: {{\n"
+                f'    name: "{name}"\n'
+                "  }\n"
+                "}\n"
+            )
+            continue
+        _, a, kind, z, data = item
+        data = '  data: { a: "ignored" }\n' if data else ""
+        yield (
+            "relationship: {\n"
+            f'  a: "{a}"\n'
+            f"  kind: {kind}\n"
+            f'  z: "{z}"\n'
+            f"{data}"
+            "}\n"
+        )
+
+
+def write_textproto(path, n_blocks, fanout=8, seed=0, depth=None):
+    with open(path, "w", encoding="utf-8") as f:
+        for block in iter_textproto(n_blocks, fanout=fanout, seed=seed, depth=depth):
+            f.write(block)
+    return path
+
+
+def varint(value):
+    out = bytearray()
+    while value >= 0x80:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    return bytes(out)
+
+
+def wire_field(number, data):
+    """A length-delimited field: tag, length, data"""
+    return varint(number << 3 | 2) + varint(len(data)) + data
+
+
+def iter_wireproto(n_blocks, fanout=8, seed=0, depth=None):
+    """
+    Yield the top-level fields of iter_model as a binary model, in the
+    layout of proto/wireproto.py's SYNTH_WIRE_MAP. The data message of a
+    relationship is field 15, which the decoder skips.
+    """
+    types = {etype: 10 + k for k, etype in enumerate(ENTITY_TYPES)}
+    kinds = {kind: 1 + k for k, kind in enumerate(RELATIONSHIP_KINDS)}
+    for item in iter_model(n_blocks, fanout=fanout, seed=seed, depth=depth):
+        if item[0] == "entity":
+            _, eid, etype, name = item
+            body = wire_field(1, eid.encode()) + wire_field(types[etype], wire_field(1, name.encode()))
+            yield wire_field(1, body)
+            continue
+        _, a, kind, z, data = item
+        body = wire_field(1, a.encode()) + b"\x10" + varint(kinds[kind]) + wire_field(3, z.encode())
+        if data:
+            body += wire_field(15, wire_field(1, b"ignored"))
+        yield wire_field(2, body)
+
+
+def write_wireproto(path, n_blocks, fanout=8, seed=0, depth=None):
+    with open(path, "wb") as f:
+        for field in iter_wireproto(n_blocks, fanout=fanout, seed=seed, depth=depth):
+            f.write(field)
+    return path
+
+
+TOP_SUMMARY = """top - 13:03:02 up  3:53,  1 user,  load average: 0.00, 0.05, 0.07
+Tasks: {n} total,   1 running, {n} sleeping,   0 stopped,   0 zombie
+%Cpu(s):  0.0 us,  6.2 sy,  0.0 ni, 93.8 id,  0.0 wa,  0.0 hi,  0.0 si,  0.0 st
+MiB Mem :   3924.3 total,   2434.9 free,    287.7 used,   1201.7 buff/cache
+MiB Swap:    923.3 total,    923.3 free,      0.0 used.   3380.2 avail Mem
+
+    PID USER      PR  NI    VIRT    RES    SHR S  %CPU  %MEM     TIME+ COMMAND
+"""
+
+USERS = ("root", "yuanl", "systemd+", "www-data", "postgres", "nobody")
+COMMANDS = ("python3", "sshd", "nginx", "postgres", "java", "bash")
+KTHREADS = ("kworker/0:1-events", "rcu_gp", "ksoftirqd/3", "migration/1")
+
+
+def synthetic_top(n_procs, seed=0):
+    """
+    top -b output with n_procs rows: a third kernel threads, the rest user
+    processes, mostly idle.
+    """
+    rnd = random.Random(seed)
+    rows = [TOP_SUMMARY.format(n=n_procs)]
+    for pid in range(1, n_procs + 1):
+        if pid % 3 == 0:
+            rows.append("%7d root       0 -20       0      0      0 I   0.0   0.0   0:00.%02d %s\n"
+                        % (pid, rnd.randrange(100), rnd.choice(KTHREADS)))
+            continue
+        busy = rnd.random() < 0.05
+        rows.append("%7d %-8s %3d %3d %7d %6d %6d %s %5.1f %5.1f %9s %s\n" % (
+            pid, rnd.choice(USERS), 20, 0,
+            rnd.randrange(10 ** 4, 10 ** 7), rnd.randrange(10 ** 3, 10 ** 6), rnd.randrange(10 ** 3, 10 ** 5),
+            "R" if busy else "S", rnd.random() * 50 if busy else 0.0, rnd.random() * 2,
+            "%d:%02d.%02d" % (rnd.randrange(100), rnd.randrange(60), rnd.randrange(100)),
+            rnd.choice(COMMANDS)))
+    return "".join(rows)
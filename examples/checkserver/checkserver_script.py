@@ -11,15 +11,23 @@ import logging
 
 # Needed for aetest script
 from pyats import aetest
-from genie.libs.parser.utils.entry_points import add_parser
 
 # my lib
-from extraparsers.top import Top
+from extraparsers.registry import parse
+from extraparsers.top_checks import compile_rules, evaluate, verdict
+from session_pool import POOL
 
 
 # Get your logger for your script
 log = logging.getLogger()
 
+# Health rules for the process table of the device, compiled once
+RULES = compile_rules({
+    "cpu_hogs": "cpu <= 90",
+    "zombies": "count() == 0 where s == Z",
+    "java_memory": "res < 8GiB where command == java",
+})
+
 ###################################################################
 ###                  COMMON SETUP SECTION                       ###
 ###################################################################
@@ -40,22 +48,17 @@ class common_setup(aetest.CommonSetup):
     def connect(self, testscript, testbed):
         """Common Setup subsection"""
         log.info("Aetest Common Setup: connect to device")
-        device = testbed.devices["egypt"]
-        # Connecting to the devices using the default connection
-        device.connect()
+        testscript.parameters["pool_stats"] = POOL.snapshot()
+        # Connecting to the devices using the default connection, or
+        # reusing the session a previous run in this process left open
+        device = POOL.acquire(testbed.devices["egypt"])
 
         # Save it in testscript parmaeters to be able to use it from other
         # test sections
         testscript.parameters["uut"] = device
 
-    # 2nd subsection
-    @aetest.subsection
-    def register_parser(self, section):
-        log.info("Aetest Common Setup: add parser")
-        # register my parser
-        add_parser(Top, "linux")
-
-        # Save it in testscript parmaeters to be able to use it from other
+    # Parsers need no registering: parse() imports the one a command needs
+    # the first time it runs
 
 
 ###################################################################
@@ -77,11 +80,20 @@ class test_top(aetest.Testcase):
     @aetest.setup
     def send_command(self, uut):
         # Get device output
-        self.output = uut.parse("top -n 1 -b")
+        self.output = parse(uut, "top -n 1 -b")
 
         # Configuration can also be send
         # uut.configure('some configuration')
 
+    # This is how to create a test section
+    @aetest.test
+    def check_processes(self, uut):
+        passed, message = verdict(evaluate(RULES, {uut.name: self.output}))
+        if passed:
+            self.passed(message)
+        else:
+            self.failed(message)
+
 
 #####################################################################
 ####                       COMMON CLEANUP SECTION                 ###
@@ -99,6 +111,9 @@ class common_cleanup(aetest.CommonCleanup):
     # You can have 1 to as many subsection as wanted
 
     @aetest.subsection
-    def disconnect(self, uut):
+    def disconnect(self, uut, pool_stats):
         """Common Cleanup Subsection"""
-        uut.disconnect()
+        # The session stays open for the next run; the pool disconnects
+        # it when idle or at exit
+        POOL.release(uut)
+        log.info(f"Sessions: {POOL.report(pool_stats)}")
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+###################################################################
+# fleet.py : run and parse commands on many testbed devices at once
+#
+# python fleet.py --testbed testbed.yaml [--devices egypt,sudan]
+#                 [--group web] [-w 32] [--timeout 60] [-c "top -n 1 -b"]
+#
+# Each device is connected, queried and disconnected in a worker thread,
+# at most --workers at a time. A device that fails or times out is
+# reported and the sweep carries on with the others. Workers are daemon
+# threads, so the script exits at --deadline even if a device hangs.
+# Called from a long-lived process, collect(..., sessions=POOL) keeps the
+# sessions open from one sweep to the next instead (see session_pool.py).
+#
+# --record FILE saves the raw outputs of the sweep; --replay FILE runs
+# the sweep again from them, without a testbed or any device, and parses
+# each distinct output once.
+#
+# Commands are parsed through extraparsers.registry: only the parser
+# module of each command is imported, and genie's parser library is not.
+###################################################################
+import argparse
+import logging
+import queue
+import sys
+import threading
+import time
+
+# my lib
+from extraparsers.registry import parse
+from extraparsers.replay import ParseCache, Recorder, replay_devices, save_recording
+
+log = logging.getLogger(__name__)
+
+
+def select_devices(testbed, names=None, group=None):
+    """
+    Devices of the testbed, all of them or those named, optionally only
+    those listing group under custom: groups: in the testbed file.
+    """
+    devices = []
+    for name, device in testbed.devices.items():
+        if names and name not in names:
+            continue
+        custom = getattr(device, "custom", None) or {}
+        if group and group not in custom.get("groups", ()):
+            continue
+        devices.append(device)
+    return devices
+
+
+def collect_device(device, commands, timeout, sessions=None, cache=None):
+    """
+    Connect to device, execute and parse each command, and disconnect, or
+    take the session from and give it back to sessions, a SessionPool.
+    cache, a ParseCache, parses each distinct output once.
+    Never raises: the result dict holds "parsed" {command: dict}, "error"
+    (None or a message) and "latency" in seconds, of "connect", of each
+    command's execution and parsing, and "total".
+    """
+    result = {"device": device.name, "parsed": {}, "error": None, "latency": {}}
+    start = time.perf_counter()
+    if sessions is not None:
+        try:
+            device = sessions.acquire(device)
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+            result["latency"]["total"] = time.perf_counter() - start
+            return result
+    try:
+        if sessions is None:
+            device.connect(log_stdout=False, connection_timeout=timeout)
+        result["latency"]["connect"] = time.perf_counter() - start
+        for command in commands:
+            t0 = time.perf_counter()
+            out = device.execute(command, timeout=timeout)
+            t1 = time.perf_counter()
+            result["parsed"][command] = parse(device, command, output=out, cache=cache)
+            result["latency"][command] = {"execute": t1 - t0, "parse": time.perf_counter() - t1}
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        if sessions is not None:
+            sessions.release(device)
+        else:
+            try:
+                if device.is_connected():
+                    device.disconnect()
+            except Exception as e:
+                log.warning(f"{device.name}: disconnect failed: {e}")
+    result["latency"]["total"] = time.perf_counter() - start
+    return result
+
+
+def collect(devices, commands, workers=32, timeout=60, deadline=None, sessions=None, cache=None):
+    """
+    collect_device() results for every device, by name, in the order of
+    devices. Devices still running after deadline seconds are reported as
+    timed out, and those not started yet are skipped; the daemon threads
+    still running are left to finish on their own, or with the process.
+    """
+    # Init vars
+    results = {}
+    finished = {}
+    pending = queue.SimpleQueue()
+    for i, device in enumerate(devices):
+        pending.put((i, device))
+    expired = threading.Event()
+    changed = threading.Condition()
+
+    def work():
+        while not expired.is_set():
+            try:
+                i, device = pending.get_nowait()
+            except queue.Empty:
+                return
+            result = collect_device(device, commands, timeout, sessions, cache)
+            with changed:
+                finished[i] = result
+                changed.notify()
+
+    for _ in range(min(workers, len(devices))):
+        threading.Thread(target=work, name="fleet-worker", daemon=True).start()
+    with changed:
+        changed.wait_for(lambda: len(finished) == len(devices), timeout=deadline)
+        expired.set()
+        done = dict(finished)
+
+    for i, device in enumerate(devices):
+        if i in done:
+            results[device.name] = done[i]
+        else:
+            results[device.name] = {"device": device.name, "parsed": {}, "error": "timed out",
+                                    "latency": {"total": deadline}}
+    return results
+
+
+def report(results, out=sys.stdout):
+    """
+    One line per device, slowest first, then a count of failures.
+    """
+    failed = 0
+    for result in sorted(results.values(), key=lambda r: -r["latency"]["total"]):
+        latency = result["latency"]
+        line = f"{result['device']:20s} {latency['total']:8.2f}s"
+        if "connect" in latency:
+            line += f"  connect {latency['connect']:6.2f}s"
+        for command, parsed in result["parsed"].items():
+            line += f"  {command!r}: {latency[command]['execute']:.2f}s + {latency[command]['parse']:.3f}s"
+            line += f" ({len(parsed.get('pid', {}))} processes)" if "pid" in parsed else ""
+        if result["error"]:
+            failed += 1
+            line += f"  FAILED {result['error']}"
+        out.write(line + "\n")
+    out.write(f"{len(results) - failed} of {len(results)} devices collected\n")
+    return failed
+
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Run and parse commands on testbed devices concurrently.")
+    p.add_argument("--testbed", default="testbed.yaml", help="Testbed file")
+    p.add_argument("--devices", help="Comma-separated device names (default: all)")
+    p.add_argument("--group", help="Only devices with this group under custom: groups:")
+    p.add_argument("-c", "--command", action="append", help="Command to run and parse; repeatable (default: top -n 1 -b)")
+    p.add_argument("-w", "--workers", type=int, default=32, help="Devices handled at once")
+    p.add_argument("--timeout", type=int, default=60, help="Seconds allowed to connect and for each command")
+    p.add_argument("--deadline", type=float, help="Seconds allowed for the whole sweep")
+    p.add_argument("--record", help="Save the outputs of the sweep to this file")
+    p.add_argument("--replay", help="Sweep the devices of this recording instead of the testbed (no --group)")
+    return p.parse_args()
+
+
+def main():
+    args = parse_args()
+    names = set(args.devices.split(",")) if args.devices else None
+    cache = None
+    if args.replay:
+        cache = ParseCache()
+        try:
+            replayed = replay_devices(args.replay)
+        except Exception as e:
+            sys.exit(f"Error loading recording: {e}")
+        devices = [device for name, device in replayed.items() if not names or name in names]
+    else:
+        # Only a live sweep needs the testbed loader
+        from genie.testbed import load
+
+        try:
+            testbed = load(args.testbed)
+        except Exception as e:
+            sys.exit(f"Error loading testbed: {e}")
+        devices = select_devices(testbed, names, args.group)
+    if not devices:
+        sys.exit("Error: no devices selected")
+
+    entries = []
+    if args.record:
+        devices = [Recorder(device, entries) for device in devices]
+
+    results = collect(devices, args.command or ["top -n 1 -b"], args.workers, args.timeout, args.deadline,
+                      cache=cache)
+    failed = report(results)
+
+    if args.record:
+        try:
+            # Workers past the deadline may still be adding to entries
+            save_recording(args.record, list(entries))
+        except Exception as e:
+            sys.exit(f"Error writing recording: {e}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+#!/usr/bin/env python
+###################################################################
+# session_pool.py : keep device sessions open between testcases and
+#                   jobs run in the same process
+#
+#     from session_pool import POOL
+#     device = POOL.acquire(testbed.devices["egypt"])
+#     ...
+#     POOL.release(device)
+#
+# A released session stays connected. The next acquire of the same device
+# checks it still answers and hands it back without a new SSH handshake.
+# Sessions idle for longer than idle_timeout are disconnected, and at most
+# max_sessions are kept: the least recently used idle one makes room.
+###################################################################
+import atexit
+import logging
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+log = logging.getLogger(__name__)
+
+
+class SessionPool(object):
+    """Connected devices by name, reused across acquire() calls"""
+
+    def __init__(self, max_sessions=32, idle_timeout=300, check_command="echo ok", timeout=60):
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.check_command = check_command
+        self.timeout = timeout
+        # name: {"device", "busy", "last_used"}, least recently used first
+        self.sessions = OrderedDict()
+        # Names of the evicted sessions being disconnected
+        self.closing = set()
+        self.lock = threading.Condition()
+        self.stats = {"handshakes": 0, "handshake_time": 0.0, "reuses": 0, "evictions": 0, "failed_checks": 0}
+
+    def healthy(self, device):
+        """Whether an open session still runs commands"""
+        try:
+            return device.is_connected() and bool(device.execute(self.check_command, timeout=self.timeout))
+        except Exception as e:
+            log.info(f"{device.name}: health check failed: {e}")
+            return False
+
+    def acquire(self, device):
+        """
+        device, connected: the pooled session if it is idle and healthy,
+        else a new connection. Blocks while max_sessions sessions are busy.
+        The pooled object is returned even when device is a new one of the
+        same name, from a testbed loaded again: use the return value.
+        """
+        with self.lock:
+            evicted = self.evict_idle()
+            while True:
+                # An evicted session of this name may still be disconnecting
+                if device.name not in self.closing:
+                    entry = self.sessions.get(device.name)
+                    if entry is not None and not entry["busy"]:
+                        entry["busy"] = True
+                        break
+                    if entry is None and len(self.sessions) >= self.max_sessions:
+                        evicted += self.evict_lru()
+                    if entry is None and len(self.sessions) < self.max_sessions:
+                        entry = self.sessions[device.name] = {"device": device, "busy": True, "last_used": 0.0}
+                        break
+                self.lock.wait()
+            self.sessions.move_to_end(device.name)
+
+        # Disconnects, checks and handshakes happen outside the lock; the
+        # busy entry keeps other threads off this device
+        self.close(evicted)
+        session = entry["device"]
+        try:
+            if session.is_connected():
+                if self.healthy(session):
+                    self.count("reuses")
+                    return session
+                self.count("failed_checks")
+                self.disconnect(session)
+            start = time.perf_counter()
+            session.connect(log_stdout=False, connection_timeout=self.timeout)
+            self.count("handshakes")
+            self.count("handshake_time", time.perf_counter() - start)
+            return session
+        except Exception:
+            with self.lock:
+                del self.sessions[device.name]
+                self.lock.notify_all()
+            raise
+
+    def count(self, stat, value=1):
+        with self.lock:
+            self.stats[stat] += value
+
+    def release(self, device):
+        """Hand a session back to the pool, still connected"""
+        with self.lock:
+            entry = self.sessions.get(device.name)
+            if entry is not None:
+                entry["busy"] = False
+                entry["last_used"] = time.monotonic()
+            self.lock.notify_all()
+
+    @contextmanager
+    def session(self, device):
+        session = self.acquire(device)
+        try:
+            yield session
+        finally:
+            self.release(session)
+
+    def disconnect(self, device):
+        try:
+            device.disconnect()
+        except Exception as e:
+            log.warning(f"{device.name}: disconnect failed: {e}")
+
+    def close(self, devices):
+        """Disconnect evicted devices; call without the lock held"""
+        for device in devices:
+            self.disconnect(device)
+        if devices:
+            with self.lock:
+                self.closing.difference_update(device.name for device in devices)
+                self.lock.notify_all()
+
+    def evict_idle(self):
+        """Evict sessions idle for longer than idle_timeout; call with the
+        lock held, and close() the devices returned once released"""
+        now = time.monotonic()
+        return [self.evict(name) for name, entry in list(self.sessions.items())
+                if not entry["busy"] and now - entry["last_used"] > self.idle_timeout]
+
+    def evict_lru(self):
+        """Evict the least recently used idle session; call with the lock
+        held, and close() the devices returned once released"""
+        for name, entry in self.sessions.items():
+            if not entry["busy"]:
+                return [self.evict(name)]
+        return []
+
+    def evict(self, name):
+        entry = self.sessions.pop(name)
+        self.stats["evictions"] += 1
+        self.closing.add(name)
+        self.lock.notify_all()
+        return entry["device"]
+
+    def close_all(self):
+        """Disconnect every idle session"""
+        with self.lock:
+            evicted = [self.sessions.pop(name)["device"] for name, entry in list(self.sessions.items())
+                       if not entry["busy"]]
+            self.closing.update(device.name for device in evicted)
+        self.close(evicted)
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.stats)
+
+    def report(self, since=None):
+        """
+        Handshakes done and reuses, and the handshake time the reuses saved
+        at the mean handshake time seen; only those after the since
+        snapshot(), if given.
+        """
+        totals = self.snapshot()
+        s = {stat: value - (since or {}).get(stat, 0) for stat, value in totals.items()}
+        mean = totals["handshake_time"] / totals["handshakes"] if totals["handshakes"] else 0.0
+        return (f"{s['handshakes']} handshakes ({s['handshake_time']:.2f}s), {s['reuses']} reuses"
+                f" saving about {s['reuses'] * mean:.2f}s, {s['evictions']} evictions,"
+                f" {s['failed_checks']} failed health checks")
+
+
+# One pool for the process, so jobs run one after another share sessions
+POOL = SessionPool()
+atexit.register(POOL.close_all)
@@ -1,6 +1,14 @@
-# Paackages where parser modules exist must have following lines in __init__.py
-# otherwise the parser through runtime exception during use
-from genie import abstract
+# Parsers are looked up through registry.py, which imports a parser module
+# only when one of its commands is parsed, so importing the package does
+# not load genie. genie's device.parse() needs the package declared to
+# genie.abstract: every parser module calls declare() when imported, as it
+# imports genie anyway, so add_parser(Top, "linux") then device.parse()
+# still works without registry.register().
 
-abstract.declare_package(__name__)
-abstract.declare_token(__name__)
+
+def declare():
+    """Declare the package to genie.abstract, as parser packages must be"""
+    from genie import abstract
+
+    abstract.declare_package(__name__)
+    abstract.declare_token(__name__)
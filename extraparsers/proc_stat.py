@@ -0,0 +1,181 @@
+""" proc_stat.py
+
+Linux parser for the following command:
+    * grep -s '' /proc/[0-9]*/stat /proc/stat; echo --; sleep {interval};
+      grep -s '' /proc/[0-9]*/stat /proc/[0-9]*/statm /proc/meminfo /proc/stat;
+      stat -c '%n %U' /proc/[0-9]*
+
+A lighter alternative to 'top -n 1 -b' that gives the same TopSchema.
+"""
+
+# Schema, as for top
+from .top import TopSchema
+
+# The line between the first and the second sample of the command
+SEPARATOR = "\n--\n"
+
+
+def parse_sample(out):
+    """The /proc files of one sample, by kind
+
+    grep prefixes every line with its file name, and stat prints the owner
+    of each /proc/<pid> directory. Returns a dict with "stat" and "statm"
+    ({pid: line}), "users" ({pid: user}), "meminfo" ({key: kB}), "total"
+    (jiffies of all CPUs) and "cpus".
+    """
+    # Init vars
+    sample = {"stat": {}, "statm": {}, "users": {}, "meminfo": {}, "total": 0, "cpus": 0}
+
+    for line in out.splitlines():
+        path, sep, rest = line.partition(":")
+        if not sep:
+            # /proc/123 root
+            path, _, user = line.partition(" ")
+            if path.startswith("/proc/") and user:
+                sample["users"][path[6:]] = user.strip()
+            continue
+
+        parts = path.split("/")
+        if len(parts) == 4 and parts[3] in ("stat", "statm"):
+            sample[parts[3]][parts[2]] = rest
+        elif path == "/proc/meminfo":
+            key, _, value = rest.partition(":")
+            value = value.split()
+            if value:
+                sample["meminfo"][key] = int(value[0])
+        elif path == "/proc/stat" and rest.startswith("cpu"):
+            fields = rest.split()
+            if fields[0] == "cpu":
+                # user nice system idle iowait irq softirq steal; guest time
+                # is already counted in user
+                sample["total"] = sum(map(int, fields[1:9]))
+            else:
+                sample["cpus"] += 1
+
+    return sample
+
+
+def process_ticks(line):
+    """(start time, utime + stime) of a /proc/<pid>/stat line, or None if
+    it is cut short"""
+    # comm may hold spaces and parentheses, but is the only field between
+    # parentheses
+    fields = line[line.rfind(")") + 2:].split()
+    if len(fields) < 22:
+        return None
+    return fields[19], int(fields[11]) + int(fields[12])
+
+
+# ===========================================
+# Parser for the bulk /proc sample
+# ===========================================
+class ProcStat(TopSchema):
+
+    '''Parser for a bulk read of /proc, as "top -n 1 -b" gives it
+
+    One exec reads the stat file of every process and /proc/stat, waits
+    interval seconds, then reads the stat and statm file of every process,
+    and meminfo and stat again; nothing is computed on the device. %CPU
+    comes from the jiffies between the two samples, as top's does between
+    two frames. Output of a single sample parses too, with a %CPU of 0.0.
+    COMMAND is the full comm field, spaces included, and %CPU and %MEM are
+    not rounded.
+    '''
+
+    cli_command = [
+        "grep -s '' /proc/[0-9]*/stat /proc/stat; echo --; sleep {interval};"
+        " grep -s '' /proc/[0-9]*/stat /proc/[0-9]*/statm /proc/meminfo /proc/stat;"
+        " stat -c '%n %U' /proc/[0-9]* 2>/dev/null"
+    ]
+
+    def __init__(self, *args, page_size=4096, hz=100, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.page_size = page_size
+        self.hz = hz
+
+    def cli(self, interval=1, output=None):
+        if output is None:
+            command = self.cli_command[0].format(interval=interval)
+            out = self.device.execute(command)
+        else:
+            out = output
+
+        # Init vars
+        parsed_dict = {}
+        procs = {}
+        first, sep, out = out.rpartition(SEPARATOR)
+        sample = parse_sample(out)
+        previous = parse_sample(first) if sep else None
+
+        """ Sample output
+        /proc/1/stat:1 (systemd) S 0 1 1 0 -1 4194560 58659 342387 69 217 376 917 789 125 20 0 1 0 6 24571904 2362 ...
+        /proc/1/statm:5999 2381 1664 1593 0 3960 0
+        /proc/meminfo:MemTotal:        6158152 kB
+        /proc/meminfo:MemFree:         4069884 kB
+        /proc/stat:cpu  10132153 290696 3084719 46828483 16683 0 25195 0 0 0
+        /proc/stat:cpu0 1393723 56574 361510 5820035 2069 0 6498 0 0 0
+        --
+        /proc/1/stat:1 (systemd) S 0 1 1 0 -1 4194560 58659 342387 69 217 377 917 789 125 20 0 1 0 6 24571904 2362 ...
+        /proc/1/statm:5999 2381 1664 1593 0 3960 0
+        /proc/meminfo:MemTotal:        6158152 kB
+        /proc/meminfo:MemFree:         4069884 kB
+        /proc/stat:cpu  10132253 290696 3084719 46828483 16683 0 25195 0 0 0
+        /proc/stat:cpu0 1393823 56574 361510 5820035 2069 0 6498 0 0 0
+        /proc/1 root
+        """
+        kb_per_page = self.page_size // 1024
+        mem_total = sample["meminfo"].get("MemTotal")
+        elapsed = 0
+        if previous and sample["cpus"]:
+            # Jiffies that passed on one CPU, as top counts %CPU
+            elapsed = (sample["total"] - previous["total"]) / sample["cpus"]
+
+        for pid, line in sample["stat"].items():
+            user = sample["users"].get(pid)
+            if user is None:
+                # Exited before stat ran
+                continue
+            # comm may hold spaces and parentheses, but is the only field
+            # between parentheses
+            end = line.rfind(")")
+            command = line[line.find("(") + 1:end]
+            fields = line[end + 2:].split()
+            if len(fields) < 22:
+                continue
+            state = fields[0]
+            used = int(fields[11]) + int(fields[12])
+            start = fields[19]
+
+            cpu = 0.0
+            if elapsed > 0:
+                before_start, before = process_ticks(previous["stat"].get(pid, "")) or (start, 0)
+                # A pid started or reused between the samples starts over
+                if before_start != start:
+                    before = 0
+                cpu = 100.0 * (used - before) / elapsed
+
+            # RES and SHR as top reads them, from statm
+            statm = sample["statm"].get(pid, "").split()
+            if len(statm) > 2:
+                res, shr = int(statm[1]) * kb_per_page, int(statm[2]) * kb_per_page
+            else:
+                res, shr = int(fields[21]) * kb_per_page, 0
+            centis = used * 100 // self.hz
+            procs[pid] = {
+                "user": user,
+                "pr": int(fields[15]),
+                "ni": int(fields[16]),
+                "virt": int(fields[20]) // 1024,
+                "res": res,
+                "shr": shr,
+                "s": state,
+                "cpu": cpu,
+                "mem": 100.0 * res / mem_total if mem_total else 0.0,
+                "time": "%d:%02d.%02d" % (centis // 6000, centis // 100 % 60, centis % 100),
+                "command": command,
+            }
+
+        if procs:
+            parsed_dict["pid"] = procs
+
+        return parsed_dict
@@ -0,0 +1,182 @@
+""" registry.py
+
+Parsers of this package, and of any other that declares them, by command:
+    * parsers are entry points of the "extraparsers.<os>" group, named
+      after the program their commands run, optionally followed by a
+      label: "top", "top.batch", "grep.proc_stat"; those of this package
+      are PARSERS, which setup.py declares
+    * a parser module is imported the first time a command of its program
+      is looked up, and no other
+    * parse(device, command) runs the parser found without going through
+      genie's parser library, and validates its result against the
+      parser's schema as device.parse() does; register() adds them all to
+      genie's library instead, for code that calls device.parse()
+"""
+
+# Python
+import importlib
+import re
+import threading
+
+GROUP = "extraparsers.{os}"
+
+# The parsers of this package, by os, and the one place they are listed:
+# setup.py declares them as entry points from here. They are known without
+# reading the installed ones: importlib.metadata alone takes longer to
+# import than the parsers, so entry points are only read for a command
+# none of these parses, then once per os.
+PARSERS = {
+    "linux": {
+        "top": "extraparsers.top:Top",
+        "top.batch": "extraparsers.top:TopBatch",
+        "grep.proc_stat": "extraparsers.proc_stat:ProcStat",
+    },
+}
+
+FIELD_RE = re.compile(r"\\\{(\w+)\\\}")
+
+
+def installed_parsers(os):
+    """{name: "module:Class"} of the entry points installed packages
+    declare for os"""
+    from importlib import metadata
+
+    group = GROUP.format(os=os)
+    entry_points = metadata.entry_points()
+    if hasattr(entry_points, "select"):
+        entry_points = entry_points.select(group=group)
+    else:
+        entry_points = entry_points.get(group, ())
+    return {entry_point.name: entry_point.value for entry_point in entry_points}
+
+
+def load_parser(value):
+    """The class of a "module:Class" entry point value"""
+    module, _, name = value.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def command_re(template):
+    """Regex matching the commands of a cli_command template: each {field}
+    stands for one word"""
+    return re.compile(FIELD_RE.sub(r"(?P<\1>\\S+)", re.escape(template)))
+
+
+class Registry(object):
+    """Parsers by command, imported on demand
+
+    The parsers of a program are imported the first time one of its
+    commands is looked up. Lookups are thread-safe.
+    """
+
+    def __init__(self, parsers=PARSERS):
+        # os: {name: "module:Class"}
+        self.declared = {os: dict(declared) for os, declared in parsers.items()}
+        # The os whose installed entry points were read
+        self.installed = set()
+        # (os, program): [(command regex, parser), ...]
+        self.commands = {}
+        self.lock = threading.Lock()
+
+    def install(self, os):
+        """Add the entry points of installed packages for os, once"""
+        if os in self.installed:
+            return False
+        self.installed.add(os)
+        declared = self.declared.setdefault(os, {})
+        added = {name: value for name, value in installed_parsers(os).items() if declared.get(name) != value}
+        declared.update(added)
+        for name in added:
+            self.commands.pop((os, name.partition(".")[0]), None)
+        return bool(added)
+
+    def matchers(self, os, program):
+        matchers = self.commands.get((os, program))
+        if matchers is None:
+            matchers = self.commands[(os, program)] = []
+            for name, value in self.declared.get(os, {}).items():
+                if name.partition(".")[0] == program:
+                    parser = load_parser(value)
+                    matchers.extend((command_re(template), parser) for template in parser.cli_command)
+        return matchers
+
+    def find(self, command, os="linux"):
+        """The parser class of command, None if none is declared"""
+        program = command.split(None, 1)[0] if command.strip() else ""
+        with self.lock:
+            while True:
+                for regex, parser in self.matchers(os, program):
+                    if regex.fullmatch(command):
+                        return parser
+                if not self.install(os):
+                    return None
+
+    def parsers(self, os="linux"):
+        """Every parser declared for os, all imported"""
+        with self.lock:
+            self.install(os)
+            values = list(self.declared.get(os, {}).values())
+        return [load_parser(value) for value in values]
+
+
+REGISTRY = Registry()
+
+
+def find_parser(command, os="linux"):
+    return REGISTRY.find(command, os)
+
+
+def run_parser(parser, device, output, **kwargs):
+    """parser(device=device).cli(output=output, **kwargs), validated
+    against parser.schema as MetaParser.parse() validates it
+
+    Results that are not dicts, such as columnar ones, are not checked.
+    Raises genie's SchemaError when the result does not match.
+    """
+    result = parser(device=device).cli(output=output, **kwargs)
+    schema = getattr(parser, "schema", None)
+    if schema and isinstance(result, dict):
+        from genie.metaparser.util.schemaengine import Schema
+
+        Schema(schema).validate(result)
+    return result
+
+
+def parse(device, command, output=None, cache=None, **kwargs):
+    """Parse command on device with its declared parser
+
+    As device.parse(command, output=output), schema validation included,
+    without importing genie's parser library: the parser module alone is,
+    on first use. Commands without a declared parser go to device.parse().
+    cache, a ParseCache, keeps results by output, validated once; genie's
+    fuzzy is ignored.
+    """
+    parser = REGISTRY.find(command, getattr(device, "os", None) or "linux")
+    if parser is None:
+        return device.parse(command, output=output, **kwargs)
+    kwargs.pop("fuzzy", None)
+    if output is None:
+        output = device.execute(command)
+    if cache is not None:
+        return cache.parse(parser, output, device, **kwargs)
+    return run_parser(parser, device, output, **kwargs)
+
+
+def register(os="linux"):
+    """Add every declared parser to genie's, for device.parse()
+
+    Imports genie's parser library and all declared parser modules, which
+    is what parse() saves a short job, so call it only where device.parse()
+    must know them.
+    """
+    from genie import abstract
+    from genie.libs.parser.utils.entry_points import add_parser
+
+    parsers = REGISTRY.parsers(os)
+    # genie looks parser classes up through their package, which must be
+    # declared to it
+    for package in {parser.__module__.partition(".")[0] for parser in parsers}:
+        abstract.declare_package(package)
+        abstract.declare_token(package)
+    for parser in parsers:
+        add_parser(parser, os)
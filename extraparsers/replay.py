@@ -0,0 +1,165 @@
+""" replay.py
+
+Offline record and replay of command output:
+    * Recorder wraps a live device and keeps what its commands return
+    * save_recording/load_recording store outputs in one gzipped JSON file,
+      each distinct output once
+    * ReplayDevice serves recorded outputs to execute() and parse()
+    * ParseCache keeps parsed results by parser and output content
+"""
+
+# Python
+import gzip
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+# Parsers declared by command
+from .registry import find_parser, run_parser
+
+RECORDING_VERSION = 1
+
+
+def output_digest(output):
+    return hashlib.blake2b(output.encode(), digest_size=16).hexdigest()
+
+
+def save_recording(path, entries):
+    """Write (device, command, output) entries, in order"""
+    outputs = {}
+    rows = []
+    for device, command, output in entries:
+        digest = output_digest(output)
+        outputs.setdefault(digest, output)
+        rows.append([device, command, digest])
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump({"version": RECORDING_VERSION, "outputs": outputs, "entries": rows}, f)
+
+
+def load_recording(path):
+    """The (device, command, output) entries saved at path"""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        recording = json.load(f)
+    if recording.get("version") != RECORDING_VERSION:
+        raise ValueError(f"{path}: unsupported recording version {recording.get('version')}")
+    outputs = recording["outputs"]
+    return [(device, command, outputs[digest]) for device, command, digest in recording["entries"]]
+
+
+class Recorder(object):
+    """A device whose execute() and parse() outputs are kept in entries
+
+    Everything else is passed through to the device. Several recorders
+    can share one entries list, to save a run over many devices at once.
+    """
+
+    def __init__(self, device, entries=None):
+        self.device = device
+        self.entries = [] if entries is None else entries
+
+    def __getattr__(self, name):
+        return getattr(self.device, name)
+
+    def execute(self, command, *args, **kwargs):
+        output = self.device.execute(command, *args, **kwargs)
+        self.entries.append((self.device.name, command, output))
+        return output
+
+    def parse(self, command, output=None, **kwargs):
+        if output is None:
+            output = self.execute(command)
+        return self.device.parse(command, output=output, **kwargs)
+
+    def save(self, path):
+        save_recording(path, self.entries)
+
+
+class ParseCache(object):
+    """Parsed results by parser, options and output content, LRU
+
+    Results are shared between callers, so treat them as read-only.
+    """
+
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self.results = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def parse(self, parser, output, device=None, **kwargs):
+        """run_parser(parser, device, output, **kwargs), or its cached result"""
+        key = (parser.__module__, parser.__qualname__, tuple(sorted(kwargs.items())), output_digest(output))
+        with self.lock:
+            if key in self.results:
+                self.hits += 1
+                self.results.move_to_end(key)
+                return self.results[key]
+            self.misses += 1
+
+        result = run_parser(parser, device, output, **kwargs)
+        with self.lock:
+            self.results[key] = result
+            while len(self.results) > self.maxsize:
+                self.results.popitem(last=False)
+        return result
+
+
+class ReplayDevice(object):
+    """Stand-in for a device, answering with recorded outputs
+
+    execute() returns the outputs recorded for a command in turn, the last
+    one again once they run out. parse() runs the parser given for the
+    command, or else the one declared for it (see registry.py), through
+    cache if given, and validates the result against the parser's schema;
+    parser options such as columnar are passed on and genie's fuzzy is
+    ignored.
+    """
+
+    def __init__(self, name, entries, parsers=(), cache=None, os="linux"):
+        self.name = name
+        self.os = os
+        self.outputs = {}
+        for device, command, output in entries:
+            if device == name:
+                self.outputs.setdefault(command, []).append(output)
+        self.served = {}
+        self.parsers = {parser.cli_command[0]: parser for parser in parsers}
+        self.cache = cache
+        self.connected = False
+
+    def connect(self, *args, **kwargs):
+        self.connected = True
+
+    def disconnect(self):
+        self.connected = False
+
+    def is_connected(self):
+        return self.connected
+
+    def execute(self, command, *args, **kwargs):
+        outputs = self.outputs.get(command)
+        if not outputs:
+            raise KeyError(f"{self.name}: no recorded output for {command!r}")
+        i = self.served.get(command, 0)
+        self.served[command] = i + 1
+        return outputs[min(i, len(outputs) - 1)]
+
+    def parse(self, command, output=None, **kwargs):
+        parser = self.parsers.get(command) or find_parser(command, self.os)
+        if parser is None:
+            raise KeyError(f"{self.name}: no parser for {command!r}")
+        if output is None:
+            output = self.execute(command)
+        kwargs.pop("fuzzy", None)
+        if self.cache is not None:
+            return self.cache.parse(parser, output, self, **kwargs)
+        return run_parser(parser, self, output, **kwargs)
+
+
+def replay_devices(path, parsers=(), cache=None):
+    """ReplayDevice for every device of the recording at path, by name"""
+    entries = load_recording(path)
+    names = dict.fromkeys(device for device, _, _ in entries)
+    return {name: ReplayDevice(name, entries, parsers, cache) for name in names}
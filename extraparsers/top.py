@@ -1,18 +1,264 @@
 """ top.py
 
-Linux parser for the following command:
+Linux parser for the following commands:
     * top -n 1 -b
+    * top -b -d <delay> -n <iterations>
 """
 
 # Python
 import re
+from array import array
+from collections import deque
 
 # Metaparser
 from genie.metaparser import MetaParser
 from genie.metaparser.util.schemaengine import Schema, Any, Optional
 
-# parser utils
-from genie.libs.parser.utils.common import Common
+# genie's device.parse() needs the package of its parsers declared
+from . import declare
+
+declare()
+
+
+# Header of the process table, and the fields of each of its rows
+TOP_COLUMNS = ["PID", "USER", "PR", "NI", "VIRT", "RES", "SHR", "S", "%CPU", "%MEM", "TIME+", "COMMAND"]
+TOP_ROW_RE = re.compile(
+    r"^(?P<pid>\d+)\s+(?P<user>\S+)\s+(?P<pr>\d+)"
+    + r"\s+(?P<ni>-?\d+)\s+(?P<virt>\d+)\s+(?P<res>\d+)\s+(?P<shr>\d+)"
+    + r"\s+(?P<s>\S)\s+(?P<cpu>\d+\.\d)\s+(?P<mem>\d+\.\d)\s+(?P<time>\d+:\d+\.\d+)"
+    + r"\s+(?P<command>\S+)$"
+)
+
+# Summary lines above the process table
+SUMMARY_TOP_RE = re.compile(
+    r"^top - (?P<time>\S+) up\s+(?P<uptime>.*?),\s+(?P<users>\d+) users?,"
+    + r"\s+load average: (?P<load_1>[\d.]+),? (?P<load_5>[\d.]+),? (?P<load_15>[\d.]+)$"
+)
+SUMMARY_TASKS_RE = re.compile(
+    r"^(?:Tasks|Threads):\s+(?P<total>\d+) total,\s+(?P<running>\d+) running,"
+    + r"\s+(?P<sleeping>\d+) sleeping,\s+(?P<stopped>\d+) stopped,\s+(?P<zombie>\d+) zombie$"
+)
+SUMMARY_CPU_RE = re.compile(r"^%Cpu\(s\):(?P<fields>.*)$")
+SUMMARY_MEM_RE = re.compile(r"^(?P<unit>[KMGTPE]i?B) (?P<kind>Mem|Swap)\s*:(?P<fields>.*)$")
+# "6.2 sy", "2434.9 free", "1201.7 buff/cache", "3380.2 avail Mem"
+SUMMARY_FIELD_RE = re.compile(r"(\d+(?:\.\d+)?) ([a-z/]+(?: Mem)?)")
+
+# Each column of the process table joined by newlines, as TOP_ROW_RE takes
+# its fields; USER and COMMAND are any token and S is checked by length
+INT_COLUMN_RE = re.compile(r"(?:\d+\n)*")
+FLOAT_COLUMN_RE = re.compile(r"(?:\d+\.\d\n)*")
+COLUMN_RES = (
+    INT_COLUMN_RE, None, INT_COLUMN_RE, re.compile(r"(?:-?\d+\n)*"), INT_COLUMN_RE, INT_COLUMN_RE, INT_COLUMN_RE,
+    None, FLOAT_COLUMN_RE, FLOAT_COLUMN_RE, re.compile(r"(?:\d+:\d+\.\d+\n)*"), None,
+)
+
+
+def iter_rows(out):
+    """Yield the 12 fields of each process row of 'top -b' output, as str"""
+    for line in out.splitlines():
+        m = TOP_ROW_RE.match(line.strip())
+        if m:
+            yield m.groups()
+
+
+def parse_rows(out):
+    """Process rows of 'top -b' output as {pid: fields}, first row per pid"""
+    procs = {}
+    for pid, user, pr, ni, virt, res, shr, s, cpu, mem, time, command in iter_rows(out):
+        if pid not in procs:
+            procs[pid] = {
+                "user": user,
+                "pr": int(pr),
+                "ni": int(ni),
+                "virt": int(virt),
+                "res": int(res),
+                "shr": int(shr),
+                "s": s,
+                "cpu": float(cpu),
+                "mem": float(mem),
+                "time": time,
+                "command": command,
+            }
+
+    return procs
+
+
+def table_columns(out, fast=True):
+    """The 12 columns of the process rows of 'top -b' output, lists of str
+
+    With fast set, a table under the standard header that holds nothing but
+    valid rows and blank lines is split in one go and each column checked
+    with a single regex. Anything else gets the columns of iter_rows().
+    """
+    lines = out.splitlines()
+    header = None
+    if fast:
+        for i, line in enumerate(lines):
+            if line.split() == TOP_COLUMNS:
+                header = i
+                break
+
+    # Rows before the header (never in real output) are left to iter_rows
+    if header is not None and not any(TOP_ROW_RE.match(line.strip()) for line in lines[:header]):
+        table = lines[header + 1:]
+        if set(map(len, map(str.split, table))) <= {0, len(TOP_COLUMNS)}:
+            # One flat list of tokens rather than a list per row
+            tokens = "\n".join(table).split()
+            columns = [tokens[i::len(TOP_COLUMNS)] for i in range(len(TOP_COLUMNS))]
+            if len("".join(columns[7])) == len(columns[7]) and all(
+                column_re.fullmatch("\n".join(column) + "\n")
+                for column_re, column in zip(COLUMN_RES, columns)
+                if column_re
+            ):
+                return columns
+
+    return [list(column) for column in zip(*iter_rows(out))] or [[] for _ in TOP_COLUMNS]
+
+
+def intern_column(values):
+    """Codes ('i' array) of values into the table of their distinct values"""
+    table = list(dict.fromkeys(values))
+    codes = {value: i for i, value in enumerate(table)}
+    return array("i", map(codes.__getitem__, values)), table
+
+
+class TopColumns(object):
+    """Process table of 'top -b' output as parallel columns
+
+    Built from the 12 str columns of table_columns(). pid, pr, ni, virt,
+    res and shr are int arrays and cpu and mem float arrays, one entry per
+    process in output order. user, s and command hold codes into the
+    users, states and commands tables, and time the TIME+ strings. Arrays
+    support the buffer protocol, so for instance
+    numpy.frombuffer(cols.res, dtype="q") wraps a column without copying.
+    """
+
+    INT_COLUMNS = (("pr", "i"), ("ni", "i"), ("virt", "q"), ("res", "q"), ("shr", "q"))
+    FLOAT_COLUMNS = ("cpu", "mem")
+
+    def __init__(self, columns):
+        # Only the first row of a pid is kept, as in the schema dict
+        self.pid = array("q", map(int, columns[0]))
+        if len(set(self.pid)) < len(self.pid):
+            first = {}
+            for i, pid in enumerate(self.pid):
+                first.setdefault(pid, i)
+            columns = [[column[i] for i in first.values()] for column in columns]
+            self.pid = array("q", first)
+        pid, user, pr, ni, virt, res, shr, s, cpu, mem, time, command = columns
+
+        for (name, typecode), column in zip(self.INT_COLUMNS, (pr, ni, virt, res, shr)):
+            setattr(self, name, array(typecode, map(int, column)))
+        for name, column in zip(self.FLOAT_COLUMNS, (cpu, mem)):
+            setattr(self, name, array("d", map(float, column)))
+        self.user, self.users = intern_column(user)
+        self.s, self.states = intern_column(s)
+        self.command, self.commands = intern_column(command)
+        self.time = time
+
+    def __len__(self):
+        return len(self.pid)
+
+    def to_dict(self):
+        """The same result as Top.cli() without columnar, per TopSchema
+
+        Keys are str(pid), which is the PID column as top prints it.
+        """
+        users, states, commands = self.users, self.states, self.commands
+        procs = {
+            str(pid): {
+                "user": users[user],
+                "pr": pr,
+                "ni": ni,
+                "virt": virt,
+                "res": res,
+                "shr": shr,
+                "s": states[s],
+                "cpu": cpu,
+                "mem": mem,
+                "time": time,
+                "command": commands[command],
+            }
+            for pid, user, pr, ni, virt, res, shr, s, cpu, mem, time, command in zip(
+                self.pid, self.user, self.pr, self.ni, self.virt, self.res, self.shr,
+                self.s, self.cpu, self.mem, self.time, self.command,
+            )
+        }
+        return {"pid": procs} if procs else {}
+
+
+def iter_lines(chunks):
+    """Lines of output that arrives as chunks of text split anywhere"""
+    pending = ""
+    for chunk in chunks:
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+    if pending:
+        yield pending.rstrip("\r")
+
+
+def summary_fields(fields):
+    return {name.lower().replace(" ", "_").replace("/", "_"): float(value)
+            for value, name in SUMMARY_FIELD_RE.findall(fields)}
+
+
+def parse_snapshot(lines, columnar=False):
+    """One iteration of 'top -b' output, from its 'top -' line on
+
+    The summary lines down to the first blank line are parsed into time,
+    uptime, users, load_average, tasks, cpu, mem and swap; the process
+    table below is parsed as by Top, or into TopColumns if columnar is set.
+    """
+    # Init vars
+    snapshot = {}
+
+    for i, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            break
+
+        m = SUMMARY_TOP_RE.match(line)
+        if m:
+            group = m.groupdict()
+            snapshot["time"] = group["time"]
+            snapshot["uptime"] = group["uptime"]
+            snapshot["users"] = int(group["users"])
+            snapshot["load_average"] = {
+                "1min": float(group["load_1"]),
+                "5min": float(group["load_5"]),
+                "15min": float(group["load_15"]),
+            }
+            continue
+
+        m = SUMMARY_TASKS_RE.match(line)
+        if m:
+            snapshot["tasks"] = {key: int(value) for key, value in m.groupdict().items()}
+            continue
+
+        m = SUMMARY_CPU_RE.match(line)
+        if m:
+            snapshot["cpu"] = summary_fields(m.group("fields"))
+            continue
+
+        m = SUMMARY_MEM_RE.match(line)
+        if m:
+            memory = snapshot.setdefault(m.group("kind").lower(), {"unit": m.group("unit")})
+            memory.update(summary_fields(m.group("fields")))
+    else:
+        # No blank line: leave every line to the table parser
+        i = 0
+
+    table = "\n".join(lines[i:])
+    if columnar:
+        snapshot["pid"] = TopColumns(table_columns(table))
+    else:
+        procs = parse_rows(table)
+        if procs:
+            snapshot["pid"] = procs
+
+    return snapshot
 
 
 # ===========================
@@ -49,7 +295,7 @@ class Top(TopSchema):
 
     cli_command = ["top -n 1 -b"]
 
-    def cli(self, output=None):
+    def cli(self, output=None, columnar=False):
         if output is None:
             command = self.cli_command[0]
             out = self.device.execute(command)
@@ -74,26 +320,133 @@ class Top(TopSchema):
           4 root       0 -20       0      0      0 I   0.0   0.0   0:00.00 rcu_par_gp
           5 root       0 -20       0      0      0 I   0.0   0.0   0:00.00 slub_flushwq
         """
-        p1 = re.compile(
-            r"^(?P<pid>\d+)\s+(?P<user>\S+)\s+(?P<pr>\d+)"
-            + r"\s+(?P<ni>-?\d+)\s+(?P<virt>\d+)\s+(?P<res>\d+)\s+(?P<shr>\d+)"
-            + r"\s+(?P<s>\S)\s+(?P<cpu>\d+\.\d)\s+(?P<mem>\d+\.\d)\s+(?P<time>\d+:\d+\.\d+)"
-            + r"\s+(?P<command>\S+)$"
-        )
-
-        for line in out.splitlines():
-            line = line.strip()
-
-            m = p1.match(line)
-            if m:
-                groups = m.groupdict()
-                pid = groups["pid"]
-                del groups["pid"]
-                for keyname in ("pr", "ni", "virt", "res", "shr"):
-                    groups[keyname] = int(groups[keyname])
-                for keyname in ("cpu", "mem"):
-                    groups[keyname] = float(groups[keyname])
-
-                parsed_dict.setdefault("pid", {}).setdefault(pid, groups)
+        # Columns instead of the schema dict, see TopColumns
+        if columnar:
+            return TopColumns(table_columns(out))
+
+        procs = parse_rows(out)
+        if procs:
+            parsed_dict["pid"] = procs
+
+        return parsed_dict
+
+
+# ==============================================
+# Schema for 'top -b -d <delay> -n <iterations>'
+# ==============================================
+class TopBatchSchema(MetaParser):
+    """Schema for "top -b -d <delay> -n <iterations>" """
+
+    schema = {
+        "snapshot": {
+            Any(): {
+                Optional("time"): str,  # time of day of the sample
+                Optional("uptime"): str,  # time since boot, as top prints it
+                Optional("users"): int,  # logged in users
+                Optional("load_average"): {
+                    "1min": float,
+                    "5min": float,
+                    "15min": float,
+                },
+                Optional("tasks"): {
+                    "total": int,
+                    "running": int,
+                    "sleeping": int,
+                    "stopped": int,
+                    "zombie": int,
+                },
+                Optional("cpu"): {
+                    Any(): float,  # share of CPU time per state: us, sy, ni, id, ...
+                },
+                Optional("mem"): {
+                    "unit": str,  # KiB, MiB, ...
+                    Any(): float,  # total, free, used, buff_cache
+                },
+                Optional("swap"): {
+                    "unit": str,
+                    Any(): float,  # total, free, used, avail_mem
+                },
+                Optional("pid"): TopSchema.schema["pid"],
+            }
+        }
+    }
+
+
+# ==============================================
+# Parser for 'top -b -d <delay> -n <iterations>'
+# ==============================================
+class TopBatch(TopBatchSchema):
+
+    '''Parser for "top -b -d <delay> -n <iterations>"
+
+    Output is consumed as it arrives: iter_snapshots() takes the chunks of
+    a stream and yields one snapshot per 'top -' line. Only the last
+    history snapshots are kept, in self.history, so long runs do not grow.
+    '''
+
+    cli_command = ["top -b -d {delay} -n {iterations}"]
+
+    def __init__(self, *args, history=60, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.history = deque(maxlen=history)
+        self.count = 0
+
+    def iter_snapshots(self, chunks, columnar=False):
+        """Yield each snapshot of the output, as parse_snapshot() gives it
+
+        A snapshot is complete once the next 'top -' line, or the end of
+        the output, arrives.
+        """
+        lines = []
+        for line in iter_lines(chunks):
+            if line.startswith("top - "):
+                if lines:
+                    yield self.record(parse_snapshot(lines, columnar))
+                lines = [line]
+            elif lines:
+                # Anything before the first 'top -' line is not a snapshot
+                lines.append(line)
+        if lines:
+            yield self.record(parse_snapshot(lines, columnar))
+
+    def record(self, snapshot):
+        self.history.append(snapshot)
+        self.count += 1
+        return snapshot
+
+    def cli(self, delay=1, iterations=1, output=None, columnar=False):
+        if output is None:
+            command = self.cli_command[0].format(delay=delay, iterations=iterations)
+            out = self.device.execute(command)
+        else:
+            out = output
+
+        # Init vars
+        parsed_dict = {}
+
+        """ Sample output
+        top - 13:03:02 up  3:53,  1 user,  load average: 0.00, 0.05, 0.07
+        Tasks: 158 total,   1 running, 157 sleeping,   0 stopped,   0 zombie
+        %Cpu(s):  0.0 us,  6.2 sy,  0.0 ni, 93.8 id,  0.0 wa,  0.0 hi,  0.0 si,  0.0 st
+        MiB Mem :   3924.3 total,   2434.9 free,    287.7 used,   1201.7 buff/cache
+        MiB Swap:    923.3 total,    923.3 free,      0.0 used.   3380.2 avail Mem
+
+            PID USER      PR  NI    VIRT    RES    SHR S  %CPU  %MEM     TIME+ COMMAND
+           2936 yuanl     20   0   11872   3764   3308 R   6.2   0.1   0:00.02 top
+              1 root      20   0  101536  11020   8124 S   0.0   0.3   0:01.86 systemd
+
+        top - 13:03:03 up  3:53,  1 user,  load average: 0.00, 0.05, 0.07
+        Tasks: 158 total,   1 running, 157 sleeping,   0 stopped,   0 zombie
+        ...
+        """
+        # Output may also be an iterable of chunks, such as a stream
+        chunks = [out] if isinstance(out, str) else out
+        for _ in self.iter_snapshots(chunks, columnar):
+            pass
+
+        # Snapshots are numbered from 1 over the whole output
+        first = self.count - len(self.history) + 1
+        if self.history:
+            parsed_dict["snapshot"] = dict(enumerate(self.history, first))
 
         return parsed_dict
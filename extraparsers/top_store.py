@@ -0,0 +1,288 @@
+""" top_store.py
+
+Time series of per-process metrics fed by Top and ProcStat results:
+    * TopStore keeps %CPU, %MEM, RES and VIRT of every process of every
+      device in fixed-size rings, older samples downsampled into coarser
+      rings, in flat arrays shared by all processes
+    * a pid taken over by another process starts a new series
+    * queries: top_cpu, percentile, growth and growing (leak detection)
+"""
+
+# Python
+import heapq
+import time
+from array import array
+
+# The metrics kept of each sample, and their typecodes: RES is in KiB, so
+# 'I' goes up to 4 TiB, but VIRT can be larger
+METRICS = (("cpu", "f"), ("mem", "f"), ("res", "I"), ("virt", "q"))
+
+
+def time_centis(value):
+    """TIME+ ('12:34.56') in hundredths of a second"""
+    minutes, _, seconds = value.partition(":")
+    return int(minutes) * 6000 + round(float(seconds) * 100)
+
+
+def iter_processes(parsed):
+    """Yield (pid, user, command, time, cpu, mem, res, virt) of each process
+
+    parsed is a Top or ProcStat result, a TopSchema dict, or the TopColumns
+    of Top.cli(columnar=True).
+    """
+    if isinstance(parsed, dict):
+        for pid, proc in parsed.get("pid", {}).items():
+            yield (int(pid), proc["user"], proc["command"], proc["time"],
+                   proc["cpu"], proc["mem"], proc["res"], proc["virt"])
+        return
+    users, commands = parsed.users, parsed.commands
+    for pid, user, command, cputime, cpu, mem, res, virt in zip(
+        parsed.pid, parsed.user, parsed.command, parsed.time, parsed.cpu, parsed.mem, parsed.res, parsed.virt,
+    ):
+        yield pid, users[user], commands[command], cputime, cpu, mem, res, virt
+
+
+def weighted_mean(points):
+    total = sum(weight for _, _, weight in points)
+    return sum(value * weight for _, value, weight in points) / total if total else None
+
+
+class TopStore(object):
+    """Per-device, per-process metrics of successive top samples
+
+    Each process has levels rings of size samples. Every sample goes into
+    the first; each factor samples of a ring are averaged into one of the
+    next, so with the defaults, sampling every 5 seconds, the rings hold
+    the last 30 seconds as sampled, then 3 minutes, 18 minutes and 1.8
+    hours of 30 second, 3 minute and 18 minute means.
+
+    The rings of all processes live in one array per level and metric, a
+    slot of size entries each, which costs 24 * size * levels bytes per
+    process (576 with the defaults) plus 64 of bookkeeping and its entry in
+    the pid dict of its device, instead of a dict per sample. Sample times
+    are 'f' seconds since the first sample, to the second for half a year.
+    Slots of exited processes are reused.
+
+    A process is told apart from an earlier one with its pid by its
+    command, its user and its TIME+, which never goes down: any of them
+    changing starts a new series. Processes not seen for expire seconds
+    are dropped.
+    """
+
+    def __init__(self, size=6, levels=4, factor=6, expire=600):
+        if size < factor:
+            raise ValueError(f"size ({size}) must be at least factor ({factor})")
+        self.size = size
+        self.levels = levels
+        self.factor = factor
+        self.expire = expire
+        self.epoch = None
+        # device: {pid: slot}, and the time of its last sample
+        self.devices = {}
+        self.last = {}
+        self.free = []
+        # User names and commands, interned
+        self.codes = {}
+        self.names = []
+        self.reused = 0
+
+        # Per slot
+        self.pid = array("q")
+        self.user = array("i")
+        self.command = array("i")
+        self.cputime = array("q")
+        self.seen = array("d")
+        self.count = [array("q") for _ in range(levels)]
+        # Per level, size entries per slot
+        self.rings = [
+            dict(t=array("f"), **{name: array(code) for name, code in METRICS})
+            for _ in range(levels)
+        ]
+
+    def intern(self, name):
+        code = self.codes.get(name)
+        if code is None:
+            code = self.codes[name] = len(self.names)
+            self.names.append(name)
+        return code
+
+    def allocate(self, pid, user, command):
+        if self.free:
+            slot = self.free.pop()
+        else:
+            slot = len(self.pid)
+            for column in (self.pid, self.user, self.command, self.cputime, self.seen, *self.count):
+                column.append(0)
+            for ring in self.rings:
+                for column in ring.values():
+                    column.extend(array(column.typecode, [0]) * self.size)
+        self.pid[slot] = pid
+        self.user[slot] = user
+        self.command[slot] = command
+        for count in self.count:
+            count[slot] = 0
+        return slot
+
+    def release(self, device, pid):
+        self.free.append(self.devices[device].pop(pid))
+
+    def add(self, device, parsed, timestamp=None):
+        """Record one sample of device, a Top or ProcStat result, taken at
+        timestamp (default: now)"""
+        now = time.time() if timestamp is None else timestamp
+        if self.epoch is None:
+            self.epoch = now
+        pids = self.devices.setdefault(device, {})
+        self.last[device] = now
+
+        for pid, user, command, cputime, cpu, mem, res, virt in iter_processes(parsed):
+            user, command, cputime = self.intern(user), self.intern(command), time_centis(cputime)
+            slot = pids.get(pid)
+            if slot is not None and (
+                self.command[slot] != command or self.user[slot] != user or self.cputime[slot] > cputime
+            ):
+                # Another process got the pid
+                self.release(device, pid)
+                self.reused += 1
+                slot = None
+            if slot is None:
+                slot = pids[pid] = self.allocate(pid, user, command)
+            self.cputime[slot] = cputime
+            self.seen[slot] = now
+            self.append(slot, 0, now - self.epoch, (cpu, mem, res, virt))
+
+        for pid, slot in list(pids.items()):
+            if now - self.seen[slot] > self.expire:
+                self.release(device, pid)
+
+    def append(self, slot, level, t, values):
+        ring = self.rings[level]
+        count = self.count[level]
+        base = slot * self.size
+        i = base + count[slot] % self.size
+        ring["t"][i] = t
+        for (name, _), value in zip(METRICS, values):
+            ring[name][i] = value
+        count[slot] += 1
+
+        # Roll the last factor samples up into the next level: entry m of
+        # a level is the mean of entries m * factor to m * factor + factor - 1
+        # of the one before, time included
+        if level + 1 < self.levels and count[slot] % self.factor == 0:
+            group = [base + (count[slot] - k) % self.size for k in range(1, self.factor + 1)]
+            means = []
+            for name, code in (("t", "f"),) + METRICS:
+                mean = sum(ring[name][j] for j in group) / self.factor
+                means.append(mean if code == "f" else round(mean))
+            self.append(slot, level + 1, means[0], means[1:])
+
+    def points(self, slot, metric, since=None):
+        """(time, value, weight) of the samples of a slot from since on,
+        oldest first, times relative to epoch
+
+        Each level adds the means of samples that the finer one no longer
+        holds; weight is the number of samples a point is the mean of.
+        Every sample still held counts once: a level holding only part of a
+        group of factor entries leaves all of it to the next level's mean.
+        """
+        if since is not None:
+            since -= self.epoch
+        points = []
+        weight = 1
+        # Entries of the current level before this one are older than what
+        # the finer levels hold
+        stop = None
+        base = slot * self.size
+        for level, (ring, count) in enumerate(zip(self.rings, self.count)):
+            end = count[slot] if stop is None else min(count[slot], stop)
+            start = max(count[slot] - self.size, 0)
+            if level + 1 < self.levels:
+                # The oldest entries of a group the ring has partly overwritten
+                # are only in the group's mean, a level up: start at the next
+                # whole group, which size >= factor keeps within the ring
+                start = -(-start // self.factor) * self.factor
+            t, values = ring["t"], ring[metric]
+            level_points = []
+            for k in range(start, end):
+                i = base + k % self.size
+                if since is None or t[i] >= since:
+                    level_points.append((t[i], values[i], weight))
+            points[:0] = level_points
+            if since is not None and len(level_points) < end - start:
+                break
+            stop = start // self.factor
+            weight *= self.factor
+        return points
+
+    def since(self, device, window, now=None):
+        if window is None:
+            return None
+        return (self.last.get(device, 0.0) if now is None else now) - window
+
+    def processes(self, device):
+        """pid: command of each process of device still tracked"""
+        return {pid: self.names[self.command[slot]] for pid, slot in self.devices.get(device, {}).items()}
+
+    def series(self, device, pid, metric="cpu", window=None, now=None):
+        """(time, value) of a process over the last window seconds before
+        now (default: the last sample of device), oldest first"""
+        slot = self.devices.get(device, {}).get(pid)
+        if slot is None:
+            return []
+        return [(self.epoch + t, value) for t, value, _ in self.points(slot, metric, self.since(device, window, now))]
+
+    def top_cpu(self, device, n=10, window=60, now=None):
+        """The n processes of device with the highest mean %CPU over the
+        last window seconds, as (pid, command, cpu), highest first"""
+        since = self.since(device, window, now)
+        means = []
+        for pid, slot in self.devices.get(device, {}).items():
+            mean = weighted_mean(self.points(slot, "cpu", since))
+            if mean is not None:
+                means.append((mean, pid, self.names[self.command[slot]]))
+        return [(pid, command, mean) for mean, pid, command in heapq.nlargest(n, means)]
+
+    def percentile(self, device, pid, metric="cpu", q=95, window=None, now=None):
+        """The q-th percentile of metric for a process over the last window
+        seconds, each downsampled point counting for the samples it is the
+        mean of; None without samples"""
+        slot = self.devices.get(device, {}).get(pid)
+        if slot is None:
+            return None
+        points = sorted(self.points(slot, metric, self.since(device, window, now)), key=lambda p: p[1])
+        total = sum(weight for _, _, weight in points)
+        seen = 0
+        for _, value, weight in points:
+            seen += weight
+            if seen >= total * q / 100:
+                return value
+        return None
+
+    def growth(self, device, pid, metric="res", window=None, now=None):
+        """Least-squares slope of metric for a process over the last window
+        seconds, per second (KiB/s for res and virt); None without two
+        samples apart in time"""
+        slot = self.devices.get(device, {}).get(pid)
+        if slot is None:
+            return None
+        points = self.points(slot, metric, self.since(device, window, now))
+        if len(points) < 2:
+            return None
+        total = sum(weight for _, _, weight in points)
+        mean_t = sum(t * weight for t, _, weight in points) / total
+        mean_v = sum(value * weight for _, value, weight in points) / total
+        var = sum(weight * (t - mean_t) ** 2 for t, _, weight in points)
+        if not var:
+            return None
+        return sum(weight * (t - mean_t) * (value - mean_v) for t, value, weight in points) / var
+
+    def growing(self, device, min_rate, metric="res", window=3600, now=None):
+        """Processes of device whose metric grew by at least min_rate per
+        second over the last window seconds, as (pid, command, rate),
+        fastest first: leak candidates"""
+        found = []
+        for pid, slot in self.devices.get(device, {}).items():
+            rate = self.growth(device, pid, metric, window, now)
+            if rate is not None and rate >= min_rate:
+                found.append((pid, self.names[self.command[slot]], rate))
+        return sorted(found, key=lambda p: -p[2])
@@ -3,92 +3,420 @@
 # Usage: python3 proto2tree.py -i filtered.txtproto -o tree.html
 import argparse
 import html
+import io
 import json
+import os
 import re
 import sys
-from collections import defaultdict
+import time
+from functools import partial
 
-ENTITY_BLOCK_RE = re.compile(r'(?=^\s*entity\s*:\s*\{)', re.MULTILINE)
-REL_BLOCK_RE    = re.compile(r'(?=^\s*relationship\s*:\s*\{)', re.MULTILINE)
-
-ID_RE           = re.compile(r'^\s*id\s*:\s*"([^"]+)"\s*$', re.MULTILINE)
-NAME_RE         = re.compile(r'^\s*name\s*:\s*"([^"]+)"\s*$', re.MULTILINE)
-KIND_RE         = re.compile(r'^\s*kind\s*:\s*(RK_\w+)\s*$', re.MULTILINE)
-A_RE            = re.compile(r'^\s*a\s*:\s*"([^"]+)"\s*$', re.MULTILINE)
-Z_RE            = re.compile(r'^\s*z\s*:\s*"([^"]+)"\s*$', re.MULTILINE)
+from proto_index import load_index
+from proto_stats import TimedWriter, add_arguments, run_stats
+from textproto import map_records
+from wireproto import add_wire_arguments, input_wire_map
 
 def parse_args():
-    p = argparse.ArgumentParser(description="Render RK_CONTAINS hierarchy from a textproto into an interactive HTML tree.")
-    p.add_argument("-i", "--input", required=True, help="Input .txtproto file")
+    p = argparse.ArgumentParser(
+        description="Render RK_CONTAINS hierarchy from a textproto or binary protobuf into an interactive HTML tree.")
+    p.add_argument("-i", "--input", required=True, help="Input .txtproto or binary protobuf file")
     p.add_argument("-o", "--output", required=True, help="Output .html file")
+    p.add_argument("--layout", choices=("nested", "virtual"), default="nested",
+                   help="nested: one DOM node per tree node; virtual: flat payload, only visible rows rendered (for very large trees)")
+    p.add_argument("--shared", choices=("copy", "ref"), default="copy",
+                   help="Nodes with several parents: repeat in full under each (copy) or once, then as back-references (ref)")
+    p.add_argument("-j", "--jobs", type=int, default=1, help="Parse with N worker processes when there is no index")
+    p.add_argument("--no-index", action="store_true", help="Ignore <input>.idx and scan the whole file")
+    p.add_argument("--kinds", default="RK_CONTAINS",
+                   help="Comma-separated relationship kinds to render, one switchable view each (default: RK_CONTAINS)")
+    p.add_argument("--split", action="store_true",
+                   help="Write one file per kind, <output stem>.<kind>.html, instead of one page with a kind switcher")
+    add_wire_arguments(p)
+    add_arguments(p)
     return p.parse_args()
 
-def split_top_blocks(text):
-    starts = []
-    for m in ENTITY_BLOCK_RE.finditer(text):
-        starts.append(("entity", m.start()))
-    for m in REL_BLOCK_RE.finditer(text):
-        starts.append(("relationship", m.start()))
-    starts.sort(key=lambda t: t[1])
-
-    blocks = []
-    for i, (_, start) in enumerate(starts):
-        end = starts[i+1][1] if i+1 < len(starts) else len(text)
-        blocks.append(text[start:end].strip())
-    return blocks
-
-def extract_entity(block):
-    m_id = ID_RE.search(block)
-    if not m_id:
-        return None, None, None
-    eid = m_id.group(1)
-    m_name = NAME_RE.search(block)
-    name = m_name.group(1) if m_name else eid
-    m_kind = re.search(r'^\s*ek_([a-z0-9_]+)\s*:\s*\{', block, re.MULTILINE)
-    display_type = m_kind.group(1) if m_kind else ""
-    return eid, name, display_type
-
-def extract_relationship(block):
-    m_kind = KIND_RE.search(block)
-    if not m_kind:
-        return None
-    kind = m_kind.group(1)
-    m_a = A_RE.search(block)
-    m_z = Z_RE.search(block)
-    a = m_a.group(1) if m_a else None
-    z = m_z.group(1) if m_z else None
-    return kind, a, z
-
-def build_forest(entities, contains_edges):
-    children_map = defaultdict(list)
-    referenced = set()
-    parents = set()
-    all_ids = set(entities.keys())
+# Where write_page streams the payload and search index into a page
+DATA_SLOT = "\0data\0"
+SEARCH_SLOT = "\0search\0"
+# List items per json.dumps call when streaming a payload
+JSON_CHUNK = 16384
+
+# Flags walk_forest yields for nodes emitted without their children
+REF = 1
+CYCLE = 2
+
+def contains_graph(entities, contains_edges, ids=None):
+    """
+    Rank ids once in string order and return (ids, children, parent_of,
+    roots), everything else holding ranks, so children are sorted as
+    integers and every level comes out in the same order as sorting the ids.
+    ids, if given, is that sorted list already made, holding at least every
+    id of entities and contains_edges.
+    """
+    if ids is None:
+        ids = sorted(all_ids(entities, [contains_edges]))
+    rank = {eid: i for i, eid in enumerate(ids)}
 
+    children = [[] for _ in ids]
+    parent_of = [-1] * len(ids)
     for p, c in contains_edges:
         if p is None or c is None:
             continue
-        children_map[p].append(c)
-        parents.add(p)
-        referenced.add(c)
+        children[rank[p]].append(rank[c])
+        parent_of[rank[c]] = rank[p]
+    for kids in children:
+        if len(kids) > 1:
+            kids.sort()
 
     # Roots: parents not referenced as children + isolated entities
-    roots = (parents - referenced) | (all_ids - parents - referenced)
+    roots = [i for i, eid in enumerate(ids) if parent_of[i] < 0 and (children[i] or eid in entities)]
+    return ids, children, parent_of, roots
+
+def all_ids(entities, edge_lists):
+    ids = set(entities)
+    for edges in edge_lists:
+        for p, c in edges:
+            if p is not None and c is not None:
+                ids.add(p)
+                ids.add(c)
+    return ids
+
+def walk_forest(graph, shared="copy", cycles=None):
+    """
+    Yield (depth, rank, flag) for every node of the forest in pre-order,
+    without recursion.
+
+    shared="copy" repeats a node with several parents in full under each of
+    them; shared="ref" walks it the first time and yields it flagged REF,
+    without its children, after that. An edge back to a node on the current
+    path is a cycle: the node is yielded flagged CYCLE, and the cycle is
+    added to the cycles dict, if given, as the tuple of ids around it.
+    """
+    ids, children, parent_of, roots = graph
+    visited = bytearray(len(ids))
+    depth_of = [0] * len(ids)  # 1 + position on the current path, 0 if not on it
 
-    def make_node(eid):
+    def walk(root):
+        yield 0, root, 0
+        visited[root] = 1
+        path = [root]
+        stack = [iter(children[root])]
+        depth_of[root] = 1
+        while stack:
+            c = next(stack[-1], None)
+            if c is None:
+                stack.pop()
+                depth_of[path.pop()] = 0
+                continue
+            if depth_of[c]:
+                yield len(path), c, CYCLE
+                if cycles is not None:
+                    # Report each cycle once, rotated to start at its lowest id
+                    loop = path[depth_of[c] - 1:]
+                    start = loop.index(min(loop))
+                    cycles[tuple(ids[i] for i in loop[start:] + loop[:start])] = None
+            elif visited[c] and shared == "ref":
+                yield len(path), c, REF
+            else:
+                yield len(path), c, 0
+                visited[c] = 1
+                path.append(c)
+                depth_of[c] = len(path)
+                stack.append(iter(children[c]))
+
+    for root in roots:
+        yield from walk(root)
+
+    # Whatever is still unvisited hangs off a cycle no root leads to; start
+    # from the lowest id on that cycle. An id without parent or children
+    # here (one only another kind's edges name) is in no tree of this graph.
+    for i in range(len(ids)):
+        if visited[i]:
+            continue
+        seen = {}
+        while i not in seen and i >= 0:
+            seen[i] = len(seen)
+            i = parent_of[i]
+        if i >= 0:
+            yield from walk(min(list(seen)[seen[i]:]))
+
+def entity_table(entities, edge_lists):
+    """
+    The entity columns of a payload: every id of entities and edge_lists in
+    sorted order, its name ("" when it is just the id again) and a code
+    into the table of type names.
+    """
+    ids = sorted(all_ids(entities, edge_lists))
+    names = []
+    type_codes = {}
+    type_of = []
+    for eid in ids:
         info = entities.get(eid, {"name": eid, "type": ""})
-        return {
-            "id": eid,
-            "name": info.get("name", eid),
-            "type": info.get("type", ""),
-            "children": [make_node(cid) for cid in sorted(children_map.get(eid, []))]
-        }
+        name = info.get("name", eid)
+        names.append("" if name == eid else name)
+        type_of.append(type_codes.setdefault(info.get("type", ""), len(type_codes)))
+    return {"ids": ids, "names": names, "types": list(type_codes), "typeOf": type_of}
 
-    forest = [make_node(r) for r in sorted(roots)]
+def forest_columns(graph, shared="copy"):
+    """
+    The nodes of the forest of graph in pre-order as parallel arrays: entity
+    number, parent node (-1 for roots), subtree size (so the children of
+    node n start at n + 1 and each next sibling is size[child] further on)
+    and walk_forest's flag.
+
+    Returns (columns, cycles).
+    """
+    cycles = {}
+    node, parent, size, flags = [], [], [], []
+    path = []  # node numbers of the open ancestors
+    for depth, i, flag in walk_forest(graph, shared, cycles):
+        n = len(node)
+        while len(path) > depth:
+            j = path.pop()
+            size[j] = n - j
+        parent.append(path[-1] if path else -1)
+        node.append(i)
+        size.append(1)
+        flags.append(flag)
+        path.append(n)
+    for j in path:
+        size[j] = len(node) - j
+    return {"node": node, "parent": parent, "size": size, "flag": flags}, list(cycles)
+
+def flat_forest(entities, contains_edges, shared="copy"):
+    """
+    Build the forest as a columnar payload: entity_table() plus the
+    forest_columns() of its nodes.
+
+    Returns (payload, cycles).
+    """
+    table = entity_table(entities, [contains_edges])
+    columns, cycles = forest_columns(contains_graph(entities, contains_edges, table["ids"]), shared)
+    return dict(table, **columns), cycles
+
+def forest_views(entities, edges_by_kind, shared="copy"):
+    """
+    One forest per relationship kind over a single entity table, which is
+    built and ranked once: payload is entity_table() plus "views", a list
+    of {"kind": kind} and that kind's forest_columns().
+
+    Returns (payload, cycles), cycles mapping each kind to its cycles.
+    """
+    payload = entity_table(entities, edges_by_kind.values())
+    payload["views"] = []
+    cycles = {}
+    for kind, edges in edges_by_kind.items():
+        columns, cycles[kind] = forest_columns(contains_graph(entities, edges, payload["ids"]), shared)
+        payload["views"].append(dict(kind=kind, **columns))
+    return payload, cycles
+
+def build_forest(entities, contains_edges, shared="copy"):
+    """
+    Build the RK_CONTAINS forest as nested nodes. Nodes walk_forest flags
+    are childless and carry "ref": true or "cycle": true.
+
+    Returns (forest, cycles), each cycle a tuple of the ids around it.
+    """
+    payload, cycles = flat_forest(entities, contains_edges, shared)
+    return nest_forest(payload), cycles
+
+def nest_forest(payload):
+    """
+    Turn a flat_forest payload back into nested nodes.
+    """
+    ids, names, types, type_of = payload["ids"], payload["names"], payload["types"], payload["typeOf"]
+    forest = []
+    nodes = []
+    for ent, parent, flag in zip(payload["node"], payload["parent"], payload["flag"]):
+        node = {
+            "id": ids[ent],
+            "name": names[ent] or ids[ent],
+            "type": types[type_of[ent]],
+            "children": []
+        }
+        if flag == REF:
+            node["ref"] = True
+        elif flag == CYCLE:
+            node["cycle"] = True
+        (nodes[parent]["children"] if parent >= 0 else forest).append(node)
+        nodes.append(node)
     return forest
 
-def generate_html(forest, title="NMTS Containment Tree"):
-    data_json = json.dumps(forest, ensure_ascii=False)
+# Search tokens: runs of letters and digits, lowercased
+TOKEN_SPLIT_RE = re.compile(r"[\W_]+")
+
+def search_tokens(text):
+    for token in TOKEN_SPLIT_RE.split(text.lower()):
+        if token:
+            yield token
+
+def search_index(payload):
+    """
+    Token index over the id, name and type of every entity of a
+    flat_forest or forest_views payload, for the page to answer searches
+    by lookup.
+
+    tokens is sorted and shipped as one newline-separated string, which
+    JSON.parse reads far faster than an array of short digit strings such
+    as '0000042', and which the page scans for the tokens holding a query
+    term. postLen[k] entity numbers belong to token k,
+    following those of the tokens before it in post, ascending and
+    delta-encoded.
+    """
+    types = payload["types"]
+    postings = {}
+    for ent, (eid, name, type_code) in enumerate(zip(payload["ids"], payload["names"], payload["typeOf"])):
+        for token in {*search_tokens(eid), *search_tokens(name), *search_tokens(types[type_code])}:
+            postings.setdefault(token, []).append(ent)
+
+    tokens = sorted(postings)
+    post = []
+    post_len = []
+    for token in tokens:
+        ents = postings[token]
+        post_len.append(len(ents))
+        prev = 0
+        for ent in ents:
+            post.append(ent - prev)
+            prev = ent
+    return {"entities": len(payload["ids"]), "tokens": "\n".join(tokens), "postLen": post_len, "post": post}
+
+# Page-side search over search_index(), shared by both layouts.
+# makeSearch(search, entityOf, text): entityOf[n] is the entity number of
+# node n and text(n) its lowercased "id\nname\ntype". Returns query(q),
+# giving the node numbers whose text(n) has q as a substring, as before
+# the index. Each letter/digit run of q lies inside one token of every
+# text holding q, so the tokens holding the rarest run, found by scanning
+# the token string once, give every candidate; a q that is more than one
+# plain run is then checked as a substring on those candidates only.
+SEARCH_JS = r"""
+function makeSearch(search, entityOf, text) {
+  const E = search.entities;
+  const joined = search.tokens;
+  const post = search.post;
+  const T = search.postLen.length;
+  const postOff = new Int32Array(T + 1);
+  search.postLen.forEach((len, k) => { postOff[k + 1] = postOff[k] + len; });
+  // Token k is joined.slice(tokStart[k], tokStart[k + 1] - 1)
+  const tokStart = new Int32Array(T + 1);
+  for (let k = 1, pos = joined.indexOf("\n"); k < T; k++, pos = joined.indexOf("\n", pos + 1)) tokStart[k] = pos + 1;
+  tokStart[T] = joined.length + 1;
+
+  // Nodes of entity e: nodesOf[entStart[e]] up to nodesOf[entStart[e + 1]]
+  const entStart = new Int32Array(E + 1);
+  for (let n = 0; n < entityOf.length; n++) entStart[entityOf[n] + 1]++;
+  for (let e = 0; e < E; e++) entStart[e + 1] += entStart[e];
+  const nodesOf = new Int32Array(entityOf.length);
+  const fill = entStart.slice(0, E);
+  for (let n = 0; n < entityOf.length; n++) nodesOf[fill[entityOf[n]]++] = n;
+
+  // Token holding joined[pos]
+  function tokenAt(pos) {
+    let lo = 0, hi = T - 1;
+    while (lo < hi) {
+      const mid = (lo + hi + 1) >> 1;
+      if (tokStart[mid] <= pos) lo = mid; else hi = mid - 1;
+    }
+    return lo;
+  }
+
+  // Tokens that have term as a substring, each once
+  function tokensWith(term) {
+    const found = [];
+    for (let pos = joined.indexOf(term); pos >= 0; ) {
+      const k = tokenAt(pos);
+      found.push(k);
+      pos = k + 1 < T ? joined.indexOf(term, tokStart[k + 1]) : -1;
+    }
+    return found;
+  }
+
+  return function query(q) {
+    const terms = q.split(/[^\p{L}\p{N}]+/u).filter(Boolean);
+    let ents = [];
+    if (terms.length) {
+      // Walk the postings of the term with the fewest; the substring check
+      // below stands in for the others
+      let best = [], cost = Infinity;
+      for (const term of terms) {
+        const found = tokensWith(term);
+        let n = 0;
+        for (const k of found) n += postOff[k + 1] - postOff[k];
+        if (n < cost) {
+          best = found;
+          cost = n;
+        }
+      }
+      const seen = new Uint8Array(E);
+      for (const k of best) {
+        let e = 0;
+        for (let p = postOff[k]; p < postOff[k + 1]; p++) {
+          e += post[p];
+          if (!seen[e]) {
+            seen[e] = 1;
+            ents.push(e);
+          }
+        }
+      }
+      if (terms.length > 1 || terms[0] !== q) {
+        ents = ents.filter(e => text(nodesOf[entStart[e]]).includes(q));
+      }
+    } else {
+      // Nothing but separators: no token to look up
+      for (let e = 0; e < E; e++) {
+        if (entStart[e + 1] > entStart[e] && text(nodesOf[entStart[e]]).includes(q)) ents.push(e);
+      }
+    }
+    const nodes = [];
+    for (const e of ents) {
+      for (let p = entStart[e]; p < entStart[e + 1]; p++) nodes.push(nodesOf[p]);
+    }
+    return nodes;
+  };
+}
+
+function debounce(fn, ms) {
+  let timer = 0;
+  return (...args) => {
+    clearTimeout(timer);
+    timer = setTimeout(() => fn(...args), ms);
+  };
+}
+
+function showTiming(q, lookupMs, renderMs, count) {
+  const el = document.getElementById('timing');
+  if (!q) {
+    el.style.display = 'none';
+    return;
+  }
+  el.textContent = 'search "' + q + '": ' + lookupMs.toFixed(1) + ' ms lookup + ' + renderMs.toFixed(1) + ' ms render, ' + count + ' match' + (count === 1 ? '' : 'es');
+  el.style.display = '';
+}
+"""
+
+def kind_labels(payload):
+    """
+    Heading, kind switcher and footer kind list of a forest_views page. The
+    switcher is hidden when the page has a single kind.
+    """
+    kinds = [view["kind"] for view in payload["views"]]
+    heading = "Containment Hierarchy" if kinds == ["RK_CONTAINS"] else "Relationship Hierarchy"
+    options = "".join(f'<option value="{k}">{html.escape(kind)}</option>' for k, kind in enumerate(kinds))
+    hidden = ' style="display:none"' if len(kinds) < 2 else ""
+    switcher = f'<select id="kind" title="Relationship kind"{hidden}>{options}</select>'
+    return heading, switcher, html.escape(", ".join(kinds))
+
+def html_template(payload, title="NMTS Containment Tree"):
+    """
+    Page for a forest_views payload with one DOM node per tree node, for
+    write_page. A kind's tree is built the first time it is shown. Without
+    a search index the page searches by scanning every node.
+    """
+    # JSON in its own script element, JSON.parse'd at load: browsers parse
+    # object literals recursively and overflow on deep trees, and a huge
+    # string literal is slow to scan.
+    data_json, search_json = DATA_SLOT, SEARCH_SLOT
+    heading, switcher, kinds = kind_labels(payload)
     return f"""<!doctype html>
 <html lang="en">
 <head>
@@ -102,7 +430,7 @@ def generate_html(forest, title="NMTS Containment Tree"):
   h1 {{ font-size: 18px; margin: 0 8px 0 0; }}
   .controls {{ display: flex; gap: 8px; align-items: center; flex-wrap: wrap; }}
   input[type="search"] {{ padding: 8px 10px; border:1px solid var(--line); border-radius: 8px; min-width: 280px; }}
-  button {{ padding: 8px 10px; border:1px solid var(--line); background:#f9fafb; border-radius:8px; cursor:pointer; }}
+  button, select {{ padding: 8px 10px; border:1px solid var(--line); background:#f9fafb; border-radius:8px; cursor:pointer; }}
   #tree {{ padding: 16px 20px; }}
   ul.tree {{ list-style:none; padding-left: 18px; margin:0; border-left:1px dashed var(--line); }}
   .node {{ position: relative; margin: 4px 0; }}
@@ -130,15 +458,21 @@ def generate_html(forest, title="NMTS Containment Tree"):
   .leaf .caret {{ visibility: hidden; }}
   
   .hidden {{ display: none !important; }}
+  .view.filtering .node:not(.keep) {{ display: none; }}
   .match > .label {{ background: #fff7ed; outline: 1px solid #fed7aa; }}
   .muted {{ opacity: .6; }}
+  .ref-link {{ color: var(--muted); font-size: 12px; text-decoration: underline dotted; }}
+  .ref-link:hover {{ color: var(--accent); }}
+  .flash {{ background: #dbeafe; }}
   footer {{ padding: 12px 20px; border-top:1px solid var(--line); color: var(--muted); font-size: 12px; }}
+  #timing {{ position: fixed; right: 12px; bottom: 12px; padding: 4px 8px; border-radius: 6px; background: rgba(31,41,55,.85); color: #fff; font: 12px ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, monospace; pointer-events: none; }}
 </style>
 </head>
 <body>
 <header>
-  <h1>Containment Hierarchy</h1>
+  <h1>{heading}</h1>
   <div class="controls">
+    {switcher}
     <input id="search" type="search" placeholder="Search by name or id…">
     <button id="expandAll" title="Expand all nodes">Expand all</button>
     <button id="collapseAll" title="Collapse all nodes">Collapse all</button>
@@ -147,93 +481,164 @@ def generate_html(forest, title="NMTS Containment Tree"):
 </header>
 <div id="tree"></div>
 <footer>
-  Generated from textproto (RK_CONTAINS). Click a node label to expand/collapse. Use search to filter.
+  Generated from textproto ({kinds}). Click a node label to expand/collapse. Use search to filter.
 </footer>
 
+<div id="timing" style="display:none"></div>
+
+<script id="data" type="application/json">{data_json}</script>
+<script id="search-index" type="application/json">{search_json}</script>
 <script>
-const data = {data_json};
+const data = JSON.parse(document.getElementById('data').textContent);
+{SEARCH_JS}
 
-function buildTree(container, forest) {{
-  container.innerHTML = "";
-  const rootUL = document.createElement('ul');
-  rootUL.className = 'tree';
-  container.appendChild(rootUL);
+function createNode(view, n) {{
+  const ent = view.node[n];
+  const id = data.ids[ent];
+  const name = data.names[ent];
+  const type = data.types[data.typeOf[ent]];
+  const li = document.createElement('li');
+  li.className = 'node collapsed'; // start collapsed for non-leaves
+  li.dataset.id = id;
+  li.dataset.name = name.toLowerCase();
+  li.dataset.type = type.toLowerCase();
 
-  let count = 0;
+  const hasChildren = view.size[n] > 1;
+  if (!hasChildren) {{
+    li.classList.add('leaf');
+    li.classList.remove('collapsed');
+  }}
 
-  function createNode(node) {{
-    count++;
-    const li = document.createElement('li');
-    li.className = 'node collapsed'; // start collapsed for non-leaves
-    li.dataset.id = node.id;
-    li.dataset.name = (node.name || "").toLowerCase();
-    li.dataset.type = (node.type || "").toLowerCase();
+  const label = document.createElement('div');
+  label.className = 'label';
 
-    const hasChildren = Array.isArray(node.children) && node.children.length > 0;
-    if (!hasChildren) {{
-      li.classList.add('leaf');
-      li.classList.remove('collapsed');
-    }}
+  const caret = document.createElement('span');
+  caret.className = 'caret';
+  label.appendChild(caret);
 
-    const label = document.createElement('div');
-    label.className = 'label';
+  const title = document.createElement('span');
+  title.textContent = name || id;
+  label.appendChild(title);
 
-    const caret = document.createElement('span');
-    caret.className = 'caret';
-    label.appendChild(caret);
+  const idSpan = document.createElement('span');
+  idSpan.className = 'id';
+  idSpan.textContent = id;
+  label.appendChild(idSpan);
 
-    const title = document.createElement('span');
-    title.textContent = node.name || node.id;
-    label.appendChild(title);
+  if (type) {{
+    const typeSpan = document.createElement('span');
+    typeSpan.className = 'type';
+    typeSpan.textContent = type;
+    label.appendChild(typeSpan);
+  }}
 
-    const idSpan = document.createElement('span');
-    idSpan.className = 'id';
-    idSpan.textContent = node.id;
-    label.appendChild(idSpan);
+  // Back-references: the full subtree is shown where the node first appears
+  if (view.flag[n]) {{
+    li.classList.add('ref');
+    const link = document.createElement('span');
+    link.className = 'ref-link';
+    link.textContent = view.flag[n] === 2 ? "↻ cycle" : "↪ shown above";
+    link.title = "Jump to where this node is expanded";
+    link.addEventListener('click', (e) => {{
+      jumpTo(id);
+      e.stopPropagation();
+    }});
+    label.appendChild(link);
+  }}
 
-    if (node.type) {{
-      const type = document.createElement('span');
-      type.className = 'type';
-      type.textContent = node.type;
-      label.appendChild(type);
-    }}
+  li.appendChild(label);
 
-    li.appendChild(label);
+  let ul = null;
+  if (hasChildren) {{
+    ul = document.createElement('ul');
+    ul.className = 'tree';
+    // Start hidden explicitly to guarantee collapse
+    ul.style.display = 'none';
+    li.appendChild(ul);
+  }}
 
-    if (hasChildren) {{
-      const ul = document.createElement('ul');
-      ul.className = 'tree';
-      // Start hidden explicitly to guarantee collapse
+  // Click handler to toggle just this node
+  label.addEventListener('click', (e) => {{
+    if (!hasChildren) return;
+    const isCollapsed = li.classList.contains('collapsed');
+    if (isCollapsed) {{
+      li.classList.remove('collapsed');
+      ul.style.display = '';
+    }} else {{
+      li.classList.add('collapsed');
       ul.style.display = 'none';
-      node.children.forEach(child => ul.appendChild(createNode(child)));
-      li.appendChild(ul);
     }}
+    e.stopPropagation();
+  }});
 
-    // Click handler to toggle just this node
-    label.addEventListener('click', (e) => {{
-      if (!hasChildren) return;
-      const childUL = li.querySelector(':scope > ul.tree');
-      const isCollapsed = li.classList.contains('collapsed');
-      if (isCollapsed) {{
-        li.classList.remove('collapsed');
-        if (childUL) childUL.style.display = '';
-      }} else {{
-        li.classList.add('collapsed');
-        if (childUL) childUL.style.display = 'none';
-      }}
-      e.stopPropagation();
-    }});
+  return [li, ul];
+}}
 
-    return li;
+// Nodes come in pre-order, so a node's parent list already exists when it
+// is reached; no recursion, however deep the tree.
+function buildView(view) {{
+  view.el = document.createElement('div');
+  view.el.className = 'view';
+  const rootUL = document.createElement('ul');
+  rootUL.className = 'tree';
+  view.el.appendChild(rootUL);
+  const uls = [];
+  view.lis = [];
+  for (let n = 0; n < view.node.length; n++) {{
+    const [li, ul] = createNode(view, n);
+    view.lis.push(li);
+    uls.push(ul);
+    (view.parent[n] < 0 ? rootUL : uls[view.parent[n]]).appendChild(li);
   }}
+  document.getElementById('tree').appendChild(view.el);
+}}
+
+// One entry per relationship kind, all over the shared entity table. Per
+// node, in pre-order, lis holds its <li> once the view is built.
+const views = data.views;
+let view = null;
+
+function showView(k) {{
+  if (view) view.el.style.display = 'none';
+  view = views[k];
+  if (view.el) view.el.style.display = '';
+  else buildView(view);
+  const count = view.lis.length;
+  document.getElementById('stats').textContent = count + " node" + (count===1?"":"s");
+  searchFilter(document.getElementById('search').value);
+}}
 
-  forest.forEach(n => rootUL.appendChild(createNode(n)));
-  return count;
+function expandAncestors(li) {{
+  let p = li.parentElement;
+  while (p && p.id !== 'tree') {{
+    if (p.classList.contains('node')) {{
+      const ul = p.querySelector(':scope > ul.tree');
+      p.classList.remove('collapsed');
+      if (ul) ul.style.display = '';
+      p.classList.remove('hidden');
+    }}
+    p = p.parentElement;
+  }}
+}}
+
+function jumpTo(id) {{
+  const target = view.el.querySelector('.node:not(.ref)[data-id="' + CSS.escape(id) + '"]');
+  if (!target) return;
+  if (view.el.classList.contains('filtering') && !target.classList.contains('keep')) {{
+    document.getElementById('search').value = "";
+    searchFilter("");
+  }}
+  expandAncestors(target);
+  target.classList.remove('hidden');
+  target.scrollIntoView({{ block: 'center' }});
+  const label = target.querySelector(':scope > .label');
+  label.classList.add('flash');
+  setTimeout(() => label.classList.remove('flash'), 1200);
 }}
 
 function setAll(expand) {{
   // For every node with children, directly control its immediate UL visibility
-  document.querySelectorAll('#tree .node').forEach(li => {{
+  view.el.querySelectorAll('.node').forEach(li => {{
     if (li.classList.contains('leaf')) return;
     const ul = li.querySelector(':scope > ul.tree');
     if (!ul) return;
@@ -247,43 +652,68 @@ function setAll(expand) {{
   }});
 }}
 
+function nodeText(n) {{
+  const ent = view.node[n];
+  return (data.ids[ent] + "\\n" + data.names[ent] + "\\n" + data.types[data.typeOf[ent]]).toLowerCase();
+}}
+
+// The index is parsed after the tree is shown, not before, and each view
+// gets its query the first time it is searched
+let searchIndex;
+
+function getQuery() {{
+  if (searchIndex === undefined) searchIndex = JSON.parse(document.getElementById('search-index').textContent);
+  if (!view.query) {{
+    view.query = searchIndex
+      ? makeSearch(searchIndex, view.node, nodeText)
+      : (q) => view.lis.map((_, n) => n).filter(n => nodeText(n).includes(q));
+  }}
+  return view.query;
+}}
+
+// Only the matches and their ancestors are touched; CSS hides the rest
 function searchFilter(q) {{
   q = (q || "").trim().toLowerCase();
-  const nodes = Array.from(document.querySelectorAll('#tree .node'));
-  if (!q) {{
-    nodes.forEach(n => n.classList.remove('hidden','match'));
-    return;
+  const lis = view.lis;
+  const t0 = performance.now();
+  const matches = q ? getQuery()(q) : [];
+  const t1 = performance.now();
+
+  (view.touched || []).forEach(li => li.classList.remove('keep', 'match'));
+  const touched = view.touched = [];
+  view.el.classList.toggle('filtering', !!q);
+  const kept = new Uint8Array(lis.length);
+  function keep(n) {{
+    if (kept[n]) return;
+    kept[n] = 1;
+    lis[n].classList.add('keep');
+    touched.push(lis[n]);
   }}
-  nodes.forEach(n => {{
-    const name = n.dataset.name || "";
-    const id = n.dataset.id || "";
-    const type = n.dataset.type || "";
-    const isMatch = name.includes(q) || id.includes(q) || type.includes(q);
-    n.classList.toggle('match', isMatch);
-    n.classList.toggle('hidden', !isMatch);
+  matches.forEach(n => {{
+    keep(n);
+    lis[n].classList.add('match');
   }});
   // Ensure ancestors of matches are visible and expanded
-  nodes.filter(n => n.classList.contains('match')).forEach(n => {{
-    let p = n.parentElement;
-    while (p && p.id !== 'tree') {{
-      if (p.classList.contains('node')) {{
-        const ul = p.querySelector(':scope > ul.tree');
-        p.classList.remove('collapsed');
-        if (ul) ul.style.display = '';
-        p.classList.remove('hidden');
-      }}
-      p = p.parentElement;
+  const opened = new Uint8Array(lis.length);
+  matches.forEach(n => {{
+    for (let p = view.parent[n]; p >= 0 && !opened[p]; p = view.parent[p]) {{
+      opened[p] = 1;
+      keep(p);
+      lis[p].classList.remove('collapsed');
+      lis[p].querySelector(':scope > ul.tree').style.display = '';
     }}
   }});
+  showTiming(q, t1 - t0, performance.now() - t1, matches.length);
 }}
 
 (function init() {{
-  const container = document.getElementById('tree');
-  const count = buildTree(container, data);
-  document.getElementById('stats').textContent = count + " node" + (count===1?"":"s");
+  showView(0);
 
+  const kind = document.getElementById('kind');
+  kind.addEventListener('change', () => showView(+kind.value));
   const search = document.getElementById('search');
-  search.addEventListener('input', () => searchFilter(search.value));
+  search.addEventListener('input', debounce(() => searchFilter(search.value), 150));
+  setTimeout(getQuery, 0);
   document.getElementById('expandAll').addEventListener('click', () => setAll(true));
   document.getElementById('collapseAll').addEventListener('click', () => setAll(false));
 }})();
@@ -291,40 +721,461 @@ function searchFilter(q) {{
 </body>
 </html>"""
 
-def main():
-    args = parse_args()
-    try:
-        text = open(args.input, "r", encoding="utf-8").read()
-    except Exception as e:
-        sys.exit(f"Error reading input file: {e}")
+def virtual_html_template(payload, title="NMTS Containment Tree"):
+    """
+    Page for a forest_views payload where only the rows in view are in the
+    DOM, and a node's children become rows when it is expanded, for
+    write_page. Without a search index the page scans every entity.
+    """
+    data_json, search_json = DATA_SLOT, SEARCH_SLOT
+    heading, switcher, kinds = kind_labels(payload)
+    return f"""<!doctype html>
+<html lang="en">
+<head>
+<meta charset="utf-8">
+<title>{html.escape(title)}</title>
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<style>
+  :root {{ --fg:#1f2937; --muted:#6b7280; --accent:#2563eb; --bg:#ffffff; --line:#e5e7eb; --row:26px; }}
+  body {{ font-family: system-ui, -apple-system, Segoe UI, Roboto, Ubuntu, Cantarell, Arial; margin: 0; color: var(--fg); background: var(--bg); display: flex; flex-direction: column; height: 100vh; }}
+  header {{ padding: 16px 20px; border-bottom: 1px solid var(--line); display: flex; gap: 12px; align-items: center; flex-wrap: wrap; }}
+  h1 {{ font-size: 18px; margin: 0 8px 0 0; }}
+  .controls {{ display: flex; gap: 8px; align-items: center; flex-wrap: wrap; }}
+  input[type="search"] {{ padding: 8px 10px; border:1px solid var(--line); border-radius: 8px; min-width: 280px; }}
+  button, select {{ padding: 8px 10px; border:1px solid var(--line); background:#f9fafb; border-radius:8px; cursor:pointer; }}
+  #tree {{ flex: 1; overflow: auto; position: relative; }}
+  #spacer {{ position: relative; }}
+  .row {{ position: absolute; left: 0; right: 0; height: var(--row); display: flex; align-items: center; padding-left: 20px; white-space: nowrap; }}
+  .label {{ display:inline-flex; align-items:center; gap:8px; padding:2px 6px; border-radius:6px; cursor: pointer; }}
+  .id {{ color: var(--muted); font-family: ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, "Liberation Mono", monospace; font-size: 12px; }}
+  .type {{ color: var(--accent); font-size: 12px; text-transform: lowercase; background: #eff6ff; padding: 2px 6px; border-radius: 999px; }}
+  .caret {{ width: 1em; display: inline-block; text-align: center; font-weight: bold; color: var(--muted); font-family: Arial, sans-serif; }}
+  .match > .label {{ background: #fff7ed; outline: 1px solid #fed7aa; }}
+  .muted {{ opacity: .6; }}
+  .ref-link {{ color: var(--muted); font-size: 12px; text-decoration: underline dotted; }}
+  .ref-link:hover {{ color: var(--accent); }}
+  .flash > .label {{ background: #dbeafe; }}
+  footer {{ padding: 12px 20px; border-top:1px solid var(--line); color: var(--muted); font-size: 12px; }}
+  #timing {{ position: fixed; right: 12px; bottom: 12px; padding: 4px 8px; border-radius: 6px; background: rgba(31,41,55,.85); color: #fff; font: 12px ui-monospace, SFMono-Regular, Menlo, Monaco, Consolas, monospace; pointer-events: none; }}
+</style>
+</head>
+<body>
+<header>
+  <h1>{heading}</h1>
+  <div class="controls">
+    {switcher}
+    <input id="search" type="search" placeholder="Search by name or id…">
+    <button id="expandAll" title="Expand all nodes">Expand all</button>
+    <button id="collapseAll" title="Collapse all nodes">Collapse all</button>
+    <span id="stats" class="muted"></span>
+  </div>
+</header>
+<div id="tree"><div id="spacer"></div></div>
+<footer>
+  Generated from textproto ({kinds}). Click a node label to expand/collapse. Use search to filter.
+</footer>
+
+<div id="timing" style="display:none"></div>
+
+<script id="data" type="application/json">{data_json}</script>
+<script id="search-index" type="application/json">{search_json}</script>
+<script>
+const data = JSON.parse(document.getElementById('data').textContent);
+{SEARCH_JS}
+// One view per relationship kind, all over the shared entity table. The
+// one on show has its columns and state in the variables below; a view's
+// typed arrays are made the first time it is shown and kept after that.
+let view = null;
+let N, node, parent, size, flag, depth, expanded;
+let keep;   // while searching: 1 for matches and their ancestors
+let match;  // while searching: 1 for matches
+let filtering = false;
+let rows = new Int32Array(0);
+
+function openView(v) {{
+  if (!v.depth) {{
+    const n = v.node.length;
+    v.node = Int32Array.from(v.node);
+    v.parent = Int32Array.from(v.parent);
+    v.size = Int32Array.from(v.size);
+    v.flag = Uint8Array.from(v.flag);
+    v.depth = new Int32Array(n);
+    for (let i = 0; i < n; i++) v.depth[i] = v.parent[i] < 0 ? 0 : v.depth[v.parent[i]] + 1;
+    v.expanded = new Uint8Array(n);
+    v.keep = new Uint8Array(n);
+    v.match = new Uint8Array(n);
+    v.touched = [];
+    v.query = null;
+    v.scrollTop = 0;
+  }}
+  ({{ node, parent, size, flag, depth, expanded, keep, match }} = v);
+  N = node.length;
+}}
+
+const viewport = document.getElementById('tree');
+const spacer = document.getElementById('spacer');
+const ROW = 26;
+const OVERSCAN = 20;
+
+// Visible rows in pre-order: a collapsed node, or one the search drops,
+// skips its whole subtree in one step.
+function computeRows() {{
+  const out = new Int32Array(N);
+  let n = 0;
+  let i = 0;
+  while (i < N) {{
+    if (filtering && !keep[i]) {{ i += size[i]; continue; }}
+    out[n++] = i;
+    i += expanded[i] ? 1 : size[i];
+  }}
+  rows = out.subarray(0, n);
+  spacer.style.height = (n * ROW) + 'px';
+  render();
+}}
+
+function renderRow(i) {{
+  const ent = node[i];
+  const id = data.ids[ent];
+  const name = data.names[ent] || id;
+  const type = data.types[data.typeOf[ent]];
+  const row = document.createElement('div');
+  row.className = 'row';
+  row.dataset.node = i;
+  row.style.paddingLeft = (20 + depth[i] * 18) + 'px';
+  if (filtering && match[i]) row.classList.add('match');
+
+  const label = document.createElement('div');
+  label.className = 'label';
+  const caret = document.createElement('span');
+  caret.className = 'caret';
+  caret.textContent = size[i] > 1 ? (expanded[i] ? "▼" : "►") : "";
+  label.appendChild(caret);
+  const title = document.createElement('span');
+  title.textContent = name;
+  label.appendChild(title);
+  const idSpan = document.createElement('span');
+  idSpan.className = 'id';
+  idSpan.textContent = id;
+  label.appendChild(idSpan);
+  if (type) {{
+    const typeSpan = document.createElement('span');
+    typeSpan.className = 'type';
+    typeSpan.textContent = type;
+    label.appendChild(typeSpan);
+  }}
+  if (flag[i]) {{
+    const link = document.createElement('span');
+    link.className = 'ref-link';
+    link.textContent = flag[i] === 2 ? "↻ cycle" : "↪ shown above";
+    link.title = "Jump to where this node is expanded";
+    label.appendChild(link);
+  }}
+  row.appendChild(label);
+  return row;
+}}
+
+let flashNode = -1;
+
+function render() {{
+  const first = Math.max(0, Math.floor(viewport.scrollTop / ROW) - OVERSCAN);
+  const last = Math.min(rows.length, Math.ceil((viewport.scrollTop + viewport.clientHeight) / ROW) + OVERSCAN);
+  const frag = document.createDocumentFragment();
+  for (let r = first; r < last; r++) {{
+    const row = renderRow(rows[r]);
+    row.style.top = (r * ROW) + 'px';
+    if (rows[r] === flashNode) row.classList.add('flash');
+    frag.appendChild(row);
+  }}
+  spacer.replaceChildren(frag);
+}}
+
+let pending = false;
+viewport.addEventListener('scroll', () => {{
+  if (pending) return;
+  pending = true;
+  requestAnimationFrame(() => {{ pending = false; render(); }});
+}});
+window.addEventListener('resize', render);
+
+function expandAncestors(i) {{
+  for (let p = parent[i]; p >= 0; p = parent[p]) expanded[p] = 1;
+}}
+
+function jumpTo(i) {{
+  // The full subtree sits at the first unflagged node of the same entity
+  const ent = node[i];
+  let target = -1;
+  for (let j = 0; j < N; j++) {{
+    if (node[j] === ent && !flag[j]) {{ target = j; break; }}
+  }}
+  if (target < 0) return;
+  if (filtering && !keep[target]) {{
+    document.getElementById('search').value = "";
+    searchFilter("");
+  }}
+  expandAncestors(target);
+  flashNode = target;
+  computeRows();
+  let r = 0;
+  while (rows[r] !== target) r++;
+  viewport.scrollTop = Math.max(0, r * ROW - viewport.clientHeight / 2);
+  render();
+  setTimeout(() => {{ flashNode = -1; render(); }}, 1200);
+}}
+
+spacer.addEventListener('click', (e) => {{
+  const row = e.target.closest('.row');
+  if (!row || !e.target.closest('.label')) return;
+  const i = +row.dataset.node;
+  if (e.target.classList.contains('ref-link')) {{
+    jumpTo(i);
+    return;
+  }}
+  if (size[i] <= 1) return;
+  expanded[i] ^= 1;
+  computeRows();
+}});
+
+function nodeText(n) {{
+  const ent = node[n];
+  return (data.ids[ent] + "\\n" + data.names[ent] + "\\n" + data.types[data.typeOf[ent]]).toLowerCase();
+}}
+
+// The index is parsed after the tree is shown, not before, and each view
+// gets its query the first time it is searched
+let searchIndex;
+
+function getQuery() {{
+  if (searchIndex === undefined) searchIndex = JSON.parse(document.getElementById('search-index').textContent);
+  if (!view.query) {{
+    view.query = searchIndex
+      ? makeSearch(searchIndex, node, nodeText)
+      : (q) => {{
+          const found = [];
+          for (let n = 0; n < N; n++) if (nodeText(n).includes(q)) found.push(n);
+          return found;
+        }};
+  }}
+  return view.query;
+}}
+
+function showView(k) {{
+  if (view) view.scrollTop = viewport.scrollTop;
+  view = data.views[k];
+  openView(view);
+  document.getElementById('stats').textContent = N + " node" + (N===1?"":"s");
+  searchFilter(document.getElementById('search').value);
+  viewport.scrollTop = view.scrollTop;
+  render();
+}}
+
+function searchFilter(q) {{
+  q = (q || "").trim().toLowerCase();
+  const t0 = performance.now();
+  const matches = q ? getQuery()(q) : [];
+  const t1 = performance.now();
+
+  // view.touched: nodes whose keep/match flags are set, to clear them next time
+  view.touched.forEach(n => {{ keep[n] = match[n] = 0; }});
+  const touched = view.touched = [];
+  filtering = !!q;
+  // Ensure ancestors of matches are visible and expanded
+  const opened = new Uint8Array(N);
+  matches.forEach(n => {{
+    match[n] = 1;
+    if (!keep[n]) {{
+      keep[n] = 1;
+      touched.push(n);
+    }}
+    for (let p = parent[n]; p >= 0 && !opened[p]; p = parent[p]) {{
+      opened[p] = 1;
+      expanded[p] = 1;
+      if (!keep[p]) {{
+        keep[p] = 1;
+        touched.push(p);
+      }}
+    }}
+  }});
+  computeRows();
+  showTiming(q, t1 - t0, performance.now() - t1, matches.length);
+}}
+
+(function init() {{
+  showView(0);
+
+  const kind = document.getElementById('kind');
+  kind.addEventListener('change', () => showView(+kind.value));
+  const search = document.getElementById('search');
+  search.addEventListener('input', debounce(() => searchFilter(search.value), 150));
+  setTimeout(getQuery, 0);
+  document.getElementById('expandAll').addEventListener('click', () => {{ expanded.fill(1); computeRows(); }});
+  document.getElementById('collapseAll').addEventListener('click', () => {{ expanded.fill(0); computeRows(); }});
+}})();
+</script>
+</body>
+</html>"""
+
+def write_json(out, value):
+    """
+    Write value to out as json.dumps(value, ensure_ascii=False) would, with
+    '<' escaped so it cannot close a script element ('<' only occurs inside
+    JSON strings). Dicts are written item by item and long lists in slices
+    of JSON_CHUNK, so the whole text is never held at once.
+    """
+    if isinstance(value, dict):
+        out.write("{")
+        for k, (key, item) in enumerate(value.items()):
+            out.write(", " if k else "")
+            out.write(script_json(key) + ": ")
+            write_json(out, item)
+        out.write("}")
+    elif isinstance(value, list) and len(value) > JSON_CHUNK:
+        out.write("[")
+        for start in range(0, len(value), JSON_CHUNK):
+            out.write(", " if start else "")
+            out.write(script_json(value[start:start + JSON_CHUNK])[1:-1])
+        out.write("]")
+    else:
+        out.write(script_json(value))
+
+def script_json(value):
+    return json.dumps(value, ensure_ascii=False).replace("<", "\\u003c")
 
-    blocks = split_top_blocks(text)
+def write_page(out, template, payload, search=None, stats=None):
+    """
+    Write template, from html_template or virtual_html_template, to out
+    with payload and search, search_index(payload), streamed into it. With
+    stats, a RunStats, the writes to out are timed as its "write" phase and
+    the JSON encoding as its "encode" phase.
+    """
+    if stats is not None:
+        start = time.perf_counter()
+        writer = TimedWriter(out, stats)
+        write_page(writer, template, payload, search)
+        writer.close()
+        stats.add("encode", time.perf_counter() - start - writer.seconds)
+        return
+    head, rest = template.split(DATA_SLOT)
+    middle, tail = rest.split(SEARCH_SLOT)
+    out.write(head)
+    write_json(out, payload)
+    out.write(middle)
+    write_json(out, search)
+    out.write(tail)
 
+def generate_html(payload, title="NMTS Containment Tree", search=None):
+    out = io.StringIO()
+    write_page(out, html_template(payload, title), payload, search)
+    return out.getvalue()
+
+def generate_virtual_html(payload, title="NMTS Containment Tree", search=None):
+    out = io.StringIO()
+    write_page(out, virtual_html_template(payload, title), payload, search)
+    return out.getvalue()
+
+def load_from_index(idx, kinds=("RK_CONTAINS",)):
+    strings = idx.strings()
     entities = {}
-    for b in blocks:
-        if b.lstrip().startswith("entity"):
-            eid, name, etype = extract_entity(b)
-            if eid:
-                entities[eid] = {"name": name, "type": etype}
-
-    contains_edges = []
-    for b in blocks:
-        if b.lstrip().startswith("relationship"):
-            rel = extract_relationship(b)
-            if not rel:
-                continue
-            kind, a, z = rel
-            if kind == "RK_CONTAINS":
-                contains_edges.append((a, z))
+    for sid, nid, tid in zip(idx.array("ent_id"), idx.array("ent_name"), idx.array("ent_type")):
+        if sid >= 0 and strings[sid]:
+            eid = strings[sid]
+            entities[eid] = {"name": (strings[nid] if nid >= 0 else "") or eid, "type": strings[tid]}
 
-    forest = build_forest(entities, contains_edges)
-    html_out = generate_html(forest, title="NMTS Containment Tree")
+    edges = {}
+    rel_a, rel_z = idx.array("rel_a"), idx.array("rel_z")
+    for kind in kinds:
+        rows = idx.relationship_rows(kind)
+        edges[kind] = [
+            (strings[a] if a >= 0 else None, strings[z] if z >= 0 else None)
+            for a, z in zip(rel_a[rows.start:rows.stop], rel_z[rows.start:rows.stop])
+        ]
+    return entities, edges
 
+def collect(kinds, records):
+    """
+    Entities and the edges of each of kinds, bucketed in one pass, and the
+    number of blocks read.
+    """
+    entities = {}
+    edges = {kind: [] for kind in kinds}
+    blocks = 0
+    for blocks, rec in enumerate(records, 1):
+        f = rec.fields
+        if rec.kind == "entity":
+            if f.id:
+                entities[f.id] = {"name": f.name or f.id, "type": f.entity_type}
+        elif f.kind in edges:
+            edges[f.kind].append((f.a, f.z))
+    return entities, edges, blocks
+
+def load_from_scan(path, jobs=1, kinds=("RK_CONTAINS",), stats=None, wire=None):
+    entities = {}
+    edges = {kind: [] for kind in kinds}
+    # Shards come back in file order, so later entities still win
+    for shard_entities, shard_edges, blocks in map_records(path, partial(collect, kinds), jobs, wire=wire):
+        entities.update(shard_entities)
+        for kind, kind_edges in shard_edges.items():
+            edges[kind].extend(kind_edges)
+        if stats is not None:
+            stats.count("blocks", blocks)
+    return entities, edges
+
+def split_path(output, kind):
+    stem, ext = os.path.splitext(output)
+    return f"{stem}.{kind}{ext or '.html'}"
+
+def main():
+    args = parse_args()
+    kinds = list(dict.fromkeys(k.strip() for k in args.kinds.split(",") if k.strip()))
+    if not kinds:
+        sys.exit("Error: --kinds needs at least one relationship kind")
+    wire = input_wire_map(args)
+    with run_stats("proto2tree", args) as stats:
+        render(args, kinds, wire, stats)
+
+def render(args, kinds, wire, stats):
     try:
-        with open(args.output, "w", encoding="utf-8") as f:
-            f.write(html_out)
+        idx = None if args.no_index else load_index(args.input)
+        if idx is not None:
+            with stats.phase("index"):
+                entities, edges = load_from_index(idx, kinds)
+            stats.count("blocks", idx.header["entities"] + idx.header["relationships"])
+        else:
+            stats.page_in(args.input)
+            with stats.phase("scan"):
+                entities, edges = load_from_scan(args.input, args.jobs, kinds, stats, wire)
     except Exception as e:
-        sys.exit(f"Error writing output file: {e}")
+        sys.exit(f"Error reading input file: {e}")
+    stats.count("entities", len(entities))
+    stats.count("edges", sum(len(kind_edges) for kind_edges in edges.values()))
+
+    # The file is parsed once; each page, and each kind in it, only costs
+    # its forest build
+    if args.split:
+        pages = [(split_path(args.output, kind), {kind: edges[kind]}) for kind in kinds]
+    else:
+        pages = [(args.output, edges)]
+    for output, page_edges in pages:
+        with stats.phase("forest", sum(len(kind_edges) for kind_edges in page_edges.values())):
+            payload, cycles = forest_views(entities, page_edges, shared=args.shared)
+        with stats.phase("search"):
+            search = search_index(payload)
+        title = "NMTS Containment Tree" if list(page_edges) == ["RK_CONTAINS"] else "NMTS Relationship Tree"
+        for kind, kind_cycles in cycles.items():
+            stats.count("cycles", len(kind_cycles))
+            for cycle in kind_cycles:
+                print(f"Warning: {kind} cycle: " + " -> ".join(cycle + cycle[:1]), file=sys.stderr)
+
+        if args.layout == "virtual":
+            template = virtual_html_template(payload, title=title)
+        else:
+            template = html_template(payload, title=title)
+        # The page goes straight to the file, never whole in memory
+        try:
+            with open(output, "w", encoding="utf-8") as f:
+                write_page(f, template, payload, search, stats)
+        except Exception as e:
+            sys.exit(f"Error writing output file: {e}")
 
 if __name__ == "__main__":
     main()
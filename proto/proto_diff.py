@@ -0,0 +1,222 @@
+#!/usr/bin/env python3
+# proto_diff.py
+# Usage: python3 proto_diff.py old.txtproto new.txtproto [-o changes.txt] [--blocks] [-j N]
+"""
+Compare two NMTS textproto snapshots entry by entry.
+
+Entities are matched by id, relationships by kind, a and z, wherever they
+sit in the files, so reordered blocks are not changes; an entry that occurs
+several times is matched in order. Two blocks of an entry are the same
+when their bytes hash the same or, failing that, when their normalized
+forms match: whitespace, comments, optional colons and field separators
+are ignored.
+
+Each file is scanned once. For the old file only flat arrays are kept:
+a 64-bit hash of each key, a hash of each block and the block's offset and
+length, about 40 bytes per entry whatever the size of the blocks. The new
+file is streamed against them, and key text is only recovered, from the
+block, for entries that are reported. Output lines are '+ key' (added),
+'- key' (removed) and '~ key' (modified); the exit status is 1 if there
+were changes, as for diff.
+"""
+import argparse
+import difflib
+import hashlib
+import mmap
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from functools import partial
+
+from textproto import COMMENT, STRING, iter_spans, map_records, scan_records
+
+# Tokens of the normalized form: strings, bare words and braces, one space
+# apart. Comments match the empty group and are dropped, as are colons and
+# field separators.
+NORM_TOKEN_RE = re.compile(rb"(" + STRING + rb"|[^\s\"'#{}:,;]+|[{}])|" + COMMENT)
+
+DIGEST_SIZE = 16
+
+def block_hash(block):
+    return hashlib.blake2b(block, digest_size=DIGEST_SIZE).digest()
+
+def normalize(block):
+    return b" ".join(filter(None, NORM_TOKEN_RE.findall(block)))
+
+def entry_key(rec, block):
+    f = rec.fields
+    if rec.kind == "entity":
+        # Entities without an id can only be matched by content
+        return f"entity {f.id}" if f.id else f"entity #{block_hash(normalize(block)).hex()[:12]}"
+    return f"relationship {f.kind} {f.a} -> {f.z}"
+
+def key_hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little", signed=True)
+
+def _hash_records(buf, records):
+    for rec in records:
+        block = buf[rec.offset:rec.offset + rec.length]
+        yield key_hash(entry_key(rec, block)), block_hash(block), rec.offset, rec.length
+
+def hash_shard(path, records):
+    """
+    Columns "key", "hash", "offset" and "length" for the records of one
+    shard of path; "hash" holds DIGEST_SIZE bytes per record.
+    """
+    columns = {"key": array("q"), "hash": bytearray(), "offset": array("q"), "length": array("q")}
+    with open(path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return columns
+        try:
+            for key, digest, offset, length in _hash_records(buf, records):
+                columns["key"].append(key)
+                columns["hash"] += digest
+                columns["offset"].append(offset)
+                columns["length"].append(length)
+        finally:
+            buf.close()
+    return columns
+
+def hash_file(path, jobs=1):
+    """
+    hash_shard columns for the whole file, shards concatenated in order.
+    """
+    columns = {"key": array("q"), "hash": bytearray(), "offset": array("q"), "length": array("q")}
+    for shard in map_records(path, partial(hash_shard, path), jobs):
+        for name, column in shard.items():
+            columns[name] += column
+    return columns
+
+def iter_entries(path, jobs=1):
+    """
+    Yield (key hash, block hash, offset, length) for every entity and
+    relationship of a textproto file, in file order. With jobs > 1 the file
+    is hashed in parallel shards first; otherwise it is streamed.
+    """
+    if jobs > 1:
+        c = hash_file(path, jobs)
+        for i, (key, offset, length) in enumerate(zip(c["key"], c["offset"], c["length"])):
+            yield key, bytes(c["hash"][i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]), offset, length
+        return
+    with open(path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return
+        try:
+            yield from _hash_records(buf, scan_records(buf))
+        finally:
+            buf.close()
+
+def block_key(buf, span):
+    """
+    The key of the block at span, read back from buf.
+    """
+    offset, length = span
+    rec = next(scan_records(buf, offset, offset + length))
+    return entry_key(rec, buf[offset:offset + length])
+
+def diff_snapshots(old_path, new_path, stats=None, jobs=1):
+    """
+    Yield (change, key, old_span, new_span) for every entry that differs:
+    change is '+', '-' or '~' and the spans are (offset, length) of the
+    block in either file, or None. Added and modified entries come in the
+    new file's order, then removed ones in the old file's order. The count
+    of unchanged entries is stored in the stats dict, if given.
+    """
+    old = hash_file(old_path, jobs)
+    old_key, old_hash, old_offset, old_length = old["key"], old["hash"], old["offset"], old["length"]
+    # Entry numbers by key hash; the sort is stable, so repeats stay in
+    # file order
+    order = array("q", sorted(range(len(old_key)), key=old_key.__getitem__))
+    keys = array("q", (old_key[i] for i in order))
+    matched = bytearray(len(order))
+    unchanged = 0
+
+    with open(old_path, "rb") as old_file, open(new_path, "rb") as new_file:
+        old_buf = new_buf = None
+        try:
+            if order:
+                old_buf = mmap.mmap(old_file.fileno(), 0, access=mmap.ACCESS_READ)
+            for key, digest, offset, length in iter_entries(new_path, jobs):
+                if new_buf is None:
+                    new_buf = mmap.mmap(new_file.fileno(), 0, access=mmap.ACCESS_READ)
+                new_span = (offset, length)
+                k = bisect_left(keys, key)
+                while k < len(keys) and keys[k] == key and matched[k]:
+                    k += 1
+                if k == len(keys) or keys[k] != key:
+                    yield "+", block_key(new_buf, new_span), None, new_span
+                    continue
+                matched[k] = 1
+                i = order[k]
+                old_span = (old_offset[i], old_length[i])
+                # Blocks are only normalized when their hashes differ
+                if old_hash[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE] != digest:
+                    before = normalize(old_buf[old_span[0]:old_span[0] + old_span[1]])
+                    if before != normalize(new_buf[offset:offset + length]):
+                        yield "~", block_key(new_buf, new_span), old_span, new_span
+                        continue
+                unchanged += 1
+
+            for i in sorted(order[k] for k in range(len(order)) if not matched[k]):
+                old_span = (old_offset[i], old_length[i])
+                yield "-", block_key(old_buf, old_span), old_span, None
+        finally:
+            for buf in (old_buf, new_buf):
+                if buf is not None:
+                    buf.close()
+    if stats is not None:
+        stats["unchanged"] = unchanged
+
+def block_text(path, span):
+    return next(iter_spans(path, [span])).strip()
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Report added, removed and modified entries between two textproto snapshots.")
+    p.add_argument("old", help="Older .txtproto snapshot")
+    p.add_argument("new", help="Newer .txtproto snapshot")
+    p.add_argument("-o", "--output", help="Write the report here instead of stdout")
+    p.add_argument("--blocks", action="store_true",
+                   help="Print the blocks of added and removed entries and a unified diff of modified ones")
+    p.add_argument("-j", "--jobs", type=int, default=1, help="Hash each file with N worker processes")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+    counts = {"+": 0, "-": 0, "~": 0}
+    stats = {}
+
+    try:
+        out = open(args.output, "w", encoding="utf-8") if args.output else sys.stdout
+    except Exception as e:
+        sys.exit(f"Error writing output file: {e}")
+    try:
+        for change, key, old_span, new_span in diff_snapshots(args.old, args.new, stats, args.jobs):
+            counts[change] += 1
+            out.write(f"{change} {key}\n")
+            if not args.blocks:
+                continue
+            if change == "~":
+                before = block_text(args.old, old_span).splitlines()
+                after = block_text(args.new, new_span).splitlines()
+                lines = list(difflib.unified_diff(before, after, args.old, args.new, lineterm=""))[2:]
+            else:
+                lines = block_text(args.new if change == "+" else args.old, new_span or old_span).splitlines()
+            out.writelines(f"    {line}\n" for line in lines)
+    except Exception as e:
+        sys.exit(f"Error reading input file: {e}")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    print(f"{counts['+']} added, {counts['-']} removed, {counts['~']} modified, {stats['unchanged']} unchanged",
+          file=sys.stderr)
+    sys.exit(1 if any(counts.values()) else 0)
+
+if __name__ == "__main__":
+    main()
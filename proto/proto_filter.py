@@ -1,87 +1,364 @@
 import argparse
-import re
 import sys
+from array import array
+from functools import partial
+from itertools import chain
+
+from proto_index import load_index
+from proto_stats import add_arguments, run_stats
+from textproto import iter_records, iter_spans, map_records
+from wireproto import add_wire_arguments, input_wire_map
 
 def parse_args():
     parser = argparse.ArgumentParser(
-        description="Filter a textproto file by relationship kinds."
+        description="Filter a textproto or binary protobuf file by relationship kinds."
     )
-    parser.add_argument("-i", "--input", required=True, help="Input textproto file")
+    parser.add_argument("-i", "--input", required=True, help="Input textproto or binary protobuf file")
     parser.add_argument(
         "-r", "--relationships",
         required=True,
         help="Comma-separated list of relationship kinds to keep, e.g. RK_CONTAINS,RK_CONTROLS"
     )
-    parser.add_argument("-o", "--output", required=True, help="Output filtered textproto file")
+    parser.add_argument("-o", "--output", required=True, help="Output filtered file, in the format of the input")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Parse with N worker processes when there is no index")
+    parser.add_argument("--no-index", action="store_true", help="Ignore <input>.idx and scan the whole file")
+    parser.add_argument(
+        "--seed",
+        help="Comma-separated entity ids; keep only what lies within --hops relationships of them"
+    )
+    parser.add_argument(
+        "--hops", type=int, default=1,
+        help="With --seed: how many relationships of the kept kinds to follow, in either direction (default 1)"
+    )
+    add_wire_arguments(parser)
+    add_arguments(parser)
     return parser.parse_args()
 
-def read_blocks(text):
+def select_from_index(idx, keep_relationships):
     """
-    Split the file into top-level 'entity: { ... }' or 'relationship: { ... }' blocks.
+    Same selection as select_from_scan, read from the sidecar index.
     """
-    pattern = re.compile(r'(?=^\s*(entity|relationship)\s*:\s*\{)', re.MULTILINE)
-    indices = [m.start() for m in pattern.finditer(text)]
-    blocks = []
+    rel_a = idx.array("rel_a")
+    rel_z = idx.array("rel_z")
+    rel_offset = idx.array("rel_offset")
+    rel_length = idx.array("rel_length")
 
-    if not indices:
-        return blocks
+    rel_rows = []
+    involved = set()
+    for kind in keep_relationships:
+        rows = idx.relationship_rows(kind)
+        rel_rows.extend(rows)
+        involved.update(rel_a[rows.start:rows.stop])
+        involved.update(rel_z[rows.start:rows.stop])
+    involved.discard(-1)
 
-    for i, start in enumerate(indices):
-        end = indices[i + 1] if i + 1 < len(indices) else len(text)
-        blocks.append(text[start:end].strip())
-    return blocks
+    # Relationships are grouped by kind in the index; restore file order
+    kept_relationships = sorted((rel_offset[r], rel_length[r]) for r in rel_rows)
 
-def extract_relationship_kind(block):
-    match = re.search(r'kind\s*:\s*(RK_\w+)', block)
-    return match.group(1) if match else None
+    ent_offset = idx.array("ent_offset")
+    ent_length = idx.array("ent_length")
+    kept_entities = [(ent_offset[r], ent_length[r]) for r in idx.entity_rows(involved)]
+    return kept_entities, kept_relationships
 
-def extract_entity_id(block):
-    match = re.search(r'id\s*:\s*"([^"]+)"', block)
-    return match.group(1) if match else None
+def collect(keep_relationships, records):
+    """
+    Kept relationships as (offset, length, a, z), every entity as
+    (id, offset, length) and the number of blocks, from one shard of the
+    input.
+    """
+    relationships = []
+    entities = []
+    blocks = 0
+    for blocks, rec in enumerate(records, 1):
+        fields = rec.fields
+        if rec.kind == "entity":
+            entities.append((fields.id, rec.offset, rec.length))
+        elif fields.kind in keep_relationships:
+            relationships.append((rec.offset, rec.length, fields.a, fields.z))
+    return relationships, entities, blocks
 
-def extract_relationship_endpoints(block):
-    a_match = re.search(r'a\s*:\s*"([^"]+)"', block)
-    z_match = re.search(r'z\s*:\s*"([^"]+)"', block)
-    return (a_match.group(1) if a_match else None,
-            z_match.group(1) if z_match else None)
+def select_from_scan(path, keep_relationships, jobs=1, stats=None, wire=None):
+    if jobs > 1:
+        return select_from_shards(path, keep_relationships, jobs, stats, wire)
 
-def main():
-    args = parse_args()
-    keep_relationships = {r.strip() for r in args.relationships.split(",")}
+    kept_relationships = []
+    involved_entity_ids = set()
+    blocks = 0
+
+    # Pass 1: collect relationships of specified kinds and entity IDs
+    try:
+        for blocks, rec in enumerate(iter_records(path, kinds=("relationship",), wire=wire), 1):
+            fields = rec.fields
+            if fields.kind in keep_relationships:
+                kept_relationships.append((rec.offset, rec.length))
+                if fields.a:
+                    involved_entity_ids.add(fields.a)
+                if fields.z:
+                    involved_entity_ids.add(fields.z)
+    except Exception as e:
+        sys.exit(f"Error reading input file: {e}")
+
+    # Pass 2: keep entities that are referenced
+    kept_entities = []
+    try:
+        for blocks, rec in enumerate(iter_records(path, kinds=("entity",), wire=wire), blocks + 1):
+            if rec.fields.id in involved_entity_ids:
+                kept_entities.append((rec.offset, rec.length))
+    except Exception as e:
+        sys.exit(f"Error reading input file: {e}")
+    if stats is not None:
+        stats.count("blocks", blocks)
 
+    return kept_entities, kept_relationships
+
+def select_from_shards(path, keep_relationships, jobs, stats=None, wire=None):
+    """
+    select_from_scan in a single pass over shards parsed in parallel.
+    """
     try:
-        with open(args.input, "r", encoding="utf-8") as f:
-            text = f.read()
+        shards = map_records(path, partial(collect, keep_relationships), jobs, wire=wire)
     except Exception as e:
         sys.exit(f"Error reading input file: {e}")
 
-    blocks = read_blocks(text)
     kept_relationships = []
     involved_entity_ids = set()
+    for relationships, _, _ in shards:
+        for offset, length, a, z in relationships:
+            kept_relationships.append((offset, length))
+            if a:
+                involved_entity_ids.add(a)
+            if z:
+                involved_entity_ids.add(z)
 
-    # Pass 1: collect relationships of specified kinds and entity IDs
-    for block in blocks:
-        if block.startswith("relationship"):
-            kind = extract_relationship_kind(block)
-            if kind in keep_relationships:
-                kept_relationships.append(block)
-                a, z = extract_relationship_endpoints(block)
-                if a:
-                    involved_entity_ids.add(a)
-                if z:
-                    involved_entity_ids.add(z)
+    kept_entities = [
+        (offset, length) for _, entities, _ in shards
+        for eid, offset, length in entities if eid in involved_entity_ids
+    ]
+    if stats is not None:
+        stats.count("blocks", sum(blocks for _, _, blocks in shards))
+    return kept_entities, kept_relationships
 
-    # Pass 2: keep entities that are referenced
+def adjacency(n, a, z):
+    """
+    Undirected adjacency of nodes 0..n-1 over the edges a[k] - z[k], in CSR
+    form: the neighbors of node v are nbr[off[v]:off[v + 1]]. Edges with an
+    endpoint of -1 are left out.
+    """
+    off = array("q", bytes(8 * (n + 1)))
+    for u, v in zip(a, z):
+        if u >= 0 and v >= 0:
+            off[u + 1] += 1
+            off[v + 1] += 1
+    for v in range(n):
+        off[v + 1] += off[v]
+
+    nbr = array("i", bytes(4 * off[n]))
+    fill = off[:n]
+    for u, v in zip(a, z):
+        if u >= 0 and v >= 0:
+            nbr[fill[u]] = v
+            fill[u] += 1
+            nbr[fill[v]] = u
+            fill[v] += 1
+    return off, nbr
+
+def within_hops(off, nbr, seeds, hops):
+    """
+    Breadth-first search from seeds; returns a bytearray marking every node
+    at most hops edges away.
+    """
+    seen = bytearray(len(off) - 1)
+    frontier = []
+    for v in seeds:
+        if not seen[v]:
+            seen[v] = 1
+            frontier.append(v)
+    for _ in range(hops):
+        reached = []
+        for v in frontier:
+            for w in nbr[off[v]:off[v + 1]]:
+                if not seen[w]:
+                    seen[w] = 1
+                    reached.append(w)
+        if not reached:
+            break
+        frontier = reached
+    return seen
+
+def select_neighborhood(n, seeds, hops, rel, ent):
+    """
+    Entities within hops of seeds and the relationships among them.
+
+    Ids are numbered 0..n-1. rel holds the kept kinds' relationships as
+    array columns "a", "z", "offset" and "length", ent every entity as
+    "id", "offset" and "length", both in file order.
+    """
+    off, nbr = adjacency(n, rel["a"], rel["z"])
+    seen = within_hops(off, nbr, seeds, hops)
     kept_entities = [
-        block for block in blocks
-        if block.startswith("entity") and extract_entity_id(block) in involved_entity_ids
+        (offset, length) for eid, offset, length in zip(ent["id"], ent["offset"], ent["length"])
+        if eid >= 0 and seen[eid]
+    ]
+    kept_relationships = [
+        (offset, length) for a, z, offset, length in zip(rel["a"], rel["z"], rel["offset"], rel["length"])
+        if a >= 0 and z >= 0 and seen[a] and seen[z]
     ]
+    return kept_entities, kept_relationships
+
+def neighborhood_from_index(idx, keep_relationships, seeds, hops):
+    """
+    select_neighborhood over the index, whose string numbers already are
+    the id numbers. Returns (kept_entities, kept_relationships, missing
+    seeds).
+    """
+    rel = {"a": array("i"), "z": array("i"), "offset": array("q"), "length": array("q")}
+    # Walk the kinds in index order, then sort the rows back into file order
+    rows = []
+    for kind in sorted(keep_relationships):
+        rows.extend(idx.relationship_rows(kind))
+    rel_offset = idx.array("rel_offset")
+    rows.sort(key=rel_offset.__getitem__)
+    for name in rel:
+        column = idx.array("rel_" + name)
+        rel[name].extend(column[r] for r in rows)
+    ent = {name: idx.array("ent_" + name) for name in ("id", "offset", "length")}
+
+    numbers = {}
+    for num, value in enumerate(idx.strings()):
+        if value in seeds:
+            numbers[value] = num
+    kept = select_neighborhood(idx.header["strings"], numbers.values(), hops, rel, ent)
+    return kept + ([s for s in seeds if s not in numbers],)
+
+def intern_shard(keep_relationships, records):
+    """
+    One shard's entities and kept relationships with ids numbered in order
+    of appearance: returns (ids, rel, ent) in select_neighborhood's form,
+    ids[k] being the id numbered k, and the number of blocks.
+    """
+    numbers = {}
+
+    def number(value):
+        if not value:
+            return -1
+        num = numbers.get(value)
+        if num is None:
+            num = numbers[value] = len(numbers)
+        return num
+
+    rel = {"a": array("i"), "z": array("i"), "offset": array("q"), "length": array("q")}
+    ent = {"id": array("i"), "offset": array("q"), "length": array("q")}
+    blocks = 0
+    for blocks, rec in enumerate(records, 1):
+        fields = rec.fields
+        if rec.kind == "entity":
+            ent["id"].append(number(fields.id))
+            ent["offset"].append(rec.offset)
+            ent["length"].append(rec.length)
+        elif fields.kind in keep_relationships:
+            rel["a"].append(number(fields.a))
+            rel["z"].append(number(fields.z))
+            rel["offset"].append(rec.offset)
+            rel["length"].append(rec.length)
+    return list(numbers), rel, ent, blocks
+
+def neighborhood_from_scan(path, keep_relationships, seeds, hops, jobs=1, stats=None, wire=None):
+    """
+    select_neighborhood over one scan of the file. Returns
+    (kept_entities, kept_relationships, missing seeds).
+    """
+    try:
+        shards = map_records(path, partial(intern_shard, keep_relationships), jobs, wire=wire)
+    except Exception as e:
+        sys.exit(f"Error reading input file: {e}")
+
+    # Renumber each shard's ids into one numbering; -1 stays -1
+    numbers = {}
+    rel = {"a": array("i"), "z": array("i"), "offset": array("q"), "length": array("q")}
+    ent = {"id": array("i"), "offset": array("q"), "length": array("q")}
+    for ids, shard_rel, shard_ent, blocks in shards:
+        renumber = [numbers.setdefault(value, len(numbers)) for value in ids] + [-1]
+        rel["a"].extend(renumber[v] for v in shard_rel["a"])
+        rel["z"].extend(renumber[v] for v in shard_rel["z"])
+        ent["id"].extend(renumber[v] for v in shard_ent["id"])
+        for column in ("offset", "length"):
+            rel[column].extend(shard_rel[column])
+            ent[column].extend(shard_ent[column])
+        if stats is not None:
+            stats.count("blocks", blocks)
+
+    found = [numbers[s] for s in seeds if s in numbers]
+    kept = select_neighborhood(len(numbers), found, hops, rel, ent)
+    return kept + ([s for s in seeds if s not in numbers],)
+
+def main():
+    args = parse_args()
+    keep_relationships = {r.strip() for r in args.relationships.split(",")}
+    seeds = None
+    if args.seed is not None:
+        seeds = {s.strip() for s in args.seed.split(",") if s.strip()}
+        if not seeds:
+            sys.exit("Error: --seed needs at least one entity id")
+        if args.hops < 0:
+            sys.exit("Error: --hops must not be negative")
+    wire = input_wire_map(args)
+
+    with run_stats("proto_filter", args) as stats:
+        select(args, keep_relationships, seeds, wire, stats)
+
+def select(args, keep_relationships, seeds, wire, stats):
+    idx = None
+    if not args.no_index:
+        try:
+            idx = load_index(args.input)
+        except Exception as e:
+            sys.exit(f"Error reading index: {e}")
+    if idx is not None:
+        stats.count("blocks", idx.header["entities"] + idx.header["relationships"])
+
+    if seeds is not None:
+        if idx is not None:
+            try:
+                with stats.phase("index"):
+                    kept_entities, kept_relationships, missing = neighborhood_from_index(
+                        idx, keep_relationships, seeds, args.hops)
+            except Exception as e:
+                sys.exit(f"Error reading index: {e}")
+        else:
+            stats.page_in(args.input)
+            with stats.phase("scan"):
+                kept_entities, kept_relationships, missing = neighborhood_from_scan(
+                    args.input, keep_relationships, seeds, args.hops, args.jobs, stats, wire)
+        for seed in sorted(missing):
+            print(f"Warning: seed {seed} not found", file=sys.stderr)
+    elif idx is not None:
+        try:
+            with stats.phase("index"):
+                kept_entities, kept_relationships = select_from_index(idx, keep_relationships)
+        except Exception as e:
+            sys.exit(f"Error reading index: {e}")
+    else:
+        stats.page_in(args.input)
+        with stats.phase("scan"):
+            kept_entities, kept_relationships = select_from_scan(
+                args.input, keep_relationships, args.jobs, stats, wire)
+    stats.count("entities", len(kept_entities))
+    stats.count("edges", len(kept_relationships))
 
-    # Write out filtered content
+    # Write out filtered content, entities first. Only the spans were kept:
+    # each block is read back from the input as it is written. Binary
+    # fields are copied as they are, which makes a binary model again
     try:
-        with open(args.output, "w", encoding="utf-8") as out:
-            for block in kept_entities + kept_relationships:
-                out.write(block.strip() + "\n\n")
+        with stats.phase("write", len(kept_entities) + len(kept_relationships)):
+            spans = chain(kept_entities, kept_relationships)
+            if wire is not None:
+                with open(args.output, "wb") as out:
+                    for field in iter_spans(args.input, spans, raw=True):
+                        out.write(field)
+            else:
+                with open(args.output, "w", encoding="utf-8") as out:
+                    for block in iter_spans(args.input, spans):
+                        out.write(block.strip() + "\n\n")
     except Exception as e:
         sys.exit(f"Error writing output file: {e}")
 
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+# proto_index.py
+# Usage: python3 proto_index.py index -i export.txtproto
+#        python3 proto_index.py info -i export.txtproto
+"""
+Sidecar index for NMTS textproto files.
+
+'index' scans the file once and writes <input>.idx next to it, holding:
+  - a string table of every id, name, entity type and relationship endpoint
+  - per entity: id, name and type (string numbers), byte offset and length
+  - per RK_* kind: the a/z endpoints (string numbers) of its relationships,
+    with their byte offsets and lengths
+
+All tables are flat integer arrays, stored raw and read back with
+array.fromfile, and each is loaded only when asked for. proto_filter.py and
+proto2tree.py use a valid index automatically and only touch the blocks they
+need. The index is stale, and ignored, once the file size, mtime or a
+fingerprint of its first and last MiB no longer match.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from array import array
+
+from textproto import iter_records
+from wireproto import add_wire_arguments, input_wire_map
+
+MAGIC = b"NMTSIDX 1\n"
+FINGERPRINT_SPAN = 1 << 20
+
+# String numbers fit in 'i'; -1 stands for a missing value. Offsets and
+# lengths are 'q' so files past 4GB index the same way.
+SECTIONS = (
+    ("str_off", "q"),
+    ("str_blob", "B"),
+    ("ent_id", "i"),
+    ("ent_name", "i"),
+    ("ent_type", "i"),
+    ("ent_offset", "q"),
+    ("ent_length", "q"),
+    ("ent_by_str", "i"),
+    ("ent_next", "i"),
+    ("rel_a", "i"),
+    ("rel_z", "i"),
+    ("rel_offset", "q"),
+    ("rel_length", "q"),
+)
+
+def index_path(path):
+    return path + ".idx"
+
+def fingerprint(path, size):
+    """
+    blake2b of the size and the first and last FINGERPRINT_SPAN bytes.
+    """
+    h = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(path, "rb") as f:
+        h.update(f.read(FINGERPRINT_SPAN))
+        if size > FINGERPRINT_SPAN:
+            f.seek(max(FINGERPRINT_SPAN, size - FINGERPRINT_SPAN))
+            h.update(f.read())
+    return h.hexdigest()
+
+def source_stamp(path):
+    st = os.stat(path)
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "fingerprint": fingerprint(path, st.st_size),
+    }
+
+def build_index(path, out_path=None, wire=None):
+    """
+    Scan path once and write its sidecar index. Returns the index path.
+    With wire, a wireproto.WireMap, path is a binary model.
+    """
+    out_path = out_path or index_path(path)
+    stamp = source_stamp(path)
+
+    strings = {}
+
+    def intern(value):
+        if value is None:
+            return -1
+        num = strings.get(value)
+        if num is None:
+            num = strings[value] = len(strings)
+        return num
+
+    t = {name: array(code) for name, code in SECTIONS}
+    relationships = {}
+
+    for rec in iter_records(path, wire=wire):
+        f = rec.fields
+        if rec.kind == "entity":
+            t["ent_id"].append(intern(f.id))
+            t["ent_name"].append(intern(f.name))
+            t["ent_type"].append(intern(f.entity_type))
+            t["ent_offset"].append(rec.offset)
+            t["ent_length"].append(rec.length)
+        else:
+            rels = relationships.setdefault(f.kind or "", ([], [], [], []))
+            rels[0].append(intern(f.a))
+            rels[1].append(intern(f.z))
+            rels[2].append(rec.offset)
+            rels[3].append(rec.length)
+
+    if source_stamp(path) != stamp:
+        raise RuntimeError(f"{path} changed while it was being indexed")
+
+    # String table: UTF-8 blob plus the offset of each string and of the end
+    pos = 0
+    for value in strings:
+        t["str_off"].append(pos)
+        data = value.encode("utf-8")
+        t["str_blob"].frombytes(data)
+        pos += len(data)
+    t["str_off"].append(pos)
+
+    # Entity row by id string number, chained for ids that repeat
+    t["ent_by_str"] = array("i", [-1]) * len(strings)
+    t["ent_next"] = array("i", [-1]) * len(t["ent_id"])
+    for row in range(len(t["ent_id"]) - 1, -1, -1):
+        sid = t["ent_id"][row]
+        if sid >= 0:
+            t["ent_next"][row] = t["ent_by_str"][sid]
+            t["ent_by_str"][sid] = row
+
+    # Relationships grouped by kind, file order kept within a kind
+    kinds = {}
+    for kind, (a, z, offset, length) in sorted(relationships.items()):
+        kinds[kind] = [len(t["rel_a"]), len(a)]
+        t["rel_a"].extend(a)
+        t["rel_z"].extend(z)
+        t["rel_offset"].extend(offset)
+        t["rel_length"].extend(length)
+
+    sections = {}
+    pos = 0
+    for name, code in SECTIONS:
+        sections[name] = [code, pos, len(t[name])]
+        pos += len(t[name]) * t[name].itemsize
+    header = dict(
+        stamp,
+        byteorder=sys.byteorder,
+        entities=len(t["ent_id"]),
+        relationships=len(t["rel_a"]),
+        strings=len(strings),
+        kinds=kinds,
+        sections=sections,
+    )
+
+    tmp_path = out_path + ".tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(MAGIC)
+        out.write(json.dumps(header, sort_keys=True).encode() + b"\n")
+        for name, _ in SECTIONS:
+            t[name].tofile(out)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+class ProtoIndex:
+    """
+    Read side of an index file; sections are loaded on first use.
+    """
+
+    def __init__(self, path, header, data_start):
+        self.path = path
+        self.header = header
+        self.data_start = data_start
+        self.kinds = header["kinds"]
+        self._arrays = {}
+        self._strings = None
+
+    def array(self, name):
+        arr = self._arrays.get(name)
+        if arr is None:
+            code, pos, count = self.header["sections"][name]
+            arr = array(code)
+            with open(self.path, "rb") as f:
+                f.seek(self.data_start + pos)
+                arr.fromfile(f, count)
+            self._arrays[name] = arr
+        return arr
+
+    def strings(self):
+        """
+        The whole string table as a list, indexed by string number.
+        """
+        if self._strings is None:
+            off = self.array("str_off")
+            blob = self.array("str_blob").tobytes()
+            self._strings = [blob[off[i]:off[i + 1]].decode("utf-8") for i in range(len(off) - 1)]
+        return self._strings
+
+    def relationship_rows(self, kind):
+        start, count = self.kinds.get(kind, (0, 0))
+        return range(start, start + count)
+
+    def entity_rows(self, string_numbers):
+        """
+        Entity rows, in file order, whose id is one of string_numbers.
+        """
+        by_str = self.array("ent_by_str")
+        nxt = self.array("ent_next")
+        rows = []
+        for sid in string_numbers:
+            row = by_str[sid] if sid >= 0 else -1
+            while row >= 0:
+                rows.append(row)
+                row = nxt[row]
+        rows.sort()
+        return rows
+
+def read_header(idx_path):
+    with open(idx_path, "rb") as f:
+        if f.readline() != MAGIC:
+            raise ValueError(f"{idx_path} is not an index file")
+        header = json.loads(f.readline())
+        return header, f.tell()
+
+def load_index(path):
+    """
+    Return the ProtoIndex for path, or None if there is no index or it no
+    longer matches the file.
+    """
+    idx_path = index_path(path)
+    if not os.path.exists(idx_path):
+        return None
+    try:
+        header, data_start = read_header(idx_path)
+    except (OSError, ValueError) as e:
+        print(f"Ignoring index {idx_path}: {e}", file=sys.stderr)
+        return None
+    stamp = source_stamp(path)
+    if header.get("byteorder") != sys.byteorder or any(header.get(k) != v for k, v in stamp.items()):
+        print(f"Ignoring stale index {idx_path}; rebuild it with 'proto_index.py index'", file=sys.stderr)
+        return None
+    return ProtoIndex(idx_path, header, data_start)
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Build or inspect the sidecar index of an NMTS textproto file.")
+    sub = p.add_subparsers(dest="command", required=True)
+    build = sub.add_parser("index", help="Build <input>.idx")
+    build.add_argument("-i", "--input", required=True, help="Input .txtproto or binary protobuf file")
+    add_wire_arguments(build)
+    info = sub.add_parser("info", help="Show whether <input>.idx is valid and what it holds")
+    info.add_argument("-i", "--input", required=True, help="Input .txtproto or binary protobuf file")
+    return p.parse_args()
+
+def main():
+    args = parse_args()
+
+    if args.command == "index":
+        try:
+            out_path = build_index(args.input, wire=input_wire_map(args))
+        except Exception as e:
+            sys.exit(f"Error indexing input file: {e}")
+        print(f"Wrote {out_path}")
+        return
+
+    try:
+        idx = load_index(args.input)
+    except Exception as e:
+        sys.exit(f"Error reading index: {e}")
+    if idx is None:
+        sys.exit(f"No valid index for {args.input}")
+    h = idx.header
+    print(f"{idx.path}: {h['entities']} entities, {h['relationships']} relationships, {h['strings']} strings")
+    for kind, (_, count) in sorted(idx.kinds.items()):
+        print(f"  {kind or '(no kind)'}: {count}")
+
+if __name__ == "__main__":
+    main()
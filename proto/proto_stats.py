@@ -0,0 +1,173 @@
+"""
+Run statistics for the NMTS textproto tools (--stats and --profile).
+
+RunStats times the named phases of a run, keeps counts such as blocks,
+entities and edges, and writes one JSON summary per run:
+
+  {"tool": "proto2tree", "input": ..., "input_bytes": ..., "jobs": ...,
+   "phases": {"scan": {"seconds": ..., "items": ..., "per_second": ...}},
+   "counts": {"blocks": ..., "entities": ..., "edges": ...},
+   "total_seconds": ..., "blocks_per_second": ...,
+   "peak_rss_mb": ..., "peak_rss_children_mb": ...}
+
+A textproto scan is timed in two phases: "read" pulls the input into the
+page cache, so that "scan" is the parsing alone rather than parsing mixed
+with waiting on the disk; "read" is skipped unless the summary is written.
+Peak memory is the process's maximum RSS as the kernel counts it, so it
+costs nothing to measure; peak_rss_children_mb covers --jobs workers.
+"""
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+
+# Bytes read at a time by RunStats.page_in
+PAGE_IN_CHUNK = 1 << 20
+
+def add_arguments(parser):
+    parser.add_argument("--stats", nargs="?", const="-", metavar="FILE",
+                        help="Write per-phase timings, counts and peak memory as JSON to FILE (default: stderr)")
+    parser.add_argument("--profile", metavar="FILE", help="Write a cProfile dump of the run to FILE")
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    rss = resource.getrusage(who).ru_maxrss
+    return rss / (1 << 20) if sys.platform == "darwin" else rss / 1024
+
+class RunStats:
+    """
+    Phase timings and counts of one run. A phase entered more than once,
+    say once per output page, adds up.
+    """
+
+    def __init__(self, tool, path=None, jobs=1, reported=True):
+        self.tool = tool
+        self.path = path
+        self.jobs = jobs
+        self.reported = reported
+        self.start = time.perf_counter()
+        self.phases = {}
+        self.counts = {}
+
+    @contextmanager
+    def phase(self, name, items=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, items)
+
+    def add(self, name, seconds, items=None):
+        """Add seconds, and items if given, to phase name"""
+        entry = self.phases.setdefault(name, {"seconds": 0.0})
+        entry["seconds"] += seconds
+        if items is not None:
+            entry["items"] = entry.get("items", 0) + items
+
+    def page_in(self, path):
+        """
+        Read path once in a "read" phase of its size in bytes, leaving it in
+        the page cache for the scan that follows, if the summary is
+        reported. A file larger than memory is partly read again by the
+        scan.
+        """
+        if not self.reported:
+            return
+        chunk = bytearray(PAGE_IN_CHUNK)
+        with self.phase("read", os.path.getsize(path)):
+            with open(path, "rb") as f:
+                while f.readinto(chunk):
+                    pass
+
+    def count(self, name, value=1):
+        self.counts[name] = self.counts.get(name, 0) + value
+
+    def summary(self):
+        total = time.perf_counter() - self.start
+        phases = {}
+        for name, entry in self.phases.items():
+            phases[name] = dict(entry)
+            if "items" in entry and entry["seconds"]:
+                phases[name]["per_second"] = entry["items"] / entry["seconds"]
+        return {
+            "tool": self.tool,
+            "input": self.path,
+            "input_bytes": os.path.getsize(self.path) if self.path and os.path.exists(self.path) else None,
+            "jobs": self.jobs,
+            "phases": phases,
+            "counts": dict(self.counts),
+            "total_seconds": total,
+            "blocks_per_second": self.counts["blocks"] / total if total and "blocks" in self.counts else None,
+            "peak_rss_mb": peak_rss_mb(),
+            "peak_rss_children_mb": peak_rss_mb(resource.RUSAGE_CHILDREN),
+        }
+
+    def write(self, target):
+        """
+        Write the summary as JSON to target, a path or "-" for stderr.
+        """
+        text = json.dumps(self.summary(), indent=1) + "\n"
+        if target == "-":
+            sys.stderr.write(text)
+            return
+        with open(target, "w", encoding="utf-8") as f:
+            f.write(text)
+
+class TimedWriter:
+    """
+    Text file stand-in for out that buffers what is written and times the
+    writes to out. seconds is the time spent in them so far; close()
+    writes what is left and adds seconds to stats' phase name.
+    """
+
+    def __init__(self, out, stats, name="write", size=PAGE_IN_CHUNK):
+        self.out = out
+        self.stats = stats
+        self.name = name
+        self.size = size
+        self.parts = []
+        self.pending = 0
+        self.seconds = 0.0
+
+    def write(self, text):
+        self.parts.append(text)
+        self.pending += len(text)
+        if self.pending >= self.size:
+            self.flush()
+
+    def flush(self):
+        start = time.perf_counter()
+        self.out.write("".join(self.parts))
+        self.seconds += time.perf_counter() - start
+        self.parts.clear()
+        self.pending = 0
+
+    def close(self):
+        self.flush()
+        self.stats.add(self.name, self.seconds)
+
+@contextmanager
+def run_stats(tool, args):
+    """
+    RunStats for the body of a tool's main(), profiled if args.profile is
+    set. The profile and the args.stats summary are written on the way
+    out, also when the run stops on an error.
+    """
+    stats = RunStats(tool, args.input, getattr(args, "jobs", 1), reported=bool(args.stats))
+    profiler = cProfile.Profile() if args.profile else None
+    if profiler is not None:
+        profiler.enable()
+    try:
+        yield stats
+    finally:
+        try:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(args.profile)
+            if args.stats:
+                stats.write(args.stats)
+        except Exception as e:
+            sys.exit(f"Error writing statistics: {e}")
@@ -0,0 +1,393 @@
+"""
+Streaming helpers shared by the NMTS textproto tools.
+
+The reader memory-maps the input file and matches each top-level block
+brace-aware, stepping over quoted strings and comments, so blocks are found
+by structure instead of by a lookahead regex over the whole text. Only
+one block is materialized at a time; memory stays bounded by the largest
+block rather than by the size of the file.
+
+Field extraction (id, name, kind, a, z and the ek_* type) takes only the
+fields directly inside a block: typical bodies in a single regex match,
+others in one walk counting braces. The record scanner folds that pass
+into finding the end of the block.
+"""
+import mmap
+import os
+import re
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+# Top-level block kinds the NMTS tools care about
+BLOCK_KINDS = ("entity", "relationship")
+
+Block = namedtuple("Block", "kind offset length text")
+Fields = namedtuple("Fields", "id name kind a z entity_type")
+Record = namedtuple("Record", "kind offset length fields")
+
+# Quoted strings and comments never span a newline in textproto. Strings
+# are unrolled (plain run, then escape and plain run) so the engine takes
+# no alternative per character.
+STRING = rb'"[^"\\\n]*(?:\\.[^"\\\n]*)*"|\'[^\'\\\n]*(?:\\.[^\'\\\n]*)*\''
+COMMENT = rb"#[^\n]*(?![^\n])"
+# Plain text between strings, comments and braces
+PLAIN = rb"[^{}\"'#]*"
+# A field name. The lookbehind only lets it start at the start of a word,
+# so a search does not retry it at every position inside a long one.
+IDENT = rb"(?<!\w)([A-Za-z_]\w*)"
+
+# Between blocks: the next message opener ('entity: {' or 'entity {'), or a
+# string, comment or stray brace to step over.
+TOP_RE = re.compile(IDENT + rb"\s*:?\s*\{|" + STRING + rb"|" + COMMENT + rb"|[{}]")
+# Tokens for walking a block brace by brace, used past BODY_DEPTH levels
+TOKEN_RE = re.compile(STRING + rb"|" + COMMENT + rb"|[{}]")
+
+# A complete '{ ... }' body nested up to BODY_DEPTH levels deep, matched in
+# one regex call. The unrolled PLAIN (special PLAIN)* form has no ambiguous
+# repetition, so a failed match does not backtrack exponentially.
+BODY_DEPTH = 8
+_body = rb"\{" + PLAIN + rb"(?:(?:" + STRING + rb"|" + COMMENT + rb")" + PLAIN + rb")*\}"
+for _ in range(BODY_DEPTH - 1):
+    _body = rb"\{" + PLAIN + rb"(?:(?:" + STRING + rb"|" + COMMENT + rb"|" + _body + rb")" + PLAIN + rb")*\}"
+BODY_RE = re.compile(_body)
+del _body
+
+# The body of a typical entity or relationship in one match, capturing the
+# fields directly inside it: scalar fields, lists of scalars, comments,
+# messages holding only those, and the ek_* message, whose name is picked
+# up. Deeper nesting does not match and is walked by walk_fields instead.
+# Either way nested messages such as 'data: { a: "..." }' can never supply
+# a top-level value. For a field that repeats, the last value wins, as in
+# protobuf text format.
+VALUE = rb"(?:" + STRING + rb"|[^\s{}\"'#,;\[\]]+(?![^\s{}\"'#,;\[\]]))"
+LIST = rb"\[(?:" + STRING + rb"|[^\]\"'])*\]"
+SEP = rb"[\s,;]*"
+OTHER = rb"\w+\s*:\s*(?:" + VALUE + rb"|" + LIST + rb")"
+FLAT = rb"\w+\s*:?\s*\{" + SEP + rb"(?:(?:" + OTHER + rb"|" + COMMENT + rb")" + SEP + rb")*\}"
+
+
+def _scalar(name, group=None):
+    return name + rb"\s*:\s*(?P<" + (group or name) + rb">" + VALUE + rb")"
+
+
+def _message(*items):
+    return rb"\{" + SEP + rb"(?:(?:" + rb"|".join(items + (OTHER, FLAT, COMMENT)) + rb")" + SEP + rb")*\}"
+
+
+RECORD_RE = re.compile(
+    _message(
+        *(_scalar(name) for name in (b"id", b"name", b"kind", b"a", b"z")),
+        rb"(?P<ek>ek_\w+)\s*:?\s*" + _message(_scalar(b"name", b"ek_name")),
+    )
+)
+RECORD_STR_RE = re.compile(RECORD_RE.pattern.decode())
+
+# A message opener at the start of a line: where --jobs splits the input.
+# Whether it really is top level is settled by the shard before it ending
+# with every block closed.
+SHARD_RE = re.compile(rb"^[A-Za-z_]\w*[ \t]*:?\s*\{", re.MULTILINE)
+# Smallest shard worth handing to another process
+MIN_SHARD = 1 << 20
+
+# Items of any body, for walk_fields: a scalar field and its value, a
+# message opener with its field name, a bare brace, or a string or comment
+# to step over.
+ITEM = IDENT + rb"\s*(?::\s*(" + VALUE + rb")|:?\s*(\{))|(\{)|(\})|" + STRING + rb"|" + COMMENT
+ITEM_RE = re.compile(ITEM)
+ITEM_STR_RE = re.compile(ITEM.decode())
+# Positions of the scalar fields in RECORD_RE's groups
+SCALAR_SLOTS = {"id": 0, "name": 1, "kind": 2, "a": 3, "z": 4}
+SCALAR_SLOTS_BYTES = {name.encode(): slot for name, slot in SCALAR_SLOTS.items()}
+
+
+def skip_body(buf, pos, end):
+    """
+    Return the offset just past the '}' closing the '{' at buf[pos], or None
+    if the body is not terminated before end.
+    """
+    m = BODY_RE.match(buf, pos, end)
+    if m:
+        return m.end()
+    depth = 0
+    for m in TOKEN_RE.finditer(buf, pos, end):
+        tok = buf[m.start()]
+        if tok == 0x7B:  # '{'
+            depth += 1
+        elif tok == 0x7D:  # '}'
+            depth -= 1
+            if depth == 0:
+                return m.end()
+    return None
+
+
+def scan_blocks(buf, start=0, end=None, kinds=BLOCK_KINDS):
+    """
+    Yield top-level blocks found in buf[start:end].
+
+    buf may be any bytes-like object (bytes, mmap). Each Block carries the
+    field name, the byte offset and length of the block in buf, and the
+    decoded block text from the field name through the closing brace.
+    """
+    if end is None:
+        end = len(buf)
+    kinds = {k.encode() for k in kinds}
+    pos = start
+
+    while True:
+        m = TOP_RE.search(buf, pos, end)
+        if m is None:
+            return
+        if m.group(1) is None and buf[m.start()] != 0x7B:
+            # String, comment or stray '}'
+            pos = m.end()
+            continue
+        stop = skip_body(buf, m.end() - 1, end)
+        if stop is None:
+            # Unterminated block at the end of the input
+            return
+        if m.group(1) in kinds:
+            yield Block(
+                m.group(1).decode(),
+                m.start(),
+                stop - m.start(),
+                buf[m.start():stop].decode("utf-8"),
+            )
+        pos = stop
+
+
+def iter_blocks(path, kinds=BLOCK_KINDS):
+    """
+    Yield top-level blocks of a textproto file one at a time.
+    """
+    with open(path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return
+        try:
+            yield from scan_blocks(buf, kinds=kinds)
+        finally:
+            buf.close()
+
+
+def walk_fields(buf, pos, end=None):
+    """
+    Walk the message whose '{' is at buf[pos] one item at a time, counting
+    braces, for bodies RECORD_RE does not take: messages nested deeper,
+    extension fields, text it does not parse.
+
+    buf may be str or bytes-like. Returns the offset just past the closing
+    '}', or None if the body is not terminated before end, and the raw
+    values of the fields directly inside the message as RECORD_RE groups:
+    id, name, kind, a, z, the ek_* field and the name inside it.
+    """
+    if isinstance(buf, str):
+        item_re, slots, ek_prefix = ITEM_STR_RE, SCALAR_SLOTS, "ek_"
+    else:
+        item_re, slots, ek_prefix = ITEM_RE, SCALAR_SLOTS_BYTES, b"ek_"
+    values = [None, None, None, None, None, None, None]
+    depth = 0
+    in_ek = False
+    for m in item_re.finditer(buf, pos + 1, len(buf) if end is None else end):
+        item = m.lastindex
+        if item == 2:
+            # field: value
+            if depth == 0:
+                slot = slots.get(m.group(1))
+                if slot is not None:
+                    values[slot] = m.group(2)
+            elif depth == 1 and in_ek and slots.get(m.group(1)) == 1:
+                values[6] = m.group(2)
+        elif item == 5:
+            if depth == 0:
+                return m.end(), values
+            depth -= 1
+            if depth == 0:
+                in_ek = False
+        elif item is not None:
+            # field { or a bare {
+            if depth == 0 and item == 3 and m.group(1).startswith(ek_prefix):
+                values[5] = m.group(1)
+                in_ek = True
+            depth += 1
+    return None, values
+
+
+def match_fields(groups):
+    """
+    Build Fields from the groups of a RECORD_RE match on bytes, or the
+    values walk_fields gives.
+    """
+    eid, name, kind, a, z, ek, ek_name = [
+        value if value is None else (value[1:-1] if value[0] in b"\"'" else value).decode("utf-8")
+        for value in groups
+    ]
+    return Fields(eid, ek_name if name is None else name, kind, a, z, ek[3:] if ek else "")
+
+
+def extract_fields(block):
+    """
+    Pull id, name, kind, a, z and the ek_* entity type out of a block.
+
+    Only fields directly inside the block are taken, so nested messages such
+    as 'data: { a: "..." }' cannot shadow the real endpoints. An entity
+    without a top-level name falls back to the name inside its ek_* message.
+    Missing fields are None, except entity_type which is "" when the entity
+    has no ek_* message.
+    """
+    start = block.find("{")
+    m = RECORD_STR_RE.match(block, start)
+    eid, name, kind, a, z, ek, ek_name = [
+        value[1:-1] if value and value[0] in "\"'" else value
+        for value in (m.groups() if m else walk_fields(block, start)[1])
+    ]
+    return Fields(eid, ek_name if name is None else name, kind, a, z, ek[3:] if ek else "")
+
+
+def scan_records(buf, start=0, end=None, kinds=BLOCK_KINDS):
+    """
+    Like scan_blocks, but yield Records carrying the extracted Fields instead
+    of the block text.
+
+    Locating the end of a block and extracting its fields is a single
+    RECORD_RE match, or a single walk_fields pass for other bodies, so each
+    block is walked once and never decoded as a whole.
+
+    The generator returns the offset of a block left unterminated at end,
+    or None if every block was closed.
+    """
+    if end is None:
+        end = len(buf)
+    kinds = {k.encode() for k in kinds}
+    pos = start
+
+    while True:
+        m = TOP_RE.search(buf, pos, end)
+        if m is None:
+            return
+        name = m.group(1)
+        if name is None and buf[m.start()] != 0x7B:
+            # String, comment or stray '}'
+            pos = m.end()
+            continue
+        brace = m.end() - 1
+        if name not in kinds:
+            pos = skip_body(buf, brace, end)
+            if pos is None:
+                return m.start()
+            continue
+        rec = RECORD_RE.match(buf, brace, end)
+        if rec:
+            stop = rec.end()
+            groups = rec.groups()
+        else:
+            stop, groups = walk_fields(buf, brace, end)
+            if stop is None:
+                # Unterminated block at the end of the input
+                return m.start()
+        yield Record(name.decode(), m.start(), stop - m.start(), match_fields(groups))
+        pos = stop
+
+
+def iter_records(path, kinds=BLOCK_KINDS, wire=None):
+    """
+    Yield a Record per top-level block of a textproto file, or per entity
+    and relationship of a binary model decoded with wire, a
+    wireproto.WireMap.
+    """
+    if wire is not None:
+        from wireproto import iter_wire_records
+
+        yield from iter_wire_records(path, wire, kinds)
+        return
+    with open(path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return
+        try:
+            yield from scan_records(buf, kinds=kinds)
+        finally:
+            buf.close()
+
+
+def iter_spans(path, spans, raw=False):
+    """
+    Yield the decoded text of each (offset, length) span of a file, in the
+    order given, or with raw its bytes.
+    """
+    with open(path, "rb") as f:
+        for offset, length in spans:
+            f.seek(offset)
+            data = f.read(length)
+            yield data if raw else data.decode("utf-8")
+
+
+def shard_bounds(buf, count):
+    """
+    Split buf into at most count (start, end) byte ranges, each starting at
+    a line that opens a message.
+    """
+    size = len(buf)
+    starts = [0]
+    for i in range(1, count):
+        m = SHARD_RE.search(buf, max(size * i // count, starts[-1] + 1))
+        if m is None:
+            break
+        if m.start() > starts[-1]:
+            starts.append(m.start())
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def _map_shard(task):
+    path, start, end, kinds, func = task
+    state = {}
+
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            def records():
+                state["unterminated"] = yield from scan_records(buf, start, end, kinds)
+
+            result = func(records())
+        finally:
+            buf.close()
+    return result, state.get("unterminated") is not None
+
+
+def map_records(path, func, jobs=1, kinds=BLOCK_KINDS, wire=None):
+    """
+    Call func on the Records of each shard of a textproto file and return
+    the results in file order.
+
+    func receives an iterable of Records, must consume all of it, and must
+    be a module-level function (or functools.partial of one) with a
+    picklable result. With jobs > 1 the file is split into byte-range shards
+    parsed in a process pool; every worker mmaps the file itself. If a shard
+    boundary turns out not to be at top level, the file is parsed again
+    serially, so the results always concatenate to what one serial pass
+    would give. With wire, a wireproto.WireMap, path is a binary model.
+    """
+    if wire is not None:
+        from wireproto import map_wire_records
+
+        return map_wire_records(path, func, wire, jobs, kinds)
+    size = os.path.getsize(path)
+    count = min(jobs * 4, size // MIN_SHARD) if jobs > 1 else 1
+    if count > 1:
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                bounds = shard_bounds(buf, count)
+            finally:
+                buf.close()
+        if len(bounds) > 1:
+            tasks = [(path, start, end, kinds, func) for start, end in bounds]
+            with ProcessPoolExecutor(max_workers=jobs) as pool:
+                shards = list(pool.map(_map_shard, tasks))
+            # An unterminated block is only legitimate at the end of the file
+            if not any(unterminated for _, unterminated in shards[:-1]):
+                return [result for result, _ in shards]
+    return [func(iter_records(path, kinds))]
@@ -0,0 +1,371 @@
+"""
+Binary protobuf input for the NMTS tools.
+
+A binary NMTS model is the wire encoding of a message whose top-level
+fields are its entities and relationships, each one length-delimited,
+where the textproto has 'entity: {' and 'relationship: {' blocks. The
+decoder walks those fields straight off a memory-mapped file: a field
+of a kind not asked for is jumped over by its length, and inside the
+others only id, name, the ek_* type and its name, kind, a and z are read.
+Every other field is skipped by its wire type, without decoding.
+
+It yields the same Records as textproto.scan_records. A Record's offset
+and length span its whole top-level field, tag included, so kept spans
+concatenate to a valid binary model.
+
+Field numbers come from a wire map, a JSON file given with --wire-map,
+as there is no .proto to read them from. It must give every key of
+SYNTH_WIRE_MAP, the layout benchmarks/synth.py writes, which is made up
+and never applied to an input on its own. A binary input is refused
+without a wire map, and so is one whose first top-level fields are not
+entities or relationships by the map.
+"""
+import json
+import mmap
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+from textproto import BLOCK_KINDS, MIN_SHARD, Fields, Record
+
+# Wire types
+VARINT, FIXED64, LENGTH, START_GROUP, END_GROUP, FIXED32 = range(6)
+
+SYNTH_WIRE_MAP = {
+    # Top-level fields of the model
+    "entity": 1,
+    "relationship": 2,
+    # Scalar fields of entities and relationships: strings, or enums for
+    # kind
+    "entity_fields": {"id": 1, "name": 2},
+    "relationship_fields": {"a": 1, "kind": 2, "z": 3},
+    # The ek_* messages of an entity, by type, and the name field inside
+    "entity_types": {"site": 10, "rack": 11, "chassis": 12, "card": 13, "port": 14, "interface": 15},
+    "ek_name": 1,
+    # Values of the relationship kind enum
+    "relationship_kinds": {
+        "RK_UNSPECIFIED": 0, "RK_CONTAINS": 1, "RK_CONTROLS": 2, "RK_SUPPORTS": 3, "RK_AGGREGATES": 4,
+    },
+}
+
+# Extensions that mark a binary input
+BINARY_EXTENSIONS = (".pb", ".binpb", ".bin")
+
+# Top-level fields check_wire_map reads
+CHECKED_FIELDS = 64
+
+# Positions of the scalar Fields members
+SLOTS = {name: i for i, name in enumerate(Fields._fields[:5])}
+
+
+class WireMap:
+    """
+    A wire map turned into lookups by tag (field number and wire type), per
+    message kind: strings and enums by their Fields position, and the ek_*
+    messages of entities by type.
+    """
+
+    def __init__(self, spec):
+        missing = [key for key in SYNTH_WIRE_MAP if key not in spec]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        self.spec = spec
+        self.top = {spec[kind]: kind for kind in BLOCK_KINDS}
+        self.strings = {}
+        self.enums = {}
+        for kind in BLOCK_KINDS:
+            self.strings[kind] = {}
+            self.enums[kind] = {}
+            for name, number in spec[f"{kind}_fields"].items():
+                if name not in SLOTS:
+                    raise ValueError(f"{kind}_fields: unknown field {name!r}, not one of {', '.join(SLOTS)}")
+                self.strings[kind][number << 3 | LENGTH] = SLOTS[name]
+                self.enums[kind][number << 3 | VARINT] = SLOTS[name]
+        self.types = {kind: {} for kind in BLOCK_KINDS}
+        self.types["entity"] = {number << 3 | LENGTH: etype for etype, number in spec["entity_types"].items()}
+        self.ek_name = spec["ek_name"] << 3 | LENGTH
+        self.kinds = {number: name for name, number in spec["relationship_kinds"].items()}
+
+
+def load_wire_map(path):
+    """
+    The WireMap of the JSON file at path.
+    """
+    with open(path, encoding="utf-8") as f:
+        return WireMap(json.load(f))
+
+
+def add_wire_arguments(parser):
+    parser.add_argument("--binary", action="store_true",
+                        help="Input is binary protobuf (implied by a .pb, .binpb or .bin extension); needs --wire-map")
+    parser.add_argument("--wire-map", metavar="FILE",
+                        help="JSON field numbers of the binary model, required for binary input (see wireproto.py)")
+
+
+def input_wire_map(args):
+    """
+    The WireMap to decode args.input with, None for a textproto input.
+    """
+    if not (args.binary or args.wire_map or args.input.endswith(BINARY_EXTENSIONS)):
+        return None
+    if not args.wire_map:
+        sys.exit("Error: binary input needs --wire-map, the field numbers of its model")
+    try:
+        return load_wire_map(args.wire_map)
+    except Exception as e:
+        sys.exit(f"Error reading wire map: {e}")
+
+
+def read_varint(buf, pos):
+    """
+    Return the varint at buf[pos] and the offset past it.
+    """
+    result = shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def skip_field(buf, pos, wire_type):
+    """
+    Return the offset past the value of a field of wire_type at buf[pos].
+    """
+    if wire_type == VARINT:
+        while buf[pos] >= 0x80:
+            pos += 1
+        return pos + 1
+    if wire_type == LENGTH:
+        length, pos = read_varint(buf, pos)
+        return pos + length
+    if wire_type == FIXED64:
+        return pos + 8
+    if wire_type == FIXED32:
+        return pos + 4
+    if wire_type == START_GROUP:
+        # Deprecated groups: fields up to the matching END_GROUP
+        while True:
+            tag, pos = read_varint(buf, pos)
+            if tag & 7 == END_GROUP:
+                return pos
+            pos = skip_field(buf, pos, tag & 7)
+    raise ValueError(f"invalid wire type {wire_type} at offset {pos}")
+
+
+def message_string(buf, pos, end, tag):
+    """
+    The last string with tag directly inside the message buf[pos:end].
+    """
+    value = None
+    while pos < end:
+        field = buf[pos]
+        if field < 0x80:
+            pos += 1
+        else:
+            field, pos = read_varint(buf, pos)
+        if field & 7 != LENGTH:
+            pos = skip_field(buf, pos, field & 7)
+            continue
+        length = buf[pos]
+        if length < 0x80:
+            pos += 1
+        else:
+            length, pos = read_varint(buf, pos)
+        if field == tag:
+            value = buf[pos:pos + length].decode("utf-8")
+        pos += length
+    return value
+
+
+def decode_fields(buf, pos, end, strings, enums, types, wire):
+    """
+    Fields of the entity or relationship message buf[pos:end], given the
+    lookups of its kind in a WireMap. For a field that repeats, the last
+    value wins, as in protobuf.
+    """
+    values = [None, None, None, None, None]
+    entity_type = ""
+    ek_name = None
+    while pos < end:
+        # One-byte tags and lengths are the common case
+        tag = buf[pos]
+        if tag < 0x80:
+            pos += 1
+        else:
+            tag, pos = read_varint(buf, pos)
+        if tag & 7 == LENGTH:
+            length = buf[pos]
+            if length < 0x80:
+                pos += 1
+            else:
+                length, pos = read_varint(buf, pos)
+            stop = pos + length
+            slot = strings.get(tag)
+            if slot is not None:
+                values[slot] = buf[pos:stop].decode("utf-8")
+            elif tag in types:
+                entity_type = types[tag]
+                ek_name = message_string(buf, pos, stop, wire.ek_name)
+            pos = stop
+            continue
+        slot = enums.get(tag)
+        if slot is not None:
+            value, pos = read_varint(buf, pos)
+            values[slot] = wire.kinds.get(value, str(value))
+        else:
+            pos = skip_field(buf, pos, tag & 7)
+    if pos != end:
+        raise ValueError(f"message overruns its length at offset {end}")
+    eid, name, kind, a, z = values
+    return Fields(eid, ek_name if name is None else name, kind, a, z, entity_type)
+
+
+def scan_wire_records(buf, wire, start=0, end=None, kinds=BLOCK_KINDS):
+    """
+    Yield a Record per entity and relationship of kinds in buf[start:end],
+    a binary model.
+
+    The generator returns the offset of a field cut off at end, or None if
+    every field was whole.
+    """
+    if end is None:
+        end = len(buf)
+    # Top-level tag: kind and its lookups
+    wanted = {
+        number << 3 | LENGTH: (kind, wire.strings[kind], wire.enums[kind], wire.types[kind])
+        for number, kind in wire.top.items() if kind in kinds
+    }
+    pos = start
+
+    while pos < end:
+        offset = pos
+        try:
+            tag = buf[pos]
+            if tag < 0x80:
+                pos += 1
+            else:
+                tag, pos = read_varint(buf, pos)
+            if tag & 7 != LENGTH:
+                pos = skip_field(buf, pos, tag & 7)
+                continue
+            length = buf[pos]
+            if length < 0x80:
+                pos += 1
+            else:
+                length, pos = read_varint(buf, pos)
+        except IndexError:
+            return offset
+        stop = pos + length
+        if stop > end:
+            return offset
+        found = wanted.get(tag)
+        if found is not None:
+            kind, strings, enums, types = found
+            yield Record(kind, offset, stop - offset, decode_fields(buf, pos, stop, strings, enums, types, wire))
+        pos = stop
+    return None
+
+
+def check_wire_map(path, buf, wire):
+    """
+    Raise unless the first CHECKED_FIELDS top-level fields of buf, a binary
+    model, are whole and one of them is an entity or relationship by wire.
+    """
+    tags = {number << 3 | LENGTH for number in wire.top}
+    pos = 0
+    try:
+        for _ in range(CHECKED_FIELDS):
+            if pos >= len(buf):
+                break
+            tag, pos = read_varint(buf, pos)
+            if tag in tags:
+                return
+            if tag & 7 not in (VARINT, FIXED64, LENGTH, FIXED32):
+                break
+            pos = skip_field(buf, pos, tag & 7)
+    except IndexError:
+        pass
+    raise ValueError(f"{path}: not a binary model of the wire map, its top-level fields are not "
+                     f"entity ({wire.spec['entity']}) or relationship ({wire.spec['relationship']}) fields")
+
+
+def iter_wire_records(path, wire, kinds=BLOCK_KINDS):
+    """
+    Yield a Record per entity and relationship of a binary model file.
+    """
+    with open(path, "rb") as f:
+        try:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # Empty files cannot be mapped
+            return
+        try:
+            check_wire_map(path, buf, wire)
+            yield from whole_records(path, scan_wire_records(buf, wire, kinds=kinds))
+        finally:
+            buf.close()
+
+
+def whole_records(path, records):
+    """
+    Yield from a scan_wire_records generator, raising if the input ends
+    in the middle of a field.
+    """
+    unterminated = yield from records
+    if unterminated is not None:
+        raise ValueError(f"{path}: truncated field at offset {unterminated}")
+
+
+def wire_shard_bounds(buf, count):
+    """
+    Split buf into at most count (start, end) byte ranges on top-level
+    field boundaries, found by jumping from field to field.
+    """
+    size = len(buf)
+    starts = [0]
+    target = size // count
+    pos = 0
+    try:
+        while pos < size and len(starts) < count:
+            if pos >= target:
+                starts.append(pos)
+                target = size * len(starts) // count
+            tag, pos = read_varint(buf, pos)
+            pos = skip_field(buf, pos, tag & 7)
+    except IndexError:
+        raise ValueError(f"truncated field after offset {starts[-1]}")
+    return list(zip(starts, starts[1:] + [size]))
+
+
+def _map_wire_shard(task):
+    path, start, end, kinds, wire, func = task
+    with open(path, "rb") as f:
+        buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return func(whole_records(path, scan_wire_records(buf, wire, start, end, kinds)))
+        finally:
+            buf.close()
+
+
+def map_wire_records(path, func, wire, jobs=1, kinds=BLOCK_KINDS):
+    """
+    textproto.map_records for a binary model file. Shard boundaries are
+    field boundaries, found before parsing, so no shard is ever parsed
+    again.
+    """
+    size = os.path.getsize(path)
+    if jobs > 1 and size >= 2 * MIN_SHARD:
+        with open(path, "rb") as f:
+            buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            try:
+                check_wire_map(path, buf, wire)
+                bounds = wire_shard_bounds(buf, min(jobs * 4, size // MIN_SHARD))
+            finally:
+                buf.close()
+        tasks = [(path, start, end, kinds, wire, func) for start, end in bounds]
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            return list(pool.map(_map_wire_shard, tasks))
+    return [func(iter_wire_records(path, wire, kinds))]
@@ -2,10 +2,21 @@ import sys
 
 from setuptools import setup, find_packages
 
+# The parser table of the registry, which imports nothing but the stdlib
+from extraparsers.registry import GROUP, PARSERS
+
 with open("requirements.txt") as fp:
     requirements = fp.read()
 
 
+def entry_points():
+    """The parsers of registry.PARSERS as entry points, by group"""
+    return {
+        GROUP.format(os=os): [f"{name} = {value}" for name, value in parsers.items()]
+        for os, parsers in PARSERS.items()
+    }
+
+
 def setup_package():
     needs_sphinx = {"build_sphinx", "upload_docs"}.intersection(sys.argv)
     sphinx = ["sphinx"] if needs_sphinx else []
@@ -14,6 +25,7 @@ def setup_package():
         packages=find_packages(),
         include_package_data=True,
         install_requires=requirements,
+        entry_points=entry_points(),
     )
 
 
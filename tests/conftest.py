@@ -0,0 +1,7 @@
+import os
+import sys
+
+# The proto tools are scripts importing each other by module name; the
+# benchmarks' synth.py writes their inputs
+for directory in ("proto", "benchmarks"):
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", directory))
@@ -0,0 +1,67 @@
+"""Command outputs as recorded from a device, for the parser tests"""
+
+TOP = """\
+top - 13:03:02 up  3:53,  1 user,  load average: 0.00, 0.05, 0.07
+Tasks: 158 total,   1 running, 157 sleeping,   0 stopped,   0 zombie
+%Cpu(s):  0.0 us,  6.2 sy,  0.0 ni, 93.8 id,  0.0 wa,  0.0 hi,  0.0 si,  0.0 st
+MiB Mem :   3924.3 total,   2434.9 free,    287.7 used,   1201.7 buff/cache
+MiB Swap:    923.3 total,    923.3 free,      0.0 used.   3380.2 avail Mem
+
+    PID USER      PR  NI    VIRT    RES    SHR S  %CPU  %MEM     TIME+ COMMAND
+   2936 yuanl     20   0   11872   3764   3308 R   6.2   0.1   0:00.02 top
+      1 root      20   0  101536  11020   8124 S   0.0   0.3   0:01.86 systemd
+      3 root       0 -20       0      0      0 I   0.0   0.0   0:00.00 rcu_gp
+"""
+
+
+def top_batch(iterations):
+    """'top -b -d 1 -n <iterations>' output, the time of day one second
+    later in each snapshot"""
+    snapshots = []
+    for i in range(iterations):
+        snapshots.append(f"""\
+top - 13:03:{i:02d} up  3:53,  1 user,  load average: 0.00, 0.05, 0.07
+Tasks: 158 total,   1 running, 157 sleeping,   0 stopped,   0 zombie
+%Cpu(s):  0.0 us,  6.2 sy,  0.0 ni, 93.8 id,  0.0 wa,  0.0 hi,  0.0 si,  0.0 st
+MiB Mem :   3924.3 total,   2434.9 free,    287.7 used,   1201.7 buff/cache
+MiB Swap:    923.3 total,    923.3 free,      0.0 used.   3380.2 avail Mem
+
+    PID USER      PR  NI    VIRT    RES    SHR S  %CPU  %MEM     TIME+ COMMAND
+   2936 yuanl     20   0   11872   3764   3308 R   {i}.0   0.1   0:00.0{i} top
+      1 root      20   0  101536  11020   8124 S   0.0   0.3   0:01.86 systemd
+
+""")
+    return "".join(snapshots)
+
+
+def stat(pid, comm, state, utime, stime, start):
+    """A /proc/<pid>/stat line, as grep prints it"""
+    return (f"/proc/{pid}/stat:{pid} ({comm}) {state} 0 1 1 0 -1 4194560 58659 342387 69 217"
+            f" {utime} {stime} 789 125 20 0 1 0 {start} 24571904 2362")
+
+
+# The two samples of ProcStat, 100 jiffies of one CPU apart: systemd used
+# 10 of them, "my (app)" 100 and pid 77, started in between, 10. Pid 99
+# exited before stat ran.
+PROC_STAT = "\n".join([
+    stat(1, "systemd", "S", 376, 917, 6),
+    stat(42, "my (app)", "R", 1000, 0, 500),
+    "/proc/stat:cpu  1000 0 1000 8000 0 0 0 0 0 0",
+    "/proc/stat:cpu0 500 0 500 4000 0 0 0 0 0 0",
+    "/proc/stat:cpu1 500 0 500 4000 0 0 0 0 0 0",
+    "--",
+    stat(1, "systemd", "S", 386, 917, 6),
+    stat(42, "my (app)", "R", 1050, 50, 500),
+    stat(77, "sh", "S", 5, 5, 9000),
+    stat(99, "gone", "Z", 0, 0, 9001),
+    "/proc/1/statm:5999 2381 1664 1593 0 3960 0",
+    "/proc/77/statm:600 200 100 10 0 50 0",
+    "/proc/meminfo:MemTotal:        6158152 kB",
+    "/proc/meminfo:MemFree:         4069884 kB",
+    "/proc/stat:cpu  1100 0 1100 8000 0 0 0 0 0 0",
+    "/proc/stat:cpu0 550 0 550 4000 0 0 0 0 0 0",
+    "/proc/stat:cpu1 550 0 550 4000 0 0 0 0 0 0",
+    "/proc/1 root",
+    "/proc/42 yuanl",
+    "/proc/77 root",
+]) + "\n"
@@ -0,0 +1,120 @@
+"""Forest building of proto2tree.py: deep chains, shared nodes, cycles"""
+
+from proto2tree import CYCLE, REF, build_forest, contains_graph, flat_forest, forest_views, walk_forest
+
+
+def entities_of(*ids):
+    return {eid: {"name": eid, "type": "card"} for eid in ids}
+
+
+def iter_nodes(forest):
+    """Every node of a nested forest, without recursion"""
+    stack = list(forest)
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node["children"])
+
+
+def test_deep_chain_builds_without_recursion():
+    depth = 100000
+    ids = [f"e{i:06d}" for i in range(depth)]
+    edges = list(zip(ids, ids[1:]))
+
+    walked = list(walk_forest(contains_graph(entities_of(*ids), edges)))
+    assert len(walked) == depth
+    assert walked[-1][0] == depth - 1
+
+    forest, cycles = build_forest(entities_of(*ids), edges)
+    assert cycles == []
+    assert len(forest) == 1
+    node, levels = forest[0], 1
+    while node["children"]:
+        (node,) = node["children"]
+        levels += 1
+    assert levels == depth
+    assert node["id"] == ids[-1]
+
+
+def diamonds(layers):
+    """top -> l0a, l0b -> l1a, l1b -> ... -> bottom: 2 ** layers paths"""
+    edges = []
+    above = ["top"]
+    for i in range(layers):
+        level = [f"l{i}a", f"l{i}b"]
+        edges.extend((p, c) for p in above for c in level)
+        above = level
+    edges.extend((p, "bottom") for p in above)
+    ids = {eid for edge in edges for eid in edge}
+    return entities_of(*ids), edges
+
+
+def test_diamonds_stay_linear_with_ref():
+    entities, edges = diamonds(20)
+
+    payload, cycles = flat_forest(entities, edges, shared="ref")
+    assert cycles == []
+    # One node per edge plus the root: each node is expanded once and
+    # reached again as a ref
+    assert len(payload["node"]) == len(edges) + 1
+    flags = payload["flag"]
+    assert flags.count(0) == len(entities)
+    assert flags.count(REF) == len(edges) + 1 - len(entities)
+
+    forest, _ = build_forest(entities, edges, shared="ref")
+    nodes = list(iter_nodes(forest))
+    assert len(nodes) == len(edges) + 1
+    assert all(not node["children"] for node in nodes if node.get("ref"))
+
+
+def test_diamonds_copy_repeats_subtrees():
+    entities, edges = diamonds(4)
+
+    payload, _ = flat_forest(entities, edges, shared="copy")
+    # Every path from the top is expanded: 2 + 4 + 8 + 16 + 16 nodes below it
+    assert len(payload["node"]) == 1 + 2 + 4 + 8 + 16 + 16
+    assert REF not in payload["flag"]
+
+
+def test_cycle_reported_once_and_flagged():
+    entities = entities_of("root", "a", "b", "c")
+    edges = [("root", "a"), ("a", "b"), ("b", "c"), ("c", "a")]
+
+    forest, cycles = build_forest(entities, edges)
+    assert cycles == [("a", "b", "c")]
+
+    nodes = list(iter_nodes(forest))
+    flagged = [node for node in nodes if node.get("cycle")]
+    assert [node["id"] for node in flagged] == ["a"]
+    assert flagged[0]["children"] == []
+    assert sorted(node["id"] for node in nodes if not node.get("cycle")) == ["a", "b", "c", "root"]
+
+
+def test_nodes_behind_an_unrooted_cycle_are_emitted():
+    # x <-> y with z under y: no root leads there
+    entities = entities_of("r", "x", "y", "z")
+    edges = [("x", "y"), ("y", "x"), ("y", "z")]
+
+    forest, cycles = build_forest(entities, edges)
+    assert cycles == [("x", "y")]
+    assert [node["id"] for node in forest] == ["r", "x"]
+
+    emitted = {node["id"] for node in iter_nodes(forest) if not node.get("cycle")}
+    assert emitted == {"r", "x", "y", "z"}
+    walked = [(depth, flag) for depth, _, flag in walk_forest(contains_graph(entities, edges))]
+    assert walked == [(0, 0), (0, 0), (1, 0), (2, CYCLE), (2, 0)]
+
+
+def test_views_skip_ids_of_other_kinds():
+    # x is only named by an RK_CONTROLS edge: no node of the RK_CONTAINS view
+    entities = entities_of("a", "b")
+    edges = {"RK_CONTAINS": [("a", "b")], "RK_CONTROLS": [("a", "x")]}
+
+    payload, cycles = forest_views(entities, edges)
+    assert payload["ids"] == ["a", "b", "x"]
+    assert cycles == {"RK_CONTAINS": [], "RK_CONTROLS": []}
+    contains, controls = payload["views"]
+    assert (contains["node"], contains["parent"]) == ([0, 1], [-1, 0])
+    assert (controls["node"], controls["parent"]) == ([0, 2, 1], [-1, 0, -1])
+    for view in payload["views"]:
+        assert all(0 <= node < len(payload["ids"]) for node in view["node"])
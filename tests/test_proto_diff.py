@@ -0,0 +1,66 @@
+"""Snapshot diffs of proto_diff.py"""
+
+import synth
+from proto_diff import block_text, diff_snapshots
+
+
+def write(path, blocks):
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(blocks)
+    return str(path)
+
+
+def changes(old, new):
+    stats = {}
+    found = [(change, key) for change, key, _, _ in diff_snapshots(old, new, stats)]
+    return found, stats["unchanged"]
+
+
+def test_reordered_and_reformatted_blocks_are_unchanged(tmp_path):
+    blocks = list(synth.iter_textproto(300, seed=1))
+    old = write(tmp_path / "old.txtproto", blocks)
+    # Reversed, with comments, separators and other whitespace
+    reformatted = [
+        block.replace("{\n", "{  # reformatted\n", 1).replace('"\n', '";\n').replace("  ", "\t")
+        for block in reversed(blocks)
+    ]
+    new = write(tmp_path / "new.txtproto", reformatted)
+    assert changes(old, new) == ([], 300)
+    assert changes(old, old) == ([], 300)
+
+
+def test_added_removed_modified(tmp_path):
+    blocks = list(synth.iter_textproto(40, seed=2))
+    old = write(tmp_path / "old.txtproto", blocks)
+    new_blocks = list(blocks)
+    # e3 renamed, a relationship dropped, an entity added
+    new_blocks[3] = new_blocks[3].replace("card-3", "card-3b")
+    removed = new_blocks.pop(25)
+    new_blocks.append('entity: {\n  id: "e99"\n}\n')
+    new = write(tmp_path / "new.txtproto", new_blocks)
+
+    found, unchanged = changes(old, new)
+    assert found[:2] == [("~", "entity e3"), ("+", "entity e99")]
+    assert len(found) == 3 and found[2][0] == "-" and found[2][1].startswith("relationship RK_")
+    assert unchanged == 38
+    spans = {change: (old_span, new_span) for change, _, old_span, new_span in diff_snapshots(old, new)}
+    assert block_text(old, spans["-"][0]) == removed.strip()
+    assert block_text(new, spans["~"][1]) == new_blocks[3].strip()
+
+
+def test_repeated_entries_match_in_order(tmp_path):
+    block = 'relationship: {\n  a: "e1"\n  kind: RK_CONTAINS\n  z: "e2"\n}\n'
+    old = write(tmp_path / "old.txtproto", [block] * 2)
+    new = write(tmp_path / "new.txtproto", [block] * 3)
+    assert changes(old, new) == ([("+", "relationship RK_CONTAINS e1 -> e2")], 2)
+    assert changes(new, old) == ([("-", "relationship RK_CONTAINS e1 -> e2")], 2)
+
+
+def test_empty_snapshots(tmp_path):
+    empty = write(tmp_path / "empty.txtproto", [])
+    full = write(tmp_path / "full.txtproto", list(synth.iter_textproto(10)))
+    assert changes(empty, empty) == ([], 0)
+    found, _ = changes(empty, full)
+    assert [change for change, _ in found] == ["+"] * 10
+    found, _ = changes(full, empty)
+    assert [change for change, _ in found] == ["-"] * 10
@@ -0,0 +1,70 @@
+"""Sidecar index of proto_index.py: same selections as a scan, and staleness"""
+
+import os
+
+import pytest
+
+import synth
+from proto_filter import select_from_index, select_from_scan
+from proto_index import build_index, index_path, load_index
+from wireproto import SYNTH_WIRE_MAP, WireMap
+
+SELECTIONS = [{"RK_CONTAINS"}, {"RK_CONTROLS", "RK_SUPPORTS"}, set(synth.RELATIONSHIP_KINDS), {"RK_ABSENT"}]
+
+
+@pytest.mark.parametrize("binary", [False, True])
+def test_index_selects_as_scan(tmp_path, binary):
+    wire = None
+    if binary:
+        path = synth.write_wireproto(str(tmp_path / "model.pb"), 2000, seed=3)
+        wire = WireMap(SYNTH_WIRE_MAP)
+    else:
+        path = synth.write_textproto(str(tmp_path / "model.txtproto"), 2000, seed=3)
+    assert build_index(path, wire=wire) == index_path(path)
+
+    idx = load_index(path)
+    assert idx is not None
+    assert idx.header["entities"] + idx.header["relationships"] == 2000
+    for kinds in SELECTIONS:
+        assert select_from_index(idx, kinds) == select_from_scan(path, kinds, wire=wire)
+
+
+def test_repeated_ids(tmp_path):
+    path = str(tmp_path / "model.txtproto")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('entity: { id: "a" }\nentity: { id: "b" }\nentity: { id: "a" ek_card: { name: "again" } }\n'
+                'relationship: { a: "a" kind: RK_CONTAINS z: "c" }\n')
+    build_index(path)
+    entities, relationships = select_from_index(load_index(path), {"RK_CONTAINS"})
+    assert entities == select_from_scan(path, {"RK_CONTAINS"})[0]
+    assert len(entities) == 2 and len(relationships) == 1
+
+
+def test_stale_index_is_ignored_until_rebuilt(tmp_path, capsys):
+    path = synth.write_textproto(str(tmp_path / "model.txtproto"), 200)
+    build_index(path)
+    assert load_index(path) is not None
+
+    # Same size and mtime: only the fingerprint tells the change
+    st = os.stat(path)
+    with open(path, "r+b") as f:
+        data = f.read()
+        f.seek(0)
+        f.write(data.replace(b'"e1"', b'"e9"', 1))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert os.stat(path).st_size == st.st_size
+    assert load_index(path) is None
+    assert "Ignoring stale index" in capsys.readouterr().err
+
+    build_index(path)
+    idx = load_index(path)
+    assert idx is not None
+    assert select_from_index(idx, {"RK_CONTAINS"}) == select_from_scan(path, {"RK_CONTAINS"})
+
+
+def test_not_an_index(tmp_path, capsys):
+    path = synth.write_textproto(str(tmp_path / "model.txtproto"), 20)
+    with open(index_path(path), "wb") as f:
+        f.write(b"something else\n")
+    assert load_index(path) is None
+    assert "is not an index file" in capsys.readouterr().err
@@ -0,0 +1,113 @@
+"""Recordings, ReplayDevice and ParseCache"""
+
+import pytest
+
+pytest.importorskip("genie")
+
+from extraparsers.replay import (  # noqa: E402
+    ParseCache,
+    Recorder,
+    ReplayDevice,
+    load_recording,
+    replay_devices,
+    save_recording,
+)
+
+from extraparsers.top import Top  # noqa: E402
+
+from .recorded import TOP, top_batch  # noqa: E402
+
+
+class TopMissingFields(Top):
+    """Top whose result breaks TopSchema"""
+
+    def cli(self, output=None, columnar=False):
+        parsed = super().cli(output=output, columnar=columnar)
+        if not columnar:
+            del parsed["pid"]["1"]["command"]
+        return parsed
+
+
+def test_cache_hits_and_misses():
+    cache = ParseCache()
+    entries = [(name, "top -n 1 -b", TOP) for name in ("egypt", "sudan")]
+    egypt = ReplayDevice("egypt", entries, cache=cache)
+    sudan = ReplayDevice("sudan", entries, cache=cache)
+
+    first = egypt.parse("top -n 1 -b")
+    assert (cache.hits, cache.misses) == (0, 1)
+    # The same output on another device is parsed once
+    assert sudan.parse("top -n 1 -b") is first
+    assert (cache.hits, cache.misses) == (1, 1)
+    # Other options are another result
+    sudan.parse("top -n 1 -b", columnar=True)
+    sudan.parse("top -n 1 -b", columnar=True)
+    assert (cache.hits, cache.misses) == (2, 2)
+    # And so is another output
+    egypt.parse("top -n 1 -b", output=TOP.replace("yuanl", "root"))
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_results_are_validated():
+    cache = ParseCache()
+    device = ReplayDevice("egypt", [("egypt", "top -n 1 -b", TOP)], parsers=[TopMissingFields], cache=cache)
+
+    with pytest.raises(Exception):
+        device.parse("top -n 1 -b")
+    # Nothing invalid is cached, and columnar results are not dicts to check
+    assert not cache.results
+    assert len(device.parse("top -n 1 -b", columnar=True)) == 3
+
+
+def test_cache_size_bound():
+    cache = ParseCache(maxsize=2)
+    device = ReplayDevice("egypt", [], cache=cache)
+    outputs = [top_batch(n) for n in (1, 2, 3)]
+    for output in outputs:
+        device.parse("top -b -d 1 -n 3", output=output)
+    assert len(cache.results) == 2
+
+    # The oldest output was dropped, the last one kept
+    device.parse("top -b -d 1 -n 3", output=outputs[0])
+    device.parse("top -b -d 1 -n 3", output=outputs[2])
+    assert (cache.hits, cache.misses) == (1, 4)
+
+
+def test_recording_round_trip(tmp_path):
+    path = tmp_path / "sweep.json.gz"
+    live = [
+        ("egypt", "top -n 1 -b", TOP),
+        ("egypt", "top -b -d 1 -n 2", top_batch(2)),
+        ("sudan", "top -n 1 -b", TOP.replace("yuanl", "root")),
+    ]
+    entries = []
+    for name in ("egypt", "sudan"):
+        recorder = Recorder(ReplayDevice(name, live), entries)
+        for _, command, _ in (entry for entry in live if entry[0] == name):
+            recorder.execute(command)
+    assert entries == live
+
+    save_recording(path, entries)
+    assert load_recording(path) == live
+
+    devices = replay_devices(path)
+    assert sorted(devices) == ["egypt", "sudan"]
+    assert devices["egypt"].parse("top -b -d 1 -n 2")["snapshot"][2]["time"] == "13:03:01"
+    assert devices["sudan"].parse("top -n 1 -b")["pid"]["2936"]["user"] == "root"
+    with pytest.raises(KeyError):
+        devices["sudan"].execute("top -b -d 1 -n 2")
+
+
+def test_recording_keeps_each_output_once(tmp_path):
+    path = tmp_path / "sweep.json.gz"
+    entries = [(f"host{i}", "top -n 1 -b", TOP) for i in range(50)]
+    save_recording(path, entries)
+
+    assert path.stat().st_size < 2 * len(TOP)
+    assert load_recording(path) == entries
+
+
+def test_replay_serves_outputs_in_turn():
+    device = ReplayDevice("egypt", [("egypt", "uptime", "1"), ("egypt", "uptime", "2"), ("sudan", "uptime", "3")])
+
+    assert [device.execute("uptime") for _ in range(3)] == ["1", "2", "2"]
@@ -0,0 +1,115 @@
+"""Top, TopBatch and ProcStat on recorded outputs, through ReplayDevice"""
+
+import pytest
+
+pytest.importorskip("genie")
+
+from extraparsers.proc_stat import ProcStat  # noqa: E402
+from extraparsers.replay import ReplayDevice  # noqa: E402
+from extraparsers.top import TopBatch, TopColumns  # noqa: E402
+
+from .recorded import PROC_STAT, TOP, top_batch  # noqa: E402
+
+
+def replay(command, *outputs):
+    return ReplayDevice("egypt", [("egypt", command, output) for output in outputs])
+
+
+def test_top_dict():
+    parsed = replay("top -n 1 -b", TOP).parse("top -n 1 -b")
+
+    assert list(parsed["pid"]) == ["2936", "1", "3"]
+    assert parsed["pid"]["2936"] == {
+        "user": "yuanl",
+        "pr": 20,
+        "ni": 0,
+        "virt": 11872,
+        "res": 3764,
+        "shr": 3308,
+        "s": "R",
+        "cpu": 6.2,
+        "mem": 0.1,
+        "time": "0:00.02",
+        "command": "top",
+    }
+    assert parsed["pid"]["3"]["ni"] == -20
+
+
+def test_top_columnar_matches_dict():
+    device = replay("top -n 1 -b", TOP)
+    columns = device.parse("top -n 1 -b", columnar=True)
+
+    assert isinstance(columns, TopColumns)
+    assert len(columns) == 3
+    assert list(columns.pid) == [2936, 1, 3]
+    assert list(columns.res) == [3764, 11020, 0]
+    assert columns.users[columns.user[1]] == "root"
+    assert columns.to_dict() == device.parse("top -n 1 -b")
+
+
+def test_top_batch_snapshots():
+    parsed = replay("top -b -d 1 -n 3", top_batch(3)).parse("top -b -d 1 -n 3")
+
+    assert list(parsed["snapshot"]) == [1, 2, 3]
+    snapshot = parsed["snapshot"][3]
+    assert snapshot["time"] == "13:03:02"
+    assert snapshot["load_average"] == {"1min": 0.0, "5min": 0.05, "15min": 0.07}
+    assert snapshot["tasks"]["total"] == 158
+    assert snapshot["mem"] == {"unit": "MiB", "total": 3924.3, "free": 2434.9, "used": 287.7, "buff_cache": 1201.7}
+    assert snapshot["pid"]["2936"]["cpu"] == 2.0
+
+
+def test_top_batch_history_bound():
+    parser = TopBatch(history=2)
+    parsed = parser.cli(output=top_batch(5))
+
+    # The last two snapshots, numbered over the whole output
+    assert list(parsed["snapshot"]) == [4, 5]
+    assert parsed["snapshot"][5]["time"] == "13:03:04"
+    assert parser.count == 5
+    assert len(parser.history) == 2
+
+
+def test_top_batch_columnar_stream():
+    output = top_batch(3)
+    chunks = [output[i:i + 7] for i in range(0, len(output), 7)]
+    parsed = TopBatch().cli(output=iter(chunks), columnar=True)
+
+    assert list(parsed["snapshot"]) == [1, 2, 3]
+    expected = TopBatch().cli(output=output)["snapshot"][2]
+    assert parsed["snapshot"][2]["pid"].to_dict() == {"pid": expected["pid"]}
+    assert list(parsed["snapshot"][2]["pid"].cpu) == [1.0, 0.0]
+
+
+def test_proc_stat():
+    command = ProcStat.cli_command[0].format(interval=1)
+    procs = replay(command, PROC_STAT).parse(command)["pid"]
+
+    # Pid 99 has no owner: it exited before stat ran
+    assert sorted(procs) == ["1", "42", "77"]
+    assert procs["1"] == {
+        "user": "root",
+        "pr": 20,
+        "ni": 0,
+        "virt": 23996,
+        "res": 9524,
+        "shr": 6656,
+        "s": "S",
+        "cpu": 10.0,
+        "mem": pytest.approx(100.0 * 9524 / 6158152),
+        "time": "0:13.03",
+        "command": "systemd",
+    }
+    # The whole comm, and RES from stat without a statm line
+    assert procs["42"]["command"] == "my (app)"
+    assert (procs["42"]["res"], procs["42"]["shr"]) == (9448, 0)
+    assert procs["42"]["cpu"] == 100.0
+    # Started between the samples: all its jiffies count
+    assert procs["77"]["cpu"] == 10.0
+
+
+def test_proc_stat_single_sample():
+    procs = ProcStat().cli(output=PROC_STAT.partition("--\n")[2])["pid"]
+
+    assert sorted(procs) == ["1", "42", "77"]
+    assert {proc["cpu"] for proc in procs.values()} == {0.0}
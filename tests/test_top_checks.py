@@ -0,0 +1,106 @@
+"""top_checks rules, on builtins and with numpy"""
+
+import random
+
+import pytest
+
+pytest.importorskip("genie")
+
+from extraparsers import top_checks  # noqa: E402
+from extraparsers.top import Top, TopColumns  # noqa: E402
+from extraparsers.top_checks import DeviceTable, Rule, compile_rules, evaluate, parse_value, verdict  # noqa: E402
+
+from .recorded import TOP  # noqa: E402
+
+RULES = [
+    "cpu <= 90", "cpu < 50 where command == java", "mem < 5", "res < 1GiB", "virt <= 2G where user == root",
+    "ni >= 0", "pr == 20", "cpu != 0 where s == Z", "count() == 0 where s == Z", "count() < 40",
+    "count() <= 3 where user == oracle and command == java", "sum(mem) < 20 where user == oracle",
+    "max(res) < 512MiB", "min(pid) > 1", "mean(cpu) < 10", "mean(cpu) < 10 where command == absent",
+    "max(cpu) < 99 where user == nobody", "sum(cpu) < 200 where command == absent",
+]
+USERS = ["root", "oracle", "www", "nobody"]
+COMMANDS = ["java", "sshd", "nginx", "bash", "postgres"]
+
+
+def device_columns(seed, n):
+    """TopColumns of n made-up processes"""
+    rng = random.Random(seed)
+    rows = []
+    for pid in rng.sample(range(1, 100000), n):
+        rows.append((
+            str(pid), rng.choice(USERS), str(rng.choice([0, 20, 39])), str(rng.choice([-20, 0, 5])),
+            str(rng.randrange(1 << 22)), str(rng.randrange(1 << 20)), str(rng.randrange(1 << 16)),
+            rng.choice("SSSRDZ"), f"{rng.randrange(1000) / 10:.1f}", f"{rng.randrange(100) / 10:.1f}",
+            "0:01.00", rng.choice(COMMANDS),
+        ))
+    return TopColumns([list(column) for column in zip(*rows)] or [[] for _ in range(12)])
+
+
+def devices():
+    tables = {f"host{k}": device_columns(k, n) for k, n in enumerate([0, 1, 2, 7, 30, 300, 1, 60])}
+    # Top results as dicts are converted
+    tables["dict"] = device_columns(99, 20).to_dict()
+    tables["top"] = Top().cli(output=TOP)
+    return tables
+
+
+def test_rule_parsing():
+    rule = Rule("res < 8GiB where command == java and user == 'oracle'")
+    assert (rule.metric, rule.op, rule.value) == ("res", "<", 8 * 1024 ** 2)
+    assert rule.where == (("command", "java"), ("user", "oracle"))
+    assert Rule("count() == 0 where s == Z").stat == "count"
+    assert parse_value("1.5M") == 1536.0
+    assert [rule.name for rule in compile_rules({"zombies": "count() == 0 where s == Z"})] == ["zombies"]
+    for text in ("cpu <", "load < 5", "count(cpu) < 5", "sum() < 5", "median(cpu) < 5",
+                 "cpu < 5 where pid == 1", "cpu < lots"):
+        with pytest.raises(ValueError):
+            Rule(text)
+
+
+def test_device_table():
+    table = DeviceTable(device_columns(1, 50))
+    procs = table.columns.to_dict()["pid"]
+    java = [proc for proc in procs.values() if proc["command"] == "java"]
+    where = (("command", "java"),)
+    assert table.stat("count", None, where) == len(java)
+    assert table.stat("sum", "res", where) == sum(proc["res"] for proc in java)
+    assert table.stat("max", "cpu", None) == max(proc["cpu"] for proc in procs.values())
+    assert table.stat("max", "cpu", (("command", "absent"),)) is None
+    assert sorted(table.columns.pid[row] for row in table.rows(where)) == sorted(
+        int(pid) for pid, proc in procs.items() if proc["command"] == "java")
+
+
+def test_builtins_and_numpy_agree(monkeypatch):
+    pytest.importorskip("numpy")
+    rules = compile_rules(RULES)
+    tables = devices()
+
+    with_numpy = evaluate(rules, tables)
+    monkeypatch.setattr(top_checks, "numpy", None)
+    with_builtins = evaluate(rules, tables)
+
+    assert len(with_numpy) == len(rules) * len(tables)
+    assert [(r["rule"], r["device"], r["passed"], r.get("offenders")) for r in with_numpy] == [
+        (r["rule"], r["device"], r["passed"], r.get("offenders")) for r in with_builtins]
+    # Sums may differ in the last bits: numpy adds pairwise
+    assert [r["value"] for r in with_numpy] == [
+        pytest.approx(r["value"]) if isinstance(r["value"], float) else r["value"] for r in with_builtins]
+    assert verdict(with_numpy)[0] == verdict(with_builtins)[0]
+
+
+def test_builtin_verdicts(monkeypatch):
+    monkeypatch.setattr(top_checks, "numpy", None)
+    tables = {"egypt": Top().cli(output=TOP), "empty": {}}
+    results = evaluate(compile_rules(["cpu < 5", "count() == 0 where s == Z", "max(res) < 1"]), tables)
+
+    by_key = {(r["rule"], r["device"]): r for r in results}
+    assert by_key[("cpu < 5", "egypt")]["offenders"] == [2936]
+    assert by_key[("cpu < 5", "empty")]["passed"]
+    assert by_key[("count() == 0 where s == Z", "egypt")]["value"] == 0
+    assert by_key[("max(res) < 1", "empty")] == {"rule": "max(res) < 1", "device": "empty", "passed": True,
+                                                 "value": None}
+    passed, message = verdict(results)
+    assert not passed
+    assert message.splitlines()[0] == "2 of 6 checks failed:"
+    assert "  egypt: cpu < 5 (got 6.2) pids 2936" in message
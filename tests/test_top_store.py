@@ -0,0 +1,54 @@
+"""TopStore rings and downsampling"""
+
+import pytest
+
+from extraparsers.top_store import TopStore
+
+
+def sample(cpu, res, cputime="0:01.00"):
+    """A TopSchema dict of one process, pid 42"""
+    return {"pid": {42: dict(user="root", command="java", time=cputime, cpu=cpu, mem=1.0, res=res, virt=res * 4)}}
+
+
+def test_points_count_every_sample_once():
+    store = TopStore(size=8, levels=3, factor=3, expire=10 ** 6)
+    # The last level holds 8 means of 9 samples: beyond 72 + 8 + 2 samples
+    # the oldest start to go
+    capacity = store.size * store.factor ** (store.levels - 1)
+    cpus = []
+    for n in range(capacity):
+        cpus.append(float(n % 7))
+        store.add("dev", sample(cpus[-1], 1000 + 8 * n), timestamp=1000.0 + 5 * n)
+        points = store.points(store.devices["dev"][42], "cpu")
+        assert sum(weight for _, _, weight in points) == n + 1
+        assert sum(value * weight for _, value, weight in points) == pytest.approx(sum(cpus))
+        times = [t for t, _, _ in points]
+        assert times == sorted(times) and len(set(times)) == len(times)
+
+    # Coarser levels hold the older samples; a level leaves out at most
+    # factor - 1 of its entries, the rest of a partly overwritten group
+    weights = [weight for _, _, weight in points]
+    assert weights == sorted(weights, reverse=True)
+    assert set(weights) == {1, 3, 9}
+    assert weights.count(1) > store.size - store.factor
+    assert store.growth("dev", 42) == pytest.approx(8 / 5)
+    assert store.series("dev", 42, window=20) == [(1000.0 + 5 * n, cpus[n]) for n in range(capacity - 5, capacity)]
+
+
+def test_new_series_on_reused_pid():
+    store = TopStore(expire=60)
+    store.add("dev", sample(5.0, 100, "1:00.00"), timestamp=0.0)
+    store.add("dev", sample(6.0, 100, "1:01.00"), timestamp=5.0)
+    # TIME+ went down: another process got the pid
+    store.add("dev", sample(7.0, 200, "0:00.10"), timestamp=10.0)
+    assert store.reused == 1
+    assert store.series("dev", 42) == [(10.0, 7.0)]
+    # Not seen for longer than expire
+    store.add("dev", {"pid": {}}, timestamp=100.0)
+    assert store.processes("dev") == {}
+    assert store.series("dev", 42) == []
+
+
+def test_size_below_factor():
+    with pytest.raises(ValueError):
+        TopStore(size=4, factor=6)
@@ -0,0 +1,63 @@
+"""Binary input of the proto tools: wireproto.py against textproto.py"""
+
+import argparse
+import mmap
+
+import pytest
+
+import synth
+from textproto import scan_records
+from wireproto import SYNTH_WIRE_MAP, WireMap, input_wire_map, iter_wire_records, scan_wire_records
+
+
+def records_of(scan, path, *args, **kwargs):
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+        return [(rec.kind, rec.fields) for rec in scan(buf, *args, **kwargs)]
+
+
+@pytest.mark.parametrize("kinds", [("entity", "relationship"), ("entity",), ("relationship",)])
+def test_same_records_as_textproto(tmp_path, kinds):
+    text = synth.write_textproto(str(tmp_path / "model.txtproto"), 400)
+    binary = synth.write_wireproto(str(tmp_path / "model.pb"), 400)
+
+    expected = records_of(scan_records, text, kinds=kinds)
+    assert expected
+    assert records_of(scan_wire_records, binary, WireMap(SYNTH_WIRE_MAP), kinds=kinds) == expected
+
+
+def test_spans_cover_whole_fields(tmp_path):
+    binary = synth.write_wireproto(str(tmp_path / "model.pb"), 50)
+    fields = list(synth.iter_wireproto(50))
+    records = list(iter_wire_records(binary, WireMap(SYNTH_WIRE_MAP)))
+    with open(binary, "rb") as f:
+        data = f.read()
+    assert [data[rec.offset:rec.offset + rec.length] for rec in records] == fields
+
+
+def test_binary_input_needs_wire_map():
+    with pytest.raises(SystemExit, match="needs --wire-map"):
+        input_wire_map(argparse.Namespace(binary=False, wire_map=None, input="model.pb"))
+    with pytest.raises(SystemExit, match="needs --wire-map"):
+        input_wire_map(argparse.Namespace(binary=True, wire_map=None, input="model"))
+    assert input_wire_map(argparse.Namespace(binary=False, wire_map=None, input="model.txtproto")) is None
+
+
+def test_wire_map_must_be_complete():
+    spec = dict(SYNTH_WIRE_MAP)
+    del spec["ek_name"]
+    with pytest.raises(ValueError, match="missing ek_name"):
+        WireMap(spec)
+
+
+def test_truncated_field(tmp_path):
+    binary = synth.write_wireproto(str(tmp_path / "model.pb"), 50)
+    with open(binary, "r+b") as f:
+        f.truncate(f.seek(0, 2) - 3)
+    with pytest.raises(ValueError, match="truncated field"):
+        list(iter_wire_records(binary, WireMap(SYNTH_WIRE_MAP)))
+
+
+def test_textproto_is_not_a_binary_model(tmp_path):
+    text = synth.write_textproto(str(tmp_path / "model.txtproto"), 50)
+    with pytest.raises(ValueError, match="not a binary model"):
+        list(iter_wire_records(text, WireMap(SYNTH_WIRE_MAP)))